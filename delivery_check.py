@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+End-to-end check of delivery, retention and alerts against watcher-mockapi
+Проверка на копии пакета во временном каталоге с локальной имитацией Bot API:
+Outbox.drain() с TelegramSink (429 и отказ 413), retention.enforce() не трогает
+файлы журнала и очереди и ждёт, пока идёт объединение, NotificationDispatcher
+повторяет сообщения после 429 и сворачивает повторы
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+# Keep the mock's request log out of the report
+QUIET = True
+
+# Parts of the test series and the file the mock rejects as too large
+PART_BYTES = 10 * 1024
+OVERSIZED_BYTES = 1536 * 1024
+MOCK_MAX_MB = 1
+
+# Retention: VIDEO_DIR quota and the size of each file put there
+QUOTA_MB = 1
+SEGMENT_BYTES = 600 * 1024
+
+
+def start_mock():
+    """Run mockapi on a free port in a thread; returns (server, state)"""
+    from http.server import ThreadingHTTPServer
+    from watcher.mockapi import MockHandler, MockState
+
+    class ScriptedState(MockState):
+        """Answers 429 with the queued retry_after values, one per request, then accepts"""
+
+        def __init__(self, args):
+            super().__init__(args)
+            self.script = []
+
+        def rate_limited(self):
+            with self.lock:
+                return self.script.pop(0) if self.script else None
+
+    class Handler(MockHandler):
+        def log_message(self, fmt, *args):
+            if not QUIET:
+                super().log_message(fmt, *args)
+
+    args = argparse.Namespace(rate_limit=0, retry_after=0, fail_rate=0.0, max_mb=MOCK_MAX_MB,
+                              delay=0.0, save_dir=None)
+    Handler.state = ScriptedState(args)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, Handler.state
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def write_file(path, size, age=0):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    if age:
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+def check_outbox(state, work_dir, logger):
+    from watcher.outbox import Outbox
+    from watcher.sinks import TelegramSink
+
+    part0 = write_file(os.path.join(work_dir, "compressed_part0.mp4"), PART_BYTES)
+    part1 = write_file(os.path.join(work_dir, "compressed_part1.mp4"), PART_BYTES)
+    oversized = write_file(os.path.join(work_dir, "compressed_big.mp4"), OVERSIZED_BYTES)
+
+    box = Outbox(os.path.join(work_dir, "outbox.db"))
+    box.enqueue(1, "", [(part0, "part 1/2"), (part1, "part 2/2")])
+    box.enqueue(2, "", [(oversized, None)])
+    sink = TelegramSink()
+
+    # The first upload (part 0) is rate limited; the oversized file goes out meanwhile
+    state.script = [1]
+    started = time.monotonic()
+    sent = box.drain(lambda item: sink.send(item["path"], item["caption"], item["camera"], logger),
+                     logger, max_wait=10)
+    elapsed = time.monotonic() - started
+    captions = [r["fields"].get("caption") for r in state.received if r["method"] == "sendVideo"]
+    status = (box.job_status(1), box.job_status(2))
+    backlog = box.backlog()
+    box.close()
+
+    return [
+        ("series sent in order after a 429", sent == 2 and captions == ["part 1/2", "part 2/2"]),
+        (f"waited out retry_after ({elapsed:.1f}s)", elapsed >= 0.9),
+        (f"oversized file rejected for good ({status[1]})", status == ("sent", "failed")),
+        (f"outbox empty ({backlog} left)", backlog == 0),
+    ]
+
+
+def check_retention(logger):
+    from watcher.config import VIDEO_DIR
+    from watcher.journal import Journal, run_lock
+    from watcher.outbox import Outbox
+    from watcher import retention
+
+    age = retention.MIN_AGE + 3600
+    owned = write_file(os.path.join(VIDEO_DIR, "20261016_100000.mp4"), SEGMENT_BYTES, age)
+    queued = write_file(os.path.join(VIDEO_DIR, "20261016_100500.mp4"), SEGMENT_BYTES, age)
+    free = [write_file(os.path.join(VIDEO_DIR, f"20261016_10{minute}00.mp4"), SEGMENT_BYTES, age)
+            for minute in ("10", "15")]
+
+    jobs = Journal()
+    job = jobs.create_job("", [owned], [owned], [], "merged.mp4", "compressed.mp4")
+    jobs.close()
+    box = Outbox()
+    box.enqueue(job["id"] + 1, "", [(queued, None)])
+    box.close()
+
+    # A merge run that has not recorded its inputs yet holds the lock
+    with run_lock() as locked:
+        held = retention.enforce(logger)
+    kept_while_locked = all(os.path.exists(path) for path in [owned, queued] + free)
+
+    deleted, freed = retention.enforce(logger)
+    return [
+        ("merge run holds the lock", locked),
+        (f"nothing deleted during a merge run {held}", held == (0, 0) and kept_while_locked),
+        (f"unowned files evicted over quota ({deleted} deleted)",
+         deleted == len(free) and not any(os.path.exists(path) for path in free)),
+        ("journal-owned segment kept", os.path.exists(owned)),
+        ("segment waiting in the outbox kept", os.path.exists(queued)),
+    ]
+
+
+def check_notifications(state):
+    from watcher import alerts, metrics
+
+    def texts():
+        return [r["fields"].get("text") for r in state.received if r["method"] == "sendMessage"]
+
+    dispatcher = alerts.NotificationDispatcher(alerts._send, rate_per_minute=600, burst=5, window=60)
+
+    dispatcher.enqueue("disk low")
+    first = wait_for(lambda: "disk low" in texts())
+
+    # One 429: the message waits out retry_after and is sent on the second attempt
+    state.script = [1]
+    started = time.monotonic()
+    dispatcher.enqueue("camera lost")
+    retried = wait_for(lambda: "camera lost" in texts())
+    elapsed = time.monotonic() - started
+
+    # Rate limited on every attempt: dropped after MAX_ATTEMPTS
+    state.script = [1] * alerts.MAX_ATTEMPTS
+    dispatcher.enqueue("ffmpeg exited")
+    dropped = wait_for(lambda: not state.script and not dispatcher.pending, timeout=alerts.MAX_ATTEMPTS * 3)
+    time.sleep(0.2)
+
+    # Repeats within the window are held and go out once on flush
+    dispatcher.enqueue("disk low")
+    dispatcher.enqueue("disk low")
+    dispatcher.flush()
+
+    metrics.flush()
+    counters = metrics.load()["counters"]
+    return [
+        ("message sent", first),
+        (f"sent again after a 429 ({elapsed:.1f}s)", retried and elapsed >= 0.9),
+        (f"given up after {alerts.MAX_ATTEMPTS} attempts",
+         dropped and "ffmpeg exited" not in texts() and counters.get("notifications_dropped_total") == 1),
+        ("repeats coalesced into ×2", texts()[-1:] == ["disk low ×2"]),
+        (f"failed attempts counted ({counters.get('notifications_failed_total')})",
+         counters.get("notifications_failed_total") == 1 + alerts.MAX_ATTEMPTS),
+        (f"sent messages counted ({counters.get('notifications_sent_total')})",
+         counters.get("notifications_sent_total") == 3),
+    ]
+
+
+def main():
+    logger = logging.getLogger("delivery_check")
+    failed = False
+    with tempfile.TemporaryDirectory(prefix="watcher-delivery-") as work_dir:
+        # Directories derive from the package location: a copy keeps videos/,
+        # merged/ and state/ of this run out of the real ones
+        source = os.path.join(os.path.dirname(os.path.abspath(__file__)), "watcher")
+        shutil.copytree(source, os.path.join(work_dir, "watcher"),
+                        ignore=shutil.ignore_patterns("__pycache__"))
+        sys.path.insert(0, work_dir)
+
+        server, state = start_mock()
+        os.environ.update({
+            "TELEGRAM_BOT_TOKEN": "check",
+            "TELEGRAM_CHAT_ID": "1",
+            "TELEGRAM_API_URL": f"http://127.0.0.1:{server.server_port}",
+            "VIDEO_DIR_MAX_MB": str(QUOTA_MB),
+            "VIDEO_DIR_MAX_AGE_HOURS": "0",
+            "MERGED_DIR_MAX_MB": "0",
+            "MERGED_DIR_MAX_AGE_HOURS": "0",
+            "RETENTION_MIN_FREE_PERCENT": "0",
+        })
+        try:
+            sections = [
+                ("📮 Outbox → TelegramSink", lambda: check_outbox(state, work_dir, logger)),
+                ("🧹 Retention", lambda: check_retention(logger)),
+                ("🔔 Notifications", lambda: check_notifications(state)),
+            ]
+            for title, run in sections:
+                print(title)
+                print("=" * 40)
+                try:
+                    checks = run()
+                except Exception as e:
+                    checks = [(f"{type(e).__name__}: {e}", False)]
+                for name, ok in checks:
+                    print(f"{'✅' if ok else '❌'} {name}")
+                    failed = failed or not ok
+                print()
+        finally:
+            server.shutdown()
+            server.server_close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
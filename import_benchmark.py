@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Import-time regression check for the entry points
+Каждый модуль точки входа импортируется в отдельном процессе с `python -X importtime`;
+скрипт завершается с ошибкой, если импорт дольше бюджета, тянет тяжёлые библиотеки,
+которые нужны только позже, или что-то меняет (обработчики сигналов, файлы)
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+# Cumulative import time budget per entry point module, in milliseconds
+BUDGETS_MS = {
+    "watcher.capture_video": 120,
+    "watcher.supervisor": 120,
+    "watcher.merge_and_send": 150,
+    "watcher.watcherd": 200,
+    "watcher.ringbuffer": 80,
+    "watcher.status": 60,
+}
+
+# Libraries an entry point may only load once it actually needs them
+HEAVY = ("requests", "numpy", "rumps")
+
+# Run in the child after the import: no signal handlers, no log files
+CHECK = """
+import os, signal, sys
+import {module}
+heavy = [name for name in {heavy!r} if name in sys.modules]
+handlers = signal.getsignal(signal.SIGTERM) is not signal.SIG_DFL
+print(",".join(heavy) + "|" + str(handlers))
+"""
+
+
+def import_time_us(module):
+    """Cumulative import time of the module in a fresh interpreter, in microseconds"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True
+    )
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1])
+    raise RuntimeError(f"{module} not found in -X importtime output")
+
+
+def side_effects(module):
+    """(heavy libraries loaded, signal handler installed) by importing the module"""
+    result = subprocess.run(
+        [sys.executable, "-c", CHECK.format(module=module, heavy=HEAVY)],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True
+    )
+    heavy, handlers = result.stdout.strip().rsplit("|", 1)
+    return [name for name in heavy.split(",") if name], handlers == "True"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail when importing an entry point gets slow or has side effects")
+    parser.add_argument("--runs", type=int, default=5, help="imports per module; the fastest one counts")
+    parser.add_argument("--scale", type=float, default=float(os.getenv("IMPORT_BUDGET_SCALE", "1")),
+                        help="multiply every budget, e.g. 2 on a slow machine")
+    args = parser.parse_args()
+
+    logs = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+    logs_before = set(os.listdir(logs)) if os.path.isdir(logs) else set()
+
+    failed = False
+    print("⏱ Import time of the entry points")
+    print("=" * 40)
+    for module, budget_ms in BUDGETS_MS.items():
+        budget_ms *= args.scale
+        try:
+            best_ms = min(import_time_us(module) for _ in range(max(1, args.runs))) / 1000
+            heavy, handlers = side_effects(module)
+        except subprocess.CalledProcessError as e:
+            print(f"{module:<26} ❌ import failed: {e.stderr.strip().splitlines()[-1]}")
+            failed = True
+            continue
+        problems = []
+        if best_ms > budget_ms:
+            problems.append(f"over budget of {budget_ms:.0f} ms")
+        if heavy:
+            problems.append(f"imports {', '.join(heavy)}")
+        if handlers:
+            problems.append("installs signal handlers")
+        mark = "❌ " + "; ".join(problems) if problems else "✅"
+        print(f"{module:<26} {best_ms:7.1f} ms  {mark}")
+        failed = failed or bool(problems)
+
+    logs_after = set(os.listdir(logs)) if os.path.isdir(logs) else set()
+    if logs_after - logs_before:
+        print(f"❌ Importing created log files: {', '.join(sorted(logs_after - logs_before))}")
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,6 +7,14 @@ source "$(dirname "$0")/locale.sh"
 PROJECT_DIR="$(cd "$(dirname "$0")"; pwd)"
 LAUNCHD_DIR="$HOME/Library/LaunchAgents"
 
+# --daemon installs the single watcherd agent instead of the per-run capture and merge agents
+PLIST_DIR="$PROJECT_DIR/launchd"
+OTHER_DIR="$PROJECT_DIR/launchd/daemon"
+if [ "$1" = "--daemon" ]; then
+    PLIST_DIR="$PROJECT_DIR/launchd/daemon"
+    OTHER_DIR="$PROJECT_DIR/launchd"
+fi
+
 echo "$(get_message "configuring_agents")"
 
 # Make sure package is installed
@@ -18,8 +26,17 @@ fi
 # Create log directories if they don't exist
 mkdir -p "$PROJECT_DIR/logs"
 
+# Both setups record from the same cameras, remove the other one first
+for plist in "$OTHER_DIR/"*.plist; do
+    TARGET="$LAUNCHD_DIR/$(basename "$plist")"
+    if [ -f "$TARGET" ]; then
+        launchctl unload "$TARGET" 2>/dev/null
+        rm "$TARGET"
+    fi
+done
+
 # Install launchd agents
-for plist in "$PROJECT_DIR/launchd/"*.plist; do
+for plist in "$PLIST_DIR/"*.plist; do
     if [ -f "$plist" ]; then
         TARGET="$LAUNCHD_DIR/$(basename "$plist")"
         echo "$(get_message "installing_agent") $(basename "$plist")..."
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Regression check for the upload outbox
+Очередь отправки на временной базе: второй файл серии ждёт первый, отложенный
+по retry_after, и drain() не крутится вхолостую, пока первый не готов к повтору
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+from watcher.outbox import Outbox, SendError
+
+# retry_after of the first attempt; drain() has to wait this out, not spin through it
+RETRY_AFTER = 2
+# Loop iterations a correct drain needs for the two parts, with a wide margin
+MAX_CALLS = 20
+
+
+def main():
+    logger = logging.getLogger("outbox_check")
+    failed = False
+    with tempfile.TemporaryDirectory(prefix="watcher-outbox-") as work_dir:
+        outbox = Outbox(os.path.join(work_dir, "journal.db"))
+        outbox.enqueue(1, "", [("part0.mp4", None), ("part1.mp4", None)])
+
+        attempts = []
+
+        def send(item):
+            attempts.append(item["part_index"])
+            if len(attempts) == 1:
+                raise SendError("429 Too Many Requests", retry_after=RETRY_AFTER)
+
+        calls = 0
+        due = outbox.due
+
+        def counting_due(*args, **kwargs):
+            nonlocal calls
+            calls += 1
+            return due(*args, **kwargs)
+
+        outbox.due = counting_due
+        started = time.monotonic()
+        sent = outbox.drain(send, logger, max_wait=RETRY_AFTER * 5)
+        elapsed = time.monotonic() - started
+
+        # With part 0 pending, part 1 (next_attempt 0) must not make the wait zero
+        outbox.enqueue(2, "", [("a.mp4", None), ("b.mp4", None)])
+        outbox._update(outbox.items(2)[0]["id"], next_attempt=time.time() + 30)
+        delay = outbox.next_retry()
+        outbox.close()
+
+    checks = [
+        ("both parts sent in order", sent == 2 and attempts == [0, 0, 1]),
+        (f"waited out retry_after ({elapsed:.1f}s)", elapsed >= RETRY_AFTER * 0.9),
+        (f"no busy loop ({calls} due() calls)", calls <= MAX_CALLS),
+        (f"next_retry ignores blocked parts ({delay and round(delay)}s)", delay is not None and delay > 25),
+    ]
+    print("📮 Outbox")
+    print("=" * 40)
+    for name, ok in checks:
+        print(f"{'✅' if ok else '❌'} {name}")
+        failed = failed or not ok
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
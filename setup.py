@@ -8,7 +8,8 @@ setup(
     install_requires=[
         "requests",
         "rumps", 
-        "python-dotenv"
+        "python-dotenv",
+        "numpy"
     ],
     entry_points={
         "console_scripts": [
@@ -17,7 +18,14 @@ setup(
             "watcher-merge=watcher.merge_and_send:main",
             "watcher-status=watcher.status:main",
             "watcher-devices=watcher.capture_video:list_devices",
-            "watcher-camera-test=watcher.camera_test:main"
+            "watcher-camera-test=watcher.camera_test:main",
+            "watcher-tune=watcher.tune:main",
+            "watcher-motion=watcher.motion:main",
+            "watcher-trigger=watcher.ringbuffer:main",
+            "watcher-mockapi=watcher.mockapi:main",
+            "watcher-digest=watcher.digest:main",
+            "watcher-clip=watcher.clip:main",
+            "watcherd=watcher.watcherd:main"
         ]
     },
     python_requires=">=3.7",
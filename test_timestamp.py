@@ -6,9 +6,10 @@ sys.path.insert(0, '/Users/alexdev/projects/personal/watcher')
 # Set test duration
 os.environ['DURATION'] = '5'
 
-from watcher.capture_video import capture
+from watcher.capture_video import init, capture
 print('🎬 Starting 5-second test recording with timestamp overlay...')
 try:
+    init()
     capture()
     print('✅ Test recording completed')
 except Exception as e:
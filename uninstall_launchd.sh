@@ -9,7 +9,7 @@ LAUNCHD_DIR="$HOME/Library/LaunchAgents"
 
 echo "$(get_message "removing_agents")"
 
-for plist in "$PROJECT_DIR/launchd/"*.plist; do
+for plist in "$PROJECT_DIR/launchd/"*.plist "$PROJECT_DIR/launchd/daemon/"*.plist; do
     if [ -f "$plist" ]; then
         TARGET="$LAUNCHD_DIR/$(basename "$plist")"
         if [ -f "$TARGET" ]; then
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Background notification dispatcher
+Фоновая отправка уведомлений: постановка в очередь не блокирует запись и
+объединение, частота ограничена (token bucket), одинаковые сообщения в пределах
+окна сворачиваются в одно «×N», при завершении очередь дописывается
+"""
+
+import atexit
+import threading
+import time
+from collections import OrderedDict
+from .config import NOTIFY_RATE_PER_MINUTE, NOTIFY_BURST, NOTIFY_COALESCE_WINDOW
+from . import metrics
+
+# Distinct messages kept waiting at most; newer ones are dropped beyond that
+MAX_PENDING = 100
+
+# How long exit waits for the queue to be sent, in seconds
+FLUSH_TIMEOUT = 10
+
+# A message that could not be sent is tried this many times in all, this many
+# seconds apart unless a 429 answer says how long to wait
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 5
+
+
+class TokenBucket:
+    """rate tokens per second, up to burst of them saved up"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now=None):
+        """Seconds until a token is available"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now=None):
+        self._refill(time.monotonic() if now is None else now)
+        self.tokens -= 1
+
+    def pause(self, seconds):
+        """Hold sending back, e.g. for retry_after of a 429 answer"""
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+class NotificationDispatcher:
+    """
+    Sends messages from a worker thread. A message repeated while the same
+    text is still queued, or within the coalescing window after it was sent,
+    is counted instead of sent again and goes out once as "text ×N".
+    """
+
+    def __init__(self, send, rate_per_minute=NOTIFY_RATE_PER_MINUTE, burst=NOTIFY_BURST,
+                 window=NOTIFY_COALESCE_WINDOW):
+        self.send = send
+        self.window = window
+        self.bucket = TokenBucket(rate_per_minute / 60.0, burst)
+        self.cond = threading.Condition()
+        self.pending = OrderedDict()  # text -> [count, ready_at, attempts]
+        self.last_sent = {}
+        self.thread = None
+        self.stopping = False
+
+    def enqueue(self, text):
+        """Queue a message without waiting for the network"""
+        with self.cond:
+            now = time.monotonic()
+            if text in self.pending:
+                self.pending[text][0] += 1
+                metrics.increment("notifications_coalesced_total")
+                return
+            if len(self.pending) >= MAX_PENDING:
+                metrics.increment("notifications_dropped_total")
+                return
+            sent = self.last_sent.get(text)
+            ready_at = now if sent is None or now - sent >= self.window else sent + self.window
+            self.pending[text] = [1, ready_at, 0]
+            if self.thread is None or not self.thread.is_alive():
+                self.stopping = False
+                self.thread = threading.Thread(target=self._run, name="notifications", daemon=True)
+                self.thread.start()
+            self.cond.notify()
+
+    def _next(self):
+        """Wait for a message that may be sent now; None once stopped and empty"""
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                if not self.pending:
+                    if self.stopping:
+                        return None
+                    self.cond.wait()
+                    continue
+                # Held duplicates are released early on shutdown
+                ready = [t for t, (_, ready_at, _) in self.pending.items() if self.stopping or ready_at <= now]
+                if not ready:
+                    self.cond.wait(min(ready_at for _, ready_at, _ in self.pending.values()) - now)
+                    continue
+                wait = self.bucket.wait_time(now)
+                if wait > 0:
+                    self.cond.wait(wait)
+                    continue
+                self.bucket.take(now)
+                text = ready[0]
+                count, _, attempts = self.pending.pop(text)
+                # Forget texts whose window is over so the map does not grow
+                for old in [t for t, sent in self.last_sent.items() if now - sent >= self.window]:
+                    del self.last_sent[old]
+                self.last_sent[text] = now
+                return text, count, attempts
+
+    def _retry(self, text, count, attempts, delay):
+        """Put a message that was not sent back in the queue, or drop it after MAX_ATTEMPTS"""
+        with self.cond:
+            if attempts >= MAX_ATTEMPTS:
+                metrics.increment("notifications_dropped_total")
+                return
+            entry = self.pending.pop(text, None)
+            # Repeats queued meanwhile are folded into the retried message
+            count += entry[0] if entry else 0
+            self.pending[text] = [count, time.monotonic() + delay, attempts]
+            self.pending.move_to_end(text, last=False)
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            text, count, attempts = item
+            attempts += 1
+            try:
+                result = self.send(text if count == 1 else f"{text} ×{count}")
+            except Exception:
+                # Alerts must never take the process down
+                metrics.increment("notifications_failed_total")
+                self._retry(text, count, attempts, RETRY_DELAY)
+                continue
+            if result is True:
+                metrics.increment("notifications_sent_total")
+            elif result:
+                # 429: the answer tells how long every message has to wait
+                metrics.increment("notifications_failed_total")
+                with self.cond:
+                    self.bucket.pause(result)
+                self._retry(text, count, attempts, result)
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        """Send everything still queued, held duplicates included, and stop the worker"""
+        with self.cond:
+            thread = self.thread
+            if thread is None:
+                return
+            self.stopping = True
+            self.cond.notify()
+        thread.join(timeout)
+
+
+def _send(message):
+    """
+    Post a message with the shared client: True once sent, False if Telegram is
+    not configured, retry_after of a 429 answer; raises on other failures
+    """
+    from .telegram import get_client
+    client = get_client()
+    if not client.configured():
+        return False
+    response = client.send_message(message)
+    if response.status_code == 429:
+        try:
+            retry_after = response.json().get("parameters", {}).get("retry_after")
+        except ValueError:
+            retry_after = None
+        return retry_after or RETRY_DELAY
+    if not response.ok:
+        raise RuntimeError(f"Telegram answered {response.status_code}: {response.text[:200]}")
+    return True
+
+
+_dispatcher = NotificationDispatcher(_send)
+atexit.register(_dispatcher.flush)
+
+
+def notify(message):
+    """Queue a Telegram notification; returns immediately"""
+    _dispatcher.enqueue(message)
+
+
+def flush(timeout=FLUSH_TIMEOUT):
+    """Deliver queued notifications before the process exits"""
+    _dispatcher.flush(timeout)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Upload size budget
+Ограничение размера отправляемых файлов: битрейт выбирается по длительности и
+бюджету, а слишком большой файл делится по ключевым кадрам на части
+"""
+
+import glob
+import math
+import os
+import subprocess
+from .config import UPLOAD_MAX_MB
+from . import mediainfo
+
+BUDGET_BYTES = UPLOAD_MAX_MB * 1024 * 1024
+
+# Container overhead and encoder overshoot of a capped CRF encode
+SAFETY = 0.9
+# Audio bitrate used by the compress stage
+AUDIO_KBPS = 128
+# Below this video bitrate the window is split instead of starved
+MIN_VIDEO_KBPS = 400
+# Attempts to find cut points that keep every part within the budget
+SPLIT_ATTEMPTS = 4
+
+
+def plan(duration, budget_bytes=BUDGET_BYTES):
+    """
+    Return (parts, video kbps cap) for an encode of the given duration so that
+    each of the parts fits the budget; the cap is None if the duration is unknown
+    """
+    if not duration or duration <= 0:
+        return 1, None
+    budget_kbits = budget_bytes * 8 / 1000 * SAFETY
+    parts = max(1, math.ceil(duration * (MIN_VIDEO_KBPS + AUDIO_KBPS) / budget_kbits))
+    return parts, int(budget_kbits / (duration / parts) - AUDIO_KBPS)
+
+
+def part_path(path, index, count):
+    """compressed_X.mp4 -> compressed_X_2of3.mp4"""
+    base, ext = os.path.splitext(path)
+    return f"{base}_{index}of{count}{ext}"
+
+
+def _cut_times(keyframes, duration, count):
+    """Keyframe times closest below equal-duration cut points"""
+    times = []
+    for i in range(1, count):
+        target = duration * i / count
+        candidates = [t for t in keyframes if 0 < t <= target and (not times or t > times[-1])]
+        if candidates:
+            times.append(candidates[-1])
+    return times
+
+
+def split_for_upload(path, logger, budget_bytes=BUDGET_BYTES):
+    """
+    Split a file that exceeds the budget into parts cut at keyframes by stream
+    copy. Returns the ordered list of files to upload (just [path] if it fits).
+    """
+    size = os.path.getsize(path)
+    if size <= budget_bytes:
+        return [path]
+
+    info = mediainfo.get(path)
+    duration = info.get("duration") or 0
+    keyframes = info.get("keyframes") or []
+    if not duration or len(keyframes) < 2:
+        logger.warning(f"⚠️ Cannot split {os.path.basename(path)}: no keyframe information")
+        return [path]
+
+    directory, name = os.path.split(path)
+    base = os.path.splitext(name)[0]
+    tmp_pattern = os.path.join(directory, f".{base}_part%03d.mp4")
+    count = math.ceil(size / (budget_bytes * SAFETY))
+    parts = []
+    for _ in range(SPLIT_ATTEMPTS):
+        times = _cut_times(keyframes, duration, count)
+        for leftover in glob.glob(os.path.join(glob.escape(directory), f".{glob.escape(base)}_part*.mp4")):
+            os.remove(leftover)
+        cmd = [
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-i", path,
+            "-map", "0", "-c", "copy",
+            "-f", "segment",
+            "-segment_times", ",".join(f"{t:.3f}" for t in times),
+            "-segment_format", "mp4",
+            "-segment_format_options", "movflags=+faststart",
+            "-reset_timestamps", "1",
+            "-y", tmp_pattern,
+        ]
+        subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, check=True)
+        parts = sorted(glob.glob(os.path.join(glob.escape(directory), f".{glob.escape(base)}_part*.mp4")))
+        largest = max(os.path.getsize(p) for p in parts)
+        if largest <= budget_bytes or len(times) < count - 1:
+            break
+        # Bitrate is uneven over the window: cut into more, shorter parts
+        count = max(count + 1, math.ceil(count * largest / (budget_bytes * SAFETY)))
+
+    largest = max(os.path.getsize(p) for p in parts)
+    if largest > budget_bytes:
+        logger.warning(f"⚠️ A part of {name} is still {largest / 1048576:.1f} MB (keyframes too sparse)")
+
+    final = []
+    for index, tmp_path in enumerate(parts, 1):
+        target = part_path(path, index, len(parts))
+        os.replace(tmp_path, target)
+        final.append(target)
+    logger.info(f"✂️ Split {name} ({size / 1048576:.1f} MB) into {len(final)} parts")
+    return final
@@ -9,43 +9,29 @@ import sys
 import os
 from watcher.config import CAMERA_DEVICE
 from watcher.locale import _
+from watcher.sources import get_source
 
 def test_camera_permissions():
     """Test if camera permissions are granted"""
     print("🔍 " + _("testing_camera_permissions"))
     
     try:
-        # Test basic ffmpeg camera access
-        cmd = [
-            'ffmpeg', 
-            '-f', 'avfoundation',
-            '-list_devices', 'true', 
-            '-i', ''
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=15)
+        source = get_source()
+        devices = source.list_devices()
         
-        # Check output for video devices
-        if 'AVFoundation video devices:' in result.stderr:
-            print("✅ " + _("camera_permissions_ok"))
-            
-            # Parse and show available devices
-            lines = result.stderr.split('\n')
-            device_lines = [line for line in lines if '] [' in line and 'video devices' not in line]
-            
-            if device_lines:
-                print("\n📹 " + _("available_cameras") + ":")
-                for line in device_lines:
-                    if 'video devices' not in line and '] [' in line:
-                        print(f"  {line.strip()}")
-                return True
-            else:
-                print("⚠️ " + _("no_cameras_found"))
-                return False
+        print("✅ " + _("camera_permissions_ok"))
+        if devices:
+            print("\n📹 " + _("available_cameras") + f" ({source.name}):")
+            for idx, name in devices:
+                print(f"  [{idx}] {name}")
+            return True
         else:
-            print("❌ " + _("camera_permissions_denied"))
+            print("⚠️ " + _("no_cameras_found"))
             return False
             
+    except PermissionError:
+        print("❌ " + _("camera_permissions_denied"))
+        return False
     except subprocess.TimeoutExpired:
         print("⏰ " + _("camera_test_timeout"))
         return False
@@ -68,11 +54,7 @@ def test_specific_camera():
     
     try:
         # Try to get just device information first
-        info_cmd = [
-            'ffmpeg',
-            '-hide_banner',
-            '-f', 'avfoundation',
-            '-i', str(actual_device),
+        info_cmd = ['ffmpeg', '-hide_banner'] + get_source().input_args(actual_device) + [
             '-frames:v', '1',
             '-f', 'null',
             '-'
@@ -138,6 +120,7 @@ def show_current_settings():
     print("\n⚙️ " + _("current_settings"))
     print("=" * 40)
     print(f"📹 Camera Device: {CAMERA_DEVICE}")
+    print(f"🔌 Capture Source: {get_source().name}")
     print(f"🎬 FPS: {FPS}")
     print(f"📐 Resolution: {RESOLUTION}")
     print(f"⏱ Duration: {DURATION} seconds")
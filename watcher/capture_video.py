@@ -3,27 +3,48 @@
 
 import subprocess
 import datetime
+import argparse
+import logging
 import os
 import signal
 import sys
-from .config import VIDEO_DIR, LOG_DIR, CAMERA_DEVICE, DURATION, RESOLUTION, FPS, SHOW_TIMESTAMP, TIMESTAMP_POSITION, TIMESTAMP_FONT_SIZE
+from .config import (
+    VIDEO_DIR, LOG_DIR, CAMERA_DEVICE, DURATION, RESOLUTION, SHOW_TIMESTAMP, TIMESTAMP_POSITION, TIMESTAMP_FONT_SIZE,
+    TIMESTAMP_MODE, CAPTURE_PROFILE,
+    SEGMENT_DURATION, SEGMENT_KEYFRAME_INTERVAL, CAMERAS,
+)
 from .logger import setup_logger
 from .locale import _
+from .sources import get_source
+from .encoder import encoder_args
+from .progress import ProgressMonitor, watch_process
+from .segments import write_sidecar, recording_path, publish, remove_stale_recordings
+from .timestamps import creation_time
+from . import catalog, devices, metrics, retention
 
-logger = setup_logger("capture", os.path.join(LOG_DIR, "capture.log"))
+# Handlers are attached by init()
+logger = logging.getLogger("capture")
 
-# Подготовка директорий
-os.makedirs(LOG_DIR, exist_ok=True)
-os.makedirs(VIDEO_DIR, exist_ok=True)
+# List of closed segments written by the segment muxer in daemon mode
+SEGMENT_LIST = ".segments.csv"
+
+# Capture backend selected by CAPTURE_SOURCE, created on first use
+_capture_source = None
 
 # Global variable to track current ffmpeg process
 current_process = None
 
+# Supervisor of the per-camera ffmpeg processes in daemon mode
+active_supervisor = None
+
 def signal_handler(signum, frame):
     """Handle termination signals to ensure clean video file closure"""
     global current_process
     logger.info(f"📡 Received signal {signum}, attempting graceful shutdown...")
     
+    if active_supervisor:
+        active_supervisor.stop()
+    
     if current_process and current_process.poll() is None:
         logger.info("🛑 Stopping ffmpeg process gracefully...")
         try:
@@ -40,16 +61,30 @@ def signal_handler(signum, frame):
     
     sys.exit(0)
 
-# Register signal handlers
-signal.signal(signal.SIGTERM, signal_handler)
-signal.signal(signal.SIGINT, signal_handler)
+def init():
+    """
+    Set up logging, directories and signal handlers. Called by the entry points
+    rather than at import, so importing this module has no side effects.
+    """
+    setup_logger("capture", os.path.join(LOG_DIR, "capture.log"))
+    # Подготовка директорий
+    os.makedirs(VIDEO_DIR, exist_ok=True)
+    # Register signal handlers
+    signal.signal(signal.SIGTERM, signal_handler)
+    signal.signal(signal.SIGINT, signal_handler)
+
+def get_capture_source():
+    global _capture_source
+    if _capture_source is None:
+        _capture_source = get_source()
+    return _capture_source
 
 def get_timestamp_filter():
     """
     Create ffmpeg filter for timestamp overlay with real-time updates
     Создает фильтр ffmpeg для наложения времени с обновлением в реальном времени
     """
-    if not SHOW_TIMESTAMP:
+    if not SHOW_TIMESTAMP or TIMESTAMP_MODE != "burn":
         return []
     
     # Parse resolution to get width and height
@@ -87,95 +122,34 @@ def get_preferred_camera():
     """
     Smart camera selection: prefer external cameras over built-in
     Умный выбор камеры: предпочитаем внешние камеры встроенным
+
+    Devices are enumerated once and cached in the device registry, so this
+    does not spawn ffmpeg on every capture.
     """
-    try:
-        cmd = ["ffmpeg", "-f", "avfoundation", "-list_devices", "true", "-i", ""]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-        
-        devices = []
-        in_video_section = False
-        
-        for line in result.stderr.split('\n'):
-            # Check for video devices section
-            if 'AVFoundation video devices:' in line:
-                in_video_section = True
-                continue
-            elif 'AVFoundation audio devices:' in line:
-                in_video_section = False
-                continue
-            
-            # Only process video devices
-            if in_video_section and '] [' in line:
-                # Format: [AVFoundation indev @ 0x...] [0] Device Name
-                parts = line.split('] [')
-                if len(parts) >= 2:
-                    device_index = parts[1].split(']')[0]  # Get the device number
-                    device_name = parts[1].split('] ')[1] if '] ' in parts[1] else parts[1].split(']')[1]
-                    devices.append((device_index, device_name))
-        
-        logger.info(f"📋 Found {len(devices)} video devices")
-        for idx, name in devices:
-            logger.info(f"  [{idx}] {name}")
-        
-        # Define built-in camera patterns to exclude
-        builtin_patterns = [
-            'MacBook Pro', 'MacBook Air', 'iMac', 'Mac mini', 
-            'built-in', 'Built-in', 'Internal', 'internal',
-            'Desk View', 'FaceTime', 'Capture screen'
-        ]
-        
-        # Prioritize external cameras (not matching built-in patterns)
-        external_cameras = []
-        builtin_cameras = []
-        
-        for device_idx, device_name in devices:
-            is_builtin = any(pattern in device_name for pattern in builtin_patterns)
-            if is_builtin:
-                builtin_cameras.append((device_idx, device_name))
-            else:
-                external_cameras.append((device_idx, device_name))
-        
-        if external_cameras:
-            selected = external_cameras[0]
-            logger.info(f"🎯 Selected external camera: [{selected[0]}] {selected[1]}")
-            return selected[0]
-        elif builtin_cameras:
-            selected = builtin_cameras[0]
-            logger.info(f"📱 Selected built-in camera: [{selected[0]}] {selected[1]}")
-            return selected[0]
-        elif devices:
-            selected = devices[0]
-            logger.info(f"❓ Selected first available camera: [{selected[0]}] {selected[1]}")
-            return selected[0]
-        else:
-            logger.warning("⚠️ No cameras found, using fallback device")
-            return "0"  # Default fallback
-            
-    except Exception as e:
-        logger.warning(f"⚠️ Camera detection failed: {e}, using fallback device")
-        return "0"  # Default fallback
+    return devices.get_preferred_device(get_capture_source())
+
+def resolve_camera_device():
+    """Return the configured camera device, running smart selection in "auto" mode"""
+    if CAMERA_DEVICE.lower() == "auto":
+        return get_preferred_camera()
+    return CAMERA_DEVICE
 
 def capture():
     global current_process
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     output_path = os.path.join(VIDEO_DIR, f"video_{timestamp}.mp4")
+    # Written under a hidden name and renamed when closed, merge never sees a growing file
+    partial_path = recording_path(output_path)
+    for name in remove_stale_recordings(VIDEO_DIR):
+        logger.warning(f"🧹 Removed unfinished recording of a killed ffmpeg: {name}")
 
     # Use smart camera selection if CAMERA_DEVICE is "auto"
-    if CAMERA_DEVICE.lower() == "auto":
-        camera_device = get_preferred_camera()
-    else:
-        camera_device = CAMERA_DEVICE
+    camera_device = resolve_camera_device()
 
-    # Base ffmpeg command
-    cmd = [
-        "ffmpeg",
-        "-f", "avfoundation",
-        "-framerate", str(FPS),
-        "-video_size", RESOLUTION,
-        "-i", camera_device,
+    # Base ffmpeg command; -progress streams machine-readable stats to stdout
+    cmd = ["ffmpeg", "-nostats", "-progress", "pipe:1"] + get_capture_source().input_args(camera_device) + [
         "-t", str(DURATION),
-        "-vcodec", "libx264",
-        "-preset", "ultrafast",
+    ] + encoder_args("capture") + [
         "-movflags", "+faststart",  # Improve file compatibility
         "-avoid_negative_ts", "make_zero",  # Handle timestamp issues
     ]
@@ -185,9 +159,12 @@ def capture():
     if timestamp_filter:
         cmd.extend(timestamp_filter)
         logger.info(f"📅 Adding timestamp overlay: {TIMESTAMP_POSITION}, size {TIMESTAMP_FONT_SIZE}px")
+    elif SHOW_TIMESTAMP:
+        # Frames stay untouched; the recording time travels as metadata
+        cmd.extend(["-metadata", f"creation_time={creation_time()}"])
     
-    # Add output file and overwrite flag
-    cmd.extend(["-y", output_path])
+    # Add output file and overwrite flag; the temporary name has no .mp4 extension
+    cmd.extend(["-f", "mp4", "-y", partial_path])
 
     try:
         logger.info(f"🎬 Starting video capture: {output_path}")
@@ -195,32 +172,47 @@ def capture():
         
         current_process = subprocess.Popen(
             cmd, 
+            stdin=subprocess.DEVNULL,
             stdout=subprocess.PIPE, 
-            stderr=subprocess.STDOUT, 
+            stderr=subprocess.PIPE, 
             text=True
         )
         
-        # Wait for process to complete
-        stdout, _ = current_process.communicate()
+        # Follow progress until the process completes
+        monitor = ProgressMonitor("capture", logger)
+        stderr_tail = watch_process(current_process, monitor)
+        stats = monitor.stats
         
         if current_process.returncode == 0:
             logger.info(f"✅ Video capture completed: {output_path}")
+            logger.info(
+                f"📈 {stats['frame']} frames, {stats['fps']:.1f} fps, {stats['drop_frames']} dropped, "
+                f"{stats['dup_frames']} duplicated, {stats['bitrate_kbps']:.0f} kbps, speed {stats['speed']:.2f}x"
+            )
             
-            # Verify the created file is valid
-            if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-                # Quick integrity check
-                check_cmd = ["ffprobe", "-v", "quiet", "-show_format", output_path]
-                check_result = subprocess.run(check_cmd, capture_output=True)
-                if check_result.returncode == 0:
-                    logger.info(f"✅ Video file verified: {output_path}")
-                else:
-                    logger.warning(f"⚠️ Video file may be corrupted: {output_path}")
+            # Validity comes from the live stats, no second ffprobe pass is needed
+            valid = (
+                monitor.finished()
+                and stats["frame"] > 0
+                and os.path.exists(partial_path)
+                and os.path.getsize(partial_path) > 0
+            )
+            # out_time is the recorded length; the catalog takes it as the duration
+            sidecar = dict(stats, duration=stats["out_time"], profile=CAPTURE_PROFILE)
+            if valid:
+                write_sidecar(output_path, "capture", dict(sidecar, valid=True))
+                logger.info(f"✅ Video file verified: {output_path}")
+            elif os.path.exists(partial_path):
+                write_sidecar(output_path, "capture", dict(sidecar, valid=False))
+                logger.warning(f"⚠️ Video file may be corrupted: {output_path}")
             else:
                 logger.error(f"❌ Video file not created or empty: {output_path}")
         else:
             logger.error(f"❌ ffmpeg failed with return code {current_process.returncode}")
-            if stdout:
-                logger.error(f"ffmpeg output: {stdout}")
+            if stderr_tail:
+                logger.error("ffmpeg output: " + "\n".join(stderr_tail))
+            # The camera may have been unplugged or renumbered, enumerate again next time
+            devices.invalidate()
                 
     except KeyboardInterrupt:
         logger.info("🛑 Capture interrupted by user")
@@ -230,25 +222,109 @@ def capture():
         logger.exception(f"❌ Video capture failed: {str(e)}")
     finally:
         current_process = None
+        # ffmpeg has exited and closed the file, whatever it recorded is published
+        if os.path.exists(partial_path):
+            if os.path.getsize(partial_path) > 0:
+                catalog.record_segment(publish(partial_path), "")
+            else:
+                os.remove(partial_path)
 
-def list_devices():
-    """Показать список доступных камер"""
+    # Keep the disk from filling up even when nothing gets sent
+    try:
+        retention.enforce(logger)
+    except Exception as e:
+        logger.warning(f"⚠️ Retention check failed: {e}")
+    metrics.flush()
+
+def build_segment_command(camera_device, output_dir=VIDEO_DIR, threads=0):
+    """
+    Build a long-running ffmpeg command that cuts wall-clock aligned segments
+    Собирает команду ffmpeg для непрерывной записи сегментами, выровненными по часам
+    """
     cmd = [
         "ffmpeg",
-        "-f", "avfoundation", 
-        "-list_devices", "true",
-        "-i", ""
+        "-hide_banner",
+        "-loglevel", "error",
+        "-nostats",
+        "-progress", "pipe:1",
+    ] + get_capture_source().input_args(camera_device) + encoder_args("capture", threads) + [
+        # The segment muxer can only cut on keyframes, so force them often enough
+        # for every cut to land close to the wall-clock boundary
+        "-force_key_frames", f"expr:gte(t,n_forced*{SEGMENT_KEYFRAME_INTERVAL})",
     ]
-    
+
+    timestamp_filter = get_timestamp_filter()
+    cmd.extend(timestamp_filter)
+    if SHOW_TIMESTAMP and not timestamp_filter:
+        # "now" is parsed when each segment's mp4 header is written, so every
+        # segment carries its own wall-clock start rather than the daemon's
+        cmd.extend(["-metadata", "creation_time=now"])
+
+    cmd.extend([
+        "-f", "segment",
+        "-segment_time", str(SEGMENT_DURATION),
+        "-segment_atclocktime", "1",
+        "-segment_format", "mp4",
+        "-segment_format_options", "movflags=+faststart",
+        "-reset_timestamps", "1",
+        "-strftime", "1",
+        # Every closed segment is appended to this list, which tells the
+        # supervisor when a file is complete
+        "-segment_list", os.path.join(output_dir, SEGMENT_LIST),
+        "-segment_list_type", "csv",
+        "-y",
+        # Recorded under a hidden name; the supervisor renames each closed segment
+        recording_path(os.path.join(output_dir, "video_%Y%m%d_%H%M%S.mp4")),
+    ])
+    return cmd
+
+def run_daemon():
+    """
+    Record continuously from every configured camera until a termination signal arrives
+    Непрерывная запись со всех настроенных камер до получения сигнала завершения
+    """
+    global active_supervisor
+    from .supervisor import CaptureSupervisor, single_camera
+
+    cameras = CAMERAS or [single_camera()]
+    logger.info(f"🎥 Starting continuous capture: {len(cameras)} camera(s), {SEGMENT_DURATION}s segments")
+    if SHOW_TIMESTAMP and TIMESTAMP_MODE == "burn":
+        logger.info(f"📅 Adding timestamp overlay: {TIMESTAMP_POSITION}, size {TIMESTAMP_FONT_SIZE}px")
+    elif SHOW_TIMESTAMP:
+        logger.info("📅 Timestamps recorded as metadata, frames are not re-rendered")
+
+    active_supervisor = CaptureSupervisor(cameras)
+    active_supervisor.start()
+    active_supervisor.wait()
+    logger.info("🏁 Continuous capture stopped")
+
+def list_devices():
+    """Показать список доступных камер"""
+    init()
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        print("📹 " + _("camera_list"))
-        print(result.stderr)  # ffmpeg выводит список устройств в stderr
+        source = get_capture_source()
+        entry = devices.refresh(source)
+        print("📹 " + _("camera_list") + f" ({source.name})")
+        for idx, name in entry["devices"]:
+            marker = " ⭐" if idx == entry["selected"] else ""
+            print(f"  [{idx}] {name}{marker}")
     except Exception as e:
         print(_("camera_not_found", str(e)))
 
 def main():
-    capture()
+    parser = argparse.ArgumentParser(description="Watcher video capture")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="record continuously into wall-clock aligned segments instead of a single clip"
+    )
+    args = parser.parse_args()
+    init()
+
+    if args.daemon:
+        run_daemon()
+    else:
+        capture()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
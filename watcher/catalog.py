@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Catalog of recorded segments and produced files
+Каталог записей (SQLite): каждый сегмент и каждый готовый файл с камерой,
+временем начала и конца, размером, валидностью и статусом отправки; записи
+остаются после удаления файлов, запросы по времени идут по индексу
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from .config import STATE_DIR, CATALOG_KEEP_DAYS
+from .segments import read_sidecar, segment_start
+
+CATALOG_FILE = os.path.join(STATE_DIR, "catalog.db")
+
+# Kinds of files: segments are recorded, the others produced by a merge run
+KINDS = ("segment", "merged", "compressed", "digest", "full", "clip")
+
+# Status of a file; deleted files keep theirs and get a deleted time
+STATUSES = ("recorded", "merged", "queued", "sent", "failed")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    camera TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    start REAL,
+    end REAL,
+    duration REAL,
+    bytes INTEGER,
+    valid INTEGER,
+    status TEXT NOT NULL DEFAULT 'recorded',
+    job_id INTEGER,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    sent REAL,
+    deleted REAL
+);
+CREATE INDEX IF NOT EXISTS files_time ON files(kind, start);
+CREATE INDEX IF NOT EXISTS files_camera_time ON files(camera, kind, start);
+CREATE INDEX IF NOT EXISTS files_sent ON files(kind, sent);
+CREATE INDEX IF NOT EXISTS files_status ON files(status, kind);
+CREATE INDEX IF NOT EXISTS files_deleted ON files(deleted);
+"""
+
+# Columns added after the first release: name -> definition
+MIGRATIONS = {}
+
+
+class Catalog:
+    """files table in state/catalog.db; every method is one short transaction"""
+
+    def __init__(self, path=CATALOG_FILE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Shared by the recorder threads of a process, writes are serialised by the lock
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        columns = {row["name"] for row in self.db.execute("PRAGMA table_info(files)")}
+        with self.db:
+            for name, definition in MIGRATIONS.items():
+                if name not in columns:
+                    self.db.execute(f"ALTER TABLE files ADD COLUMN {name} {definition}")
+
+    def close(self):
+        self.db.close()
+
+    def record(self, path, camera, kind, start=None, duration=None, size=None, valid=None,
+               status=None, job_id=None):
+        """
+        Add a file or update what is known about it; None values keep the stored
+        ones (a new file starts as "recorded")
+        """
+        now = time.time()
+        values = {
+            "path": path, "camera": camera, "kind": kind, "start": start,
+            "end": start + duration if start is not None and duration else None,
+            "duration": duration, "bytes": size, "valid": None if valid is None else int(valid),
+            "status": status, "job_id": job_id, "now": now,
+        }
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT INTO files (path, camera, kind, start, end, duration, bytes, valid, status, job_id, "
+                "created, updated) VALUES (:path, :camera, :kind, :start, :end, :duration, :bytes, :valid, "
+                "coalesce(:status, 'recorded'), :job_id, :now, :now) "
+                "ON CONFLICT(path) DO UPDATE SET kind = excluded.kind, "
+                "start = coalesce(excluded.start, start), end = coalesce(excluded.end, end), "
+                "duration = coalesce(excluded.duration, duration), bytes = coalesce(excluded.bytes, bytes), "
+                "valid = coalesce(excluded.valid, valid), job_id = coalesce(excluded.job_id, job_id), "
+                "status = coalesce(:status, status), updated = excluded.updated, deleted = NULL",
+                values
+            )
+
+    def set_status(self, paths, status, job_id=None):
+        now = time.time()
+        sent = now if status == "sent" else None
+        with self.lock, self.db:
+            self.db.executemany(
+                "UPDATE files SET status = ?, job_id = coalesce(?, job_id), sent = coalesce(?, sent), "
+                "updated = ? WHERE path = ?",
+                [(status, job_id, sent, now, path) for path in paths]
+            )
+
+    def moved(self, path, new_path, kind=None):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM files WHERE path = ?", (new_path,))
+            self.db.execute("UPDATE files SET path = ?, kind = coalesce(?, kind), updated = ? WHERE path = ?",
+                            (new_path, kind, time.time(), path))
+
+    def removed(self, paths):
+        """The files are gone from disk; their rows stay for summaries"""
+        now = time.time()
+        with self.lock, self.db:
+            self.db.executemany("UPDATE files SET deleted = ?, updated = ? WHERE path = ? AND deleted IS NULL",
+                                [(now, now, path) for path in paths])
+
+    def between(self, start, end, camera=None, kind="segment", present=True):
+        """
+        Files whose time span overlaps [start, end) (epoch seconds), oldest first.
+        A file without a known end is taken to run until the next one: the last
+        file of each camera starting at or before `start` is always included.
+        """
+        deleted = " AND deleted IS NULL" if present else ""
+        # Segments are at most a few minutes long: bound the index range on start
+        # from below as well, so the lookup does not read everything before `end`
+        query = (
+            "SELECT * FROM files WHERE kind = ? AND start < ? AND start >= ?" + deleted +
+            " AND (coalesce(end, start) > ? OR start = (SELECT max(start) FROM files AS f "
+            "WHERE f.kind = files.kind AND f.camera = files.camera AND f.start <= ? AND f.start >= ?" +
+            deleted.replace("deleted", "f.deleted") + "))"
+        )
+        params = [kind, end, start - 86400, start, start, start - 86400]
+        if camera is not None:
+            query += " AND camera = ?"
+            params.append(camera)
+        return [dict(row) for row in self.db.execute(query + " ORDER BY start", params)]
+
+    def totals(self, since, until=None):
+        """
+        Aggregates of [since, until): segments recorded (count, seconds, bytes,
+        how many are still on disk) and outputs sent, per camera
+        """
+        until = until or time.time()
+        result = {}
+        for row in self.db.execute(
+            "SELECT camera, count(*) AS segments, coalesce(sum(duration), 0) AS seconds, "
+            "coalesce(sum(bytes), 0) AS bytes, sum(deleted IS NULL) AS on_disk, "
+            "sum(valid = 0) AS invalid FROM files WHERE kind = 'segment' AND start >= ? AND start < ? "
+            "GROUP BY camera", (since, until)
+        ):
+            result[row["camera"]] = dict(row, sent=0, sent_bytes=0)
+        for row in self.db.execute(
+            "SELECT camera, count(*) AS sent, coalesce(sum(bytes), 0) AS sent_bytes FROM files "
+            "WHERE kind IN ('compressed', 'merged', 'digest') AND sent >= ? AND sent < ? GROUP BY camera",
+            (since, until)
+        ):
+            entry = result.setdefault(row["camera"], {"camera": row["camera"], "segments": 0, "seconds": 0,
+                                                      "bytes": 0, "on_disk": 0, "invalid": 0})
+            entry.update(sent=row["sent"], sent_bytes=row["sent_bytes"])
+        return result
+
+    def backlog(self):
+        """(segments, bytes) recorded and on disk but not yet merged"""
+        row = self.db.execute(
+            "SELECT count(*), coalesce(sum(bytes), 0) FROM files "
+            "WHERE status = 'recorded' AND kind = 'segment' AND deleted IS NULL"
+        ).fetchone()
+        return row[0], row[1]
+
+    def prune(self, days=CATALOG_KEEP_DAYS):
+        """Forget files deleted more than the given number of days ago"""
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM files WHERE deleted < ?", (time.time() - days * 86400,))
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """Process-wide catalog, opened on first use"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = Catalog()
+        return _catalog
+
+
+def update(method, *args, **kwargs):
+    """
+    Call a Catalog method for bookkeeping; a locked or broken catalog never
+    stops capture, merge or retention. Returns False if the update failed.
+    """
+    try:
+        getattr(get_catalog(), method)(*args, **kwargs)
+        return True
+    except (sqlite3.Error, OSError):
+        return False
+
+
+def record_segment(path, camera, valid=None, duration=None):
+    """Catalog a closed segment; start comes from its name, duration and validity from the capture stats"""
+    started = segment_start(path)
+    stats = read_sidecar(path, "capture") or {}
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = None
+    return update(
+        "record", path, camera, "segment",
+        start=started.timestamp() if started else None,
+        # Sidecars written before the duration key carry only the progress out_time
+        duration=duration or stats.get("duration") or stats.get("out_time") or None,
+        size=size,
+        valid=stats.get("valid") if valid is None else valid,
+    )
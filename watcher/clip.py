@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Clip extraction by wall-clock time
+Вырезка фрагмента по времени: сегменты выбираются по времени в именах файлов,
+разрез по ключевым кадрам и склейка без перекодирования; при --exact заново
+кодируются только неполные группы кадров на краях
+"""
+
+import argparse
+import datetime
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from .config import RING_BUFFER, camera_names, camera_video_dir
+from .encoder import encoder_args
+from .segments import segment_start
+from . import mediainfo, metrics, pipeline
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%H:%M:%S", "%H:%M")
+
+
+class ClipError(Exception):
+    pass
+
+
+def parse_time(value, day):
+    """"[YYYY-MM-DD ]HH:MM[:SS]"; a bare time is taken on the given day"""
+    for fmt in TIME_FORMATS:
+        try:
+            moment = datetime.datetime.strptime(value.strip(), fmt)
+        except ValueError:
+            continue
+        if "%Y" not in fmt:
+            moment = datetime.datetime.combine(day, moment.time())
+        return moment
+    raise ClipError(f"Unrecognised time: {value} (expected [YYYY-MM-DD ]HH:MM[:SS])")
+
+
+def parse_day(value):
+    today = datetime.date.today()
+    if value in (None, "", "today"):
+        return today
+    if value == "yesterday":
+        return today - datetime.timedelta(days=1)
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise ClipError(f"Unrecognised date: {value} (expected YYYY-MM-DD, today or yesterday)")
+
+
+def source_dirs(camera):
+    dirs = [camera_video_dir(camera)]
+    if RING_BUFFER:
+        from .ringbuffer import ring_dir
+        dirs.append(ring_dir(camera))
+    return dirs
+
+
+def find_segments(camera, start, end):
+    """
+    Segments that may overlap [start, end): an index lookup in the catalog,
+    merged with the time in the names of the files on disk (segments recorded
+    before the catalog existed, or still in the ring buffer): the last one
+    starting at or before `start` and every one starting before `end`
+    """
+    from .catalog import CATALOG_FILE, get_catalog
+    found = {}
+    if os.path.exists(CATALOG_FILE):
+        for row in get_catalog().between(start.timestamp(), end.timestamp(), camera):
+            began = segment_start(row["path"])
+            if began is not None and os.path.exists(row["path"]):
+                found[row["path"]] = began
+
+    named = []
+    for directory in source_dirs(camera):
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            if name.startswith("video_") and name.endswith(".mp4"):
+                began = segment_start(name)
+                if began is not None:
+                    named.append((began, os.path.join(directory, name)))
+    named.sort()
+    before = [item for item in named if item[0] <= start]
+    inside = [item for item in named if start < item[0] < end]
+    for began, path in before[-1:] + inside:
+        found[path] = began
+    return sorted((began, path) for path, began in found.items())
+
+
+def plan(segments, start, end, exact=False):
+    """
+    Pieces of the clip as (path, inpoint, outpoint, reencode); points are
+    seconds into the segment, None means its start or end. Stream-copied
+    pieces begin and end on keyframes; with exact, the partial GOPs at the
+    edges become re-encoded pieces so the clip starts and ends on time.
+    """
+    pieces = []
+    for began, path in segments:
+        info = mediainfo.get(path)
+        if not info["valid"]:
+            continue
+        duration = info.get("duration") or 0
+        keyframes = info.get("keyframes") or [0.0]
+        origin = keyframes[0]
+        a = max(0.0, (start - began).total_seconds())
+        b = min(duration, (end - began).total_seconds())
+        if b <= a:
+            continue
+        a, b = origin + a, origin + b
+        at_end = b >= origin + duration
+
+        if not exact:
+            inpoint = max([k for k in keyframes if k <= a] or [origin])
+            outpoint = None if at_end else min([k for k in keyframes if k >= b] or [None])
+            pieces.append((path, inpoint if inpoint > origin else None, outpoint, False))
+            continue
+
+        first = min([k for k in keyframes if k >= a] or [None])
+        last = max([k for k in keyframes if k <= b] or [origin])
+        if first is None or first >= b:
+            # No keyframe inside the range: the whole piece is one partial GOP
+            pieces.append((path, a, b, True))
+            continue
+        if first > a:
+            pieces.append((path, a, first, True))
+        if at_end:
+            pieces.append((path, first if first > origin else None, None, False))
+        else:
+            if last > first:
+                pieces.append((path, first if first > origin else None, last, False))
+            if b > last:
+                pieces.append((path, last, b, True))
+    return pieces
+
+
+def encode_piece(path, inpoint, outpoint, output_path):
+    """
+    Re-encode [inpoint, outpoint) of a segment with the settings it was recorded
+    with, so the piece concatenates with the stream-copied ones
+    """
+    info = mediainfo.get(path)
+    stage = "compress" if pipeline.is_compressed(path) else "capture"
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        # Input seeking starts at the keyframe before inpoint: one GOP is decoded
+        "-ss", f"{inpoint:.3f}", "-i", path, "-t", f"{outpoint - inpoint:.3f}",
+        "-map", "0:v", "-map", "0:a?",
+    ] + encoder_args(stage) + ["-pix_fmt", info.get("pix_fmt") or "yuv420p", "-c:a", "copy", "-y", output_path]
+    subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, check=True)
+
+
+def extract(camera, start, end, output_path, exact=False):
+    """Write the clip of [start, end) to output_path; returns the number of pieces"""
+    segments = find_segments(camera, start, end)
+    if not segments:
+        raise ClipError(f"No segments of camera {camera or 'default'} between {start} and {end}")
+    mediainfo.get_many([path for _, path in segments])
+    pieces = plan(segments, start, end, exact)
+    if not pieces:
+        raise ClipError(f"The segments around {start} do not cover the requested range")
+
+    with tempfile.TemporaryDirectory(prefix="watcher-clip-") as work_dir:
+        list_file = os.path.join(work_dir, "pieces.txt")
+        with open(list_file, "w") as f:
+            for index, (path, inpoint, outpoint, reencode) in enumerate(pieces):
+                if reencode:
+                    edge = os.path.join(work_dir, f"edge_{index}.mp4")
+                    encode_piece(path, inpoint, outpoint, edge)
+                    f.write(f"file '{edge}'\n")
+                    continue
+                f.write(f"file '{path}'\n")
+                if inpoint is not None:
+                    f.write(f"inpoint {inpoint:.3f}\n")
+                if outpoint is not None:
+                    f.write(f"outpoint {outpoint:.3f}\n")
+        cmd = [
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", list_file,
+            "-map", "0:v", "-map", "0:a?", "-c", "copy",
+            "-movflags", "+faststart", "-y", output_path,
+        ]
+        subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, check=True)
+    return len(pieces)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract a clip by wall-clock time from the recorded segments")
+    parser.add_argument("--from", dest="start", required=True, help="[YYYY-MM-DD ]HH:MM[:SS]")
+    parser.add_argument("--to", dest="end", required=True, help="[YYYY-MM-DD ]HH:MM[:SS]")
+    parser.add_argument("--date", help="day of bare times: YYYY-MM-DD, today (default) or yesterday")
+    parser.add_argument("--camera", default=camera_names()[0], help="camera name (multi-camera setups)")
+    parser.add_argument("--exact", action="store_true",
+                        help="re-encode the partial GOPs at the edges to start and end on the exact frame")
+    parser.add_argument("-o", "--output", help="output file (default: clip_<from>_<to>.mp4 here)")
+    args = parser.parse_args()
+
+    try:
+        day = parse_day(args.date)
+        start, end = parse_time(args.start, day), parse_time(args.end, day)
+        if end <= start and "-" not in args.end:
+            # 23:55 -> 00:05 runs into the next day
+            end += datetime.timedelta(days=1)
+        if end <= start:
+            raise ClipError("--to must be after --from")
+        output_path = args.output or f"clip_{start:%Y%m%d_%H%M%S}_{end:%H%M%S}.mp4"
+
+        started = time.monotonic()
+        pieces = extract(args.camera, start, end, output_path, args.exact)
+    except ClipError as e:
+        print(f"❌ {e}")
+        return 1
+    except subprocess.CalledProcessError as e:
+        print(f"❌ ffmpeg failed: {e.output.strip()[-300:]}")
+        return 1
+
+    elapsed = time.monotonic() - started
+    metrics.observe("clip_seconds", round(elapsed, 3))
+    metrics.flush()
+    duration = mediainfo.probe(output_path).get("duration") or 0
+    cpu = ""
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu = f" (ffmpeg CPU {usage.ru_utime + usage.ru_stime:.2f}s)"
+    print(f"🎬 {output_path}: {duration:.1f}s from {pieces} piece(s) in {elapsed:.2f}s{cpu}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,12 +2,56 @@
 # config.py
 
 import os
-from dotenv import load_dotenv
 
-load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), "..", ".env"), override=True)
+# Every setting below is read from the environment, so .env has to be loaded
+# here; python-dotenv is only imported when there is a file to load
+_ENV_FILE = os.path.join(os.path.dirname(__file__), "..", ".env")
+if os.path.exists(_ENV_FILE):
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=_ENV_FILE, override=True)
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+UPLOAD_MAX_MB = int(os.getenv("UPLOAD_MAX_MB", "48"))  # Предел размера одного отправляемого файла (Bot API — 50 МБ)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")  # Адрес Bot API (локальный сервер, watcher-mockapi)
+TELEGRAM_CONNECT_TIMEOUT = float(os.getenv("TELEGRAM_CONNECT_TIMEOUT", "10"))  # Таймаут соединения, секунд
+TELEGRAM_READ_TIMEOUT = float(os.getenv("TELEGRAM_READ_TIMEOUT", "120"))  # Таймаут ответа, секунд
+
+# Очередь отправки: повторные попытки с экспоненциальной задержкой
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "1"))  # Одновременных отправок
+OUTBOX_ORDER = os.getenv("OUTBOX_ORDER", "oldest").lower()  # Что отправлять первым при накоплении: oldest или newest
+OUTBOX_BACKOFF_MIN = float(os.getenv("OUTBOX_BACKOFF_MIN", "30"))  # Первая пауза после неудачи, секунд
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "3600"))  # Максимальная пауза, секунд
+
+# Уведомления отправляются в фоне с ограничением частоты
+NOTIFY_RATE_PER_MINUTE = float(os.getenv("NOTIFY_RATE_PER_MINUTE", "20"))  # Сообщений в минуту
+NOTIFY_BURST = int(os.getenv("NOTIFY_BURST", "5"))  # Сколько сообщений можно отправить подряд
+NOTIFY_COALESCE_WINDOW = float(os.getenv("NOTIFY_COALESCE_WINDOW", "300"))  # Повторы за это время сворачиваются в «×N», секунд
+
+# Куда доставлять готовые файлы (через запятую): telegram, archive, s3, http
+DELIVERY_SINKS = [name.strip().lower() for name in os.getenv("DELIVERY_SINKS", "telegram").split(",") if name.strip()]
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "")  # Каталог для копий (например, NAS), archive
+S3_ENDPOINT = os.getenv("S3_ENDPOINT", "").rstrip("/")  # Адрес S3-совместимого хранилища (MinIO), s3
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_ACCESS_KEY = os.getenv("S3_ACCESS_KEY", "")
+S3_SECRET_KEY = os.getenv("S3_SECRET_KEY", "")
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_PREFIX = os.getenv("S3_PREFIX", "watcher").strip("/")  # Префикс ключей объектов
+S3_PART_MB = int(os.getenv("S3_PART_MB", "16"))  # Файлы больше загружаются частями такого размера (не меньше 5)
+HTTP_SINK_URL = os.getenv("HTTP_SINK_URL", "")  # Адрес, на который файл отправляется POST-запросом, http
+HTTP_SINK_TOKEN = os.getenv("HTTP_SINK_TOKEN", "")  # Bearer-токен для HTTP_SINK_URL
+
+# Что отправлять за каждое окно записи:
+# video - сжатое видео целиком
+# digest - дайджест из ключевых кадров (для лимитного канала, например LTE); полное
+# видео остаётся в MERGED_DIR как full_*.mp4 и отправляется по запросу (watcher-digest --fetch)
+DELIVERY_MODE = os.getenv("DELIVERY_MODE", "video").lower()
+DIGEST_FORMAT = os.getenv("DIGEST_FORMAT", "jpeg").lower()  # jpeg - контактный лист, mp4 - короткий ролик без звука
+DIGEST_COLUMNS = int(os.getenv("DIGEST_COLUMNS", "4"))  # Кадров в строке контактного листа
+DIGEST_ROWS = int(os.getenv("DIGEST_ROWS", "4"))  # Строк на листе
+DIGEST_MAX_SHEETS = int(os.getenv("DIGEST_MAX_SHEETS", "1"))  # Листов на окно, несколько — одним альбомом (до 10)
+DIGEST_TILE_WIDTH = int(os.getenv("DIGEST_TILE_WIDTH", "320"))  # Ширина кадра в дайджесте, пикселей
+DIGEST_FPS = float(os.getenv("DIGEST_FPS", "4"))  # Частота кадров ролика-дайджеста (mp4)
 
 # Корневая директория проекта
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -16,16 +60,114 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 VIDEO_DIR = os.path.join(BASE_DIR, "videos")
 MERGED_DIR = os.path.join(BASE_DIR, "merged")
 LOG_DIR = os.path.join(BASE_DIR, "logs")
+STATE_DIR = os.path.join(BASE_DIR, "state")  # Кэши и служебное состояние
 
 # Настройки камеры и записи (загружаются из .env файла)
 FPS = int(os.getenv("FPS", "30"))  # Кадры в секунду
 RESOLUTION = os.getenv("RESOLUTION", "1280x720")  # Разрешение видео
 DURATION = int(os.getenv("DURATION", "55"))  # Длительность записи в секундах 
 CAMERA_DEVICE = os.getenv("CAMERA_DEVICE", "auto")  # Устройство камеры: "auto", "0", "1", etc.
+CAPTURE_SOURCE = os.getenv("CAPTURE_SOURCE", "auto")  # Источник: "auto", "avfoundation", "v4l2", "lavfi"
+# fast - быстрая запись с последующим сжатием при отправке
+# delivery - запись сразу в итоговом качестве, объединение без перекодирования
+CAPTURE_PROFILE = os.getenv("CAPTURE_PROFILE", "fast").lower()
+
+# Настройки непрерывной записи (watcher-capture --daemon)
+SEGMENT_DURATION = int(os.getenv("SEGMENT_DURATION", "60"))  # Длина сегмента в секундах, выровнена по часам
+SEGMENT_KEYFRAME_INTERVAL = int(os.getenv("SEGMENT_KEYFRAME_INTERVAL", "1"))  # Интервал ключевых кадров в секундах
+RESTART_BACKOFF_MIN = float(os.getenv("RESTART_BACKOFF_MIN", "1"))  # Начальная пауза перед перезапуском ffmpeg
+RESTART_BACKOFF_MAX = float(os.getenv("RESTART_BACKOFF_MAX", "60"))  # Максимальная пауза перед перезапуском ffmpeg
+CAPTURE_STALL_TIMEOUT = int(os.getenv("CAPTURE_STALL_TIMEOUT", "10"))  # Секунд без кадров до перезапуска ffmpeg (0 — не следить)
+CAPTURE_MIN_SPEED = float(os.getenv("CAPTURE_MIN_SPEED", "0.9"))  # Доля от FPS, ниже которой камера считается медленной
+
+# Расписание единого демона watcherd (запись, анализ, объединение, отправка и квоты в одном процессе)
+WATCHERD_MERGE_INTERVAL = int(os.getenv("WATCHERD_MERGE_INTERVAL", "600"))  # Период объединения, секунд
+WATCHERD_UPLOAD_INTERVAL = int(os.getenv("WATCHERD_UPLOAD_INTERVAL", "60"))  # Период разбора очереди отправки, секунд
+WATCHERD_ANALYSIS_INTERVAL = int(os.getenv("WATCHERD_ANALYSIS_INTERVAL", "60"))  # Период оценки движения (при MOTION_ANALYSIS), секунд
+
+# Кольцевой буфер в RAM (tmpfs) для режима демона: сегменты хранятся в памяти и
+# переносятся в VIDEO_DIR только при движении или ручном срабатывании (watcher-trigger)
+RING_BUFFER = os.getenv("RING_BUFFER", "false").lower() == "true"
+RING_BUFFER_DIR = os.getenv("RING_BUFFER_DIR") or ("/dev/shm/watcher" if os.path.isdir("/dev/shm") else "/tmp/watcher-ring")
+RING_BUFFER_MAX_MB = int(os.getenv("RING_BUFFER_MAX_MB", "512"))  # Жёсткий предел размера буфера
+RING_BUFFER_MINUTES = int(os.getenv("RING_BUFFER_MINUTES", "10"))  # Сколько минут хранить в буфере
+RING_PROMOTE_ON_MOTION = os.getenv("RING_PROMOTE_ON_MOTION", "true").lower() == "true"
+RING_PREROLL_SEGMENTS = int(os.getenv("RING_PREROLL_SEGMENTS", "1"))  # Сегменты до события, переносимые вместе с ним
+
+# Сжатие каждого сегмента в фоне после его закрытия (режим демона): объединение
+# затем только копирует потоки, нагрузка на процессор распределяется равномерно
+PIPELINE_COMPRESS = os.getenv("PIPELINE_COMPRESS", "false").lower() == "true"
+PIPELINE_NICE = int(os.getenv("PIPELINE_NICE", "15"))  # Приоритет ffmpeg фонового сжатия
+
+# Несколько камер одновременно: "front=0,back=1" (пусто — одна камера CAMERA_DEVICE).
+# Ограничения задаются общими CAMERA_<КЛЮЧ> или для камеры CAMERA_<ИМЯ>_<КЛЮЧ>,
+# например CAMERA_BACK_NICE=10
+def _camera_setting(name, key, default):
+    return os.getenv(f"CAMERA_{name.upper()}_{key}", os.getenv(f"CAMERA_{key}", default))
+
+def _parse_cameras(spec):
+    cameras = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, device = item.partition("=")
+        name = name.strip()
+        cameras.append({
+            "name": name,
+            "device": device.strip() or name,
+            "max_restarts": int(_camera_setting(name, "MAX_RESTARTS", "0")),  # 0 — без ограничений
+            "nice": int(_camera_setting(name, "NICE", "0")),
+            "max_memory_mb": int(_camera_setting(name, "MAX_MEMORY_MB", "0")),  # 0 — без ограничений
+            "threads": int(_camera_setting(name, "THREADS", "0")),  # 0 — на усмотрение ffmpeg
+        })
+    return cameras
+
+CAMERAS = _parse_cameras(os.getenv("CAMERAS", ""))
+
+def camera_names():
+    """Имена камер для обработки ("" — режим одной камеры)"""
+    return [camera["name"] for camera in CAMERAS] or [""]
+
+def camera_video_dir(name):
+    """Каталог сегментов камеры (VIDEO_DIR для режима одной камеры)"""
+    return os.path.join(VIDEO_DIR, name) if name else VIDEO_DIR
+
+def camera_merged_dir(name):
+    """Каталог готовых файлов камеры (MERGED_DIR для режима одной камеры)"""
+    return os.path.join(MERGED_DIR, name) if name else MERGED_DIR
+
+# Квоты хранения (0 — без ограничения); при превышении удаляются сначала
+# промежуточные файлы (восстановленные, merged_*), затем самые старые
+VIDEO_DIR_MAX_MB = int(os.getenv("VIDEO_DIR_MAX_MB", "0"))
+VIDEO_DIR_MAX_AGE_HOURS = float(os.getenv("VIDEO_DIR_MAX_AGE_HOURS", "0"))
+MERGED_DIR_MAX_MB = int(os.getenv("MERGED_DIR_MAX_MB", "0"))
+MERGED_DIR_MAX_AGE_HOURS = float(os.getenv("MERGED_DIR_MAX_AGE_HOURS", "0"))
+RETENTION_MIN_FREE_PERCENT = float(os.getenv("RETENTION_MIN_FREE_PERCENT", "0"))  # Свободное место на томе с видео (0 — не следить)
+RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", "60"))  # Период проверки квот в режиме демона, секунд
+
+# Кэш метаданных (state/media_cache.json): ffprobe запускается только для новых или изменённых файлов
+MEDIA_PROBE_WORKERS = int(os.getenv("MEDIA_PROBE_WORKERS", "4"))  # Параллельных ffprobe
+
+# Каталог записей (state/catalog.db): сегменты и готовые файлы с временем, размером и статусом отправки
+CATALOG_KEEP_DAYS = int(os.getenv("CATALOG_KEEP_DAYS", "90"))  # Сколько дней помнить удалённые файлы
+
+# Анализ движения перед объединением (требуется numpy)
+MOTION_ANALYSIS = os.getenv("MOTION_ANALYSIS", "false").lower() == "true"
+MOTION_FPS = float(os.getenv("MOTION_FPS", "2"))  # Частота кадров для анализа
+MOTION_PIXEL_THRESHOLD = int(os.getenv("MOTION_PIXEL_THRESHOLD", "25"))  # Изменение яркости пикселя, считающееся движением
+MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", "0.002"))  # Доля изменившихся пикселей, ниже которой сегмент статичен
+MOTION_STATIC_ACTION = os.getenv("MOTION_STATIC_ACTION", "keep").lower()  # keep, drop, compress, timelapse
+MOTION_STATIC_CRF = int(os.getenv("MOTION_STATIC_CRF", "40"))  # CRF для статичных сегментов
+MOTION_TIMELAPSE_FACTOR = int(os.getenv("MOTION_TIMELAPSE_FACTOR", "10"))  # Ускорение статичных сегментов
 
 # Настройки наложения времени на видео
 SHOW_TIMESTAMP = os.getenv("SHOW_TIMESTAMP", "true").lower() == "true"
 TIMESTAMP_POSITION = os.getenv("TIMESTAMP_POSITION", "top-right")
 TIMESTAMP_FONT_SIZE = int(os.getenv("TIMESTAMP_FONT_SIZE", "24"))
+# burn - рисовать время на каждом кадре при записи (drawtext)
+# metadata - записывать время в creation_time и дорожку субтитров, без перекодирования кадров
+TIMESTAMP_MODE = os.getenv("TIMESTAMP_MODE", "burn").lower()
+TIMESTAMP_BURN_ON_SEND = os.getenv("TIMESTAMP_BURN_ON_SEND", "true").lower() == "true"  # В режиме metadata накладывать время на отправляемый файл
 
-# Для списка доступных камер: ffmpeg -f avfoundation -list_devices true -i ""
\ No newline at end of file
+# Для списка доступных камер: watcher-devices
\ No newline at end of file
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Cached camera device registry
+Кэшированный реестр камер: устройства перечисляются только при сбое записи или смене устройств
+"""
+
+import json
+import logging
+import os
+import time
+from .config import STATE_DIR
+from .sources import get_source, select_preferred
+
+REGISTRY_FILE = os.path.join(STATE_DIR, "devices.json")
+
+# Devices are enumerated again after this long even if the fingerprint did not
+# change: cameras that are not on USB (Continuity Camera) do not show up in it
+MAX_AGE = 3600
+
+logger = logging.getLogger("capture")
+
+
+def _load():
+    try:
+        with open(REGISTRY_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save(entry):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    tmp_path = REGISTRY_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(entry, f, indent=2)
+    os.replace(tmp_path, REGISTRY_FILE)
+
+
+def refresh(source=None):
+    """Enumerate devices of the source, select the preferred one and store the result"""
+    source = source or get_source()
+    devices = source.list_devices()
+
+    logger.info(f"📋 Found {len(devices)} video devices")
+    for idx, name in devices:
+        logger.info(f"  [{idx}] {name}")
+
+    selected, kind = select_preferred(devices)
+    if selected:
+        logger.info(f"🎯 Selected {kind} camera: [{selected[0]}] {selected[1]}")
+
+    entry = {
+        "source": source.name,
+        "fingerprint": source.fingerprint(),
+        "devices": devices,
+        "selected": selected[0] if selected else None,
+        "updated": time.time(),
+    }
+    # Nothing to remember if no camera was found, the next call should enumerate again
+    if selected:
+        _save(entry)
+    return entry
+
+
+def get_preferred_device(source=None):
+    """
+    Return the preferred device id, enumerating only if the cache is missing or stale
+    Возвращает предпочтительное устройство, перечисляя камеры только при отсутствии кэша
+    """
+    source = source or get_source()
+    entry = _load()
+    if (
+        entry
+        and entry.get("source") == source.name
+        and entry.get("selected") is not None
+        and entry.get("fingerprint") == source.fingerprint()
+        and time.time() - entry.get("updated", 0) < MAX_AGE
+    ):
+        return entry["selected"]
+
+    try:
+        entry = refresh(source)
+    except Exception as e:
+        logger.warning(f"⚠️ Camera detection failed: {e}, using fallback device")
+        return "0"
+
+    if entry["selected"] is None:
+        logger.warning("⚠️ No cameras found, using fallback device")
+        return "0"  # Default fallback
+    return entry["selected"]
+
+
+def invalidate():
+    """Forget the cached devices, e.g. after ffmpeg failed to open the camera"""
+    try:
+        os.remove(REGISTRY_FILE)
+        logger.info("♻️ Camera registry invalidated")
+    except FileNotFoundError:
+        pass
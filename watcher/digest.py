@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Keyframe digests for metered links
+Дайджест окна записи из одних ключевых кадров (-skip_frame nokey): контактный лист
+JPEG или короткий ролик вместо видео; полное видео хранится и отправляется по запросу
+"""
+
+import argparse
+import glob
+import math
+import os
+import re
+import subprocess
+import sys
+import time
+from .config import (
+    LOG_DIR, DIGEST_FORMAT, DIGEST_COLUMNS, DIGEST_ROWS, DIGEST_MAX_SHEETS, DIGEST_TILE_WIDTH, DIGEST_FPS,
+    camera_names, camera_merged_dir,
+)
+from .logger import setup_logger
+from . import mediainfo, metrics, timestamps
+
+# Digest files are queued like compressed clips and removed once sent
+PREFIX = "digest_"
+# The merged video of a digest window is kept under this prefix
+FULL_PREFIX = "full_"
+
+# Sheets go out as one Telegram album, which holds 2 to 10 photos
+MAX_SHEETS = 10
+# digest_X_01.jpg: one of several sheets, named by contact_sheets()
+SHEET_NAME = re.compile(r"(.+)_(\d{2})\.jpg$")
+# JPEG quality of the sheets (ffmpeg -q:v, 2 is best, 31 worst)
+JPEG_QUALITY = 5
+# Quality of the digest clip; frames are small and static, a high CRF is enough
+CLIP_CRF = 30
+
+
+def is_digest(path):
+    return os.path.basename(path).startswith(PREFIX)
+
+
+def album(path):
+    """
+    All sheets of the multi-sheet digest a sheet belongs to, in order, or None
+    for a single-file digest; Telegram gets them as one sendMediaGroup album
+    """
+    match = SHEET_NAME.match(os.path.basename(path))
+    if not is_digest(path) or not match:
+        return None
+    base = os.path.join(os.path.dirname(path), match.group(1))
+    sheets = sorted(glob.glob(glob.escape(base) + "_[0-9][0-9].jpg"))
+    return sheets if len(sheets) > 1 else None
+
+
+def full_path(merged_path):
+    """merged_X.mp4 -> full_X.mp4, the name the window is kept under"""
+    directory, name = os.path.split(merged_path)
+    if name.startswith("merged_"):
+        name = name[len("merged_"):]
+    return os.path.join(directory, FULL_PREFIX + name)
+
+
+def digest_base(merged_path):
+    """merged_X.mp4 -> digest_X, extension added by the format"""
+    directory, name = os.path.split(merged_path)
+    if name.startswith("merged_"):
+        name = name[len("merged_"):]
+    return os.path.join(directory, PREFIX + os.path.splitext(name)[0])
+
+
+def _step(video_path, frames):
+    """Take every n-th keyframe so that about `frames` of them cover the window"""
+    keyframes = mediainfo.get(video_path).get("keyframes") or []
+    return max(1, math.ceil(len(keyframes) / frames)) if keyframes else 1
+
+
+def _filters(video_path, frames):
+    """Keyframe selection, timestamps of metadata mode and downscaling"""
+    filters = [f"select='not(mod(n\\,{_step(video_path, frames)}))'"]
+    # Timestamps are only drawn at capture in burn mode; draw the subtitle track here otherwise
+    burn = timestamps.burn_filter(video_path)
+    if burn:
+        filters.append(burn)
+    filters.append(f"scale={DIGEST_TILE_WIDTH}:-2")
+    return filters
+
+
+def _run(cmd):
+    # Only keyframes are decoded: the cost is a few frames per window, not every frame
+    subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-skip_frame", "nokey"] + cmd,
+                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, check=True)
+
+
+def contact_sheets(video_path, base):
+    """Tile evenly spaced keyframes into up to DIGEST_MAX_SHEETS JPEG sheets"""
+    sheets = max(1, min(DIGEST_MAX_SHEETS, MAX_SHEETS))
+    tiles = max(1, DIGEST_COLUMNS) * max(1, DIGEST_ROWS)
+    pattern = f"{base}_%02d.jpg"
+    for leftover in glob.glob(glob.escape(base) + "_*.jpg"):
+        os.remove(leftover)
+    filters = _filters(video_path, tiles * sheets) + [
+        f"tile={max(1, DIGEST_COLUMNS)}x{max(1, DIGEST_ROWS)}:padding=2:margin=2"
+    ]
+    _run(["-i", video_path, "-an", "-vf", ",".join(filters),
+          "-fps_mode", "vfr", "-frames:v", str(sheets), "-q:v", str(JPEG_QUALITY), "-y", pattern])
+    produced = sorted(glob.glob(glob.escape(base) + "_*.jpg"))
+    if len(produced) == 1:
+        os.replace(produced[0], f"{base}.jpg")
+        return [f"{base}.jpg"]
+    return produced
+
+
+def keyframe_clip(video_path, base):
+    """Silent clip of the keyframes played back at DIGEST_FPS"""
+    frames = max(1, DIGEST_COLUMNS * DIGEST_ROWS * max(1, DIGEST_MAX_SHEETS))
+    output_path = f"{base}.mp4"
+    filters = _filters(video_path, frames) + [f"setpts=N/{DIGEST_FPS}/TB"]
+    _run(["-i", video_path, "-an", "-vf", ",".join(filters), "-r", f"{DIGEST_FPS:g}",
+          "-c:v", "libx264", "-preset", "veryfast", "-crf", str(CLIP_CRF), "-pix_fmt", "yuv420p",
+          "-movflags", "+faststart", "-y", output_path])
+    return [output_path]
+
+
+def build(video_path, logger, digest_format=DIGEST_FORMAT):
+    """
+    Build the digest of a merged window; returns the files to send.
+    subprocess.CalledProcessError propagates.
+    """
+    base = digest_base(video_path)
+    started = time.monotonic()
+    if digest_format == "mp4":
+        files = keyframe_clip(video_path, base)
+    else:
+        files = contact_sheets(video_path, base)
+    if not files:
+        raise subprocess.CalledProcessError(1, "ffmpeg", output="no keyframes decoded")
+
+    elapsed = time.monotonic() - started
+    size = sum(os.path.getsize(f) for f in files)
+    full_size = os.path.getsize(video_path)
+    metrics.increment("digest_built_total")
+    metrics.observe("digest_seconds", round(elapsed, 3))
+    metrics.increment("digest_bytes_total", size)
+    metrics.increment("digest_full_bytes_total", full_size)
+    logger.info(
+        f"🖼️ Digest of {os.path.basename(video_path)}: {len(files)} file(s), {size / 1024:.0f} KB "
+        f"instead of {full_size / 1048576:.1f} MB ({100 * size / max(1, full_size):.1f}%) in {elapsed:.1f}s"
+    )
+    return files
+
+
+def caption(name, merged_path):
+    """Camera, window length and the name to fetch the full video by"""
+    duration = mediainfo.get(merged_path).get("duration") or 0
+    return " · ".join(p for p in (name, f"{duration / 60:.0f} min", os.path.basename(full_path(merged_path))) if p)
+
+
+def keep_full(merged_path, logger):
+    """Keep the merged video of a sent digest for on-demand retrieval"""
+    target = full_path(merged_path)
+    if os.path.exists(merged_path):
+        os.replace(merged_path, target)
+        srt_path = timestamps.subtitles_path(merged_path)
+        if os.path.exists(srt_path):
+            os.replace(srt_path, timestamps.subtitles_path(target))
+        logger.info(f"🗄️ Full video kept for retrieval: {target}")
+    return target
+
+
+def find_full(name):
+    """Path of a kept full_*.mp4 given its file name, in any camera directory"""
+    name = os.path.basename(name)
+    for camera in camera_names():
+        path = os.path.join(camera_merged_dir(camera), name)
+        if os.path.exists(path):
+            return path, camera
+    return None, None
+
+
+def list_full():
+    for camera in camera_names():
+        directory = camera_merged_dir(camera)
+        if not os.path.isdir(directory):
+            continue
+        for filename in sorted(os.listdir(directory)):
+            if filename.startswith(FULL_PREFIX) and filename.endswith(".mp4"):
+                size = os.path.getsize(os.path.join(directory, filename))
+                print(f"{camera or '-':<10} {filename}  {size / 1048576:.1f} MB")
+
+
+def fetch(path, camera, logger):
+    """Compress a kept window, split it to the upload budget and send it to Telegram"""
+    from .journal import run_lock
+    from .merge_and_send import compress_video, part_captions
+    from .telegram import get_client
+    from . import budget
+
+    with run_lock() as locked:
+        if not locked:
+            logger.warning("⏳ A merge run is in progress, try again when it finishes")
+            return False
+        compressed = os.path.join(os.path.dirname(path), "compressed_" + os.path.basename(path)[len(FULL_PREFIX):])
+        parts = []
+        try:
+            if not compress_video(path, compressed):
+                return False
+            parts = budget.split_for_upload(compressed, logger)
+            client = get_client()
+            for part, text in zip(parts, part_captions(camera, parts)):
+                response = client.send_video(part, text, logger)
+                if not response.ok:
+                    logger.error(f"❌ Could not send {os.path.basename(part)}: {response.text[:200]}")
+                    return False
+            logger.info(f"📤 Sent the full video: {os.path.basename(path)}")
+            return True
+        finally:
+            for leftover in dict.fromkeys(parts + [compressed]):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keyframe digests and on-demand retrieval of the full video")
+    parser.add_argument("video", nargs="?", help="build a digest of this video next to it")
+    parser.add_argument("--format", choices=("jpeg", "mp4"), default=DIGEST_FORMAT)
+    parser.add_argument("--fetch", metavar="FULL_NAME", help="send a kept full_*.mp4 window to Telegram")
+    parser.add_argument("--list", action="store_true", help="list the kept full videos")
+    args = parser.parse_args()
+    logger = setup_logger("merge_send", os.path.join(LOG_DIR, "merge_send.log"))
+
+    if args.list:
+        list_full()
+        return 0
+    if args.fetch:
+        path, camera = find_full(args.fetch)
+        if path is None:
+            print(f"❌ No kept video named {args.fetch} (see watcher-digest --list)")
+            return 1
+        return 0 if fetch(path, camera, logger) else 1
+    if args.video:
+        for path in build(args.video, logger, args.format):
+            print(path)
+        return 0
+    parser.print_help()
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+x264 encoder settings for capture and compression
+Настройки кодировщика x264 для записи и сжатия (профиль создаётся командой watcher-tune)
+"""
+
+import json
+import os
+from .config import STATE_DIR, CAPTURE_PROFILE, FPS, SEGMENT_KEYFRAME_INTERVAL
+
+PROFILE_FILE = os.path.join(STATE_DIR, "encoder_profile.json")
+
+# Settings used until watcher-tune has written a profile for this host
+DEFAULTS = {
+    "capture": {"preset": "ultrafast", "crf": None, "threads": 0},
+    "compress": {"preset": "veryfast", "crf": 30, "threads": 0},
+}
+
+_profile = None
+
+
+def load_profile():
+    """Return the tuned profile merged over the defaults (read once per process)"""
+    global _profile
+    if _profile is None:
+        profile = {stage: dict(settings) for stage, settings in DEFAULTS.items()}
+        try:
+            with open(PROFILE_FILE) as f:
+                tuned = json.load(f)
+            for stage in profile:
+                profile[stage].update(tuned.get(stage, {}))
+        except (OSError, ValueError):
+            pass
+        _profile = profile
+    return _profile
+
+
+def save_profile(profile):
+    """Store a tuned profile atomically"""
+    global _profile
+    os.makedirs(STATE_DIR, exist_ok=True)
+    tmp_path = PROFILE_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(profile, f, indent=2)
+    os.replace(tmp_path, PROFILE_FILE)
+    _profile = None
+
+
+def delivery_settings():
+    """
+    Capture settings that produce the final file directly: the real-time capture
+    preset at the quality of the compress stage
+    """
+    profile = load_profile()
+    return dict(profile["capture"], crf=profile["compress"]["crf"])
+
+
+def encoder_args(stage, threads=0):
+    """ffmpeg video encoder arguments for "capture" or "compress"; threads overrides the profile"""
+    delivery = stage == "capture" and CAPTURE_PROFILE == "delivery"
+    settings = delivery_settings() if delivery else load_profile()[stage]
+    args = ["-vcodec", "libx264", "-preset", settings["preset"]]
+    if settings.get("crf") is not None:
+        args.extend(["-crf", str(settings["crf"])])
+    threads = threads or settings.get("threads")
+    if threads:
+        args.extend(["-threads", str(threads)])
+    if delivery:
+        # Players and Telegram expect 4:2:0; a fixed GOP without scene-cut
+        # keyframes keeps every segment cut on the same keyframe grid
+        args.extend([
+            "-pix_fmt", "yuv420p",
+            "-g", str(max(1, FPS * SEGMENT_KEYFRAME_INTERVAL)),
+            "-sc_threshold", "0",
+        ])
+    return args
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Persistent merge job journal
+Журнал заданий объединения (SQLite): стадия каждого задания и состояние каждого
+сегмента сохраняются, поэтому прерванный запуск продолжается с последней
+завершённой стадии без повторного сжатия и повторной отправки
+"""
+
+import contextlib
+import json
+import os
+import sqlite3
+import time
+from .config import STATE_DIR
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+JOURNAL_FILE = os.path.join(STATE_DIR, "journal.db")
+LOCK_FILE = os.path.join(STATE_DIR, "merge.lock")
+
+# Job stages in order; "abandoned" ends a job that failed too often and
+# "failed" one whose upload was rejected (its files are kept for inspection)
+STAGES = ("merging", "merged", "compressed", "sent", "done")
+FINISHED = ("done", "abandoned", "failed")
+
+# Segment state that corresponds to each job stage
+SEGMENT_STATES = {
+    "merging": "validated",
+    "merged": "merged",
+    "compressed": "compressed",
+    "sent": "sent",
+    "done": "deleted",
+}
+
+# Finished jobs are kept this long for inspection
+KEEP_FINISHED_DAYS = 7
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    camera TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    inputs TEXT NOT NULL,
+    temp_files TEXT NOT NULL,
+    merged TEXT NOT NULL,
+    compressed TEXT NOT NULL,
+    parts TEXT NOT NULL DEFAULT '[]',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS segments (
+    path TEXT PRIMARY KEY,
+    camera TEXT NOT NULL,
+    state TEXT NOT NULL,
+    job_id INTEGER,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS segments_job ON segments(job_id);
+"""
+
+# Columns added after the first release: name -> definition
+MIGRATIONS = {
+    "parts": "TEXT NOT NULL DEFAULT '[]'",
+}
+
+
+@contextlib.contextmanager
+def run_lock():
+    """
+    Exclusive lock for a merge run; yields False if another run holds it, so
+    two overlapping runs never resume (and upload) the same job twice
+    """
+    os.makedirs(STATE_DIR, exist_ok=True)
+    with open(LOCK_FILE, "w") as f:
+        if fcntl is None:
+            yield True
+            return
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class Journal:
+    """Merge jobs and segment states stored in state/journal.db"""
+
+    def __init__(self, path=JOURNAL_FILE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        columns = {row["name"] for row in self.db.execute("PRAGMA table_info(jobs)")}
+        with self.db:
+            for name, definition in MIGRATIONS.items():
+                if name not in columns:
+                    self.db.execute(f"ALTER TABLE jobs ADD COLUMN {name} {definition}")
+
+    def close(self):
+        self.db.close()
+
+    def _job(self, row):
+        job = dict(row)
+        job["inputs"] = json.loads(job["inputs"])
+        job["temp_files"] = json.loads(job["temp_files"])
+        job["parts"] = json.loads(job["parts"])
+        job["segments"] = [r["path"] for r in self.db.execute(
+            "SELECT path FROM segments WHERE job_id = ? ORDER BY path", (job["id"],))]
+        return job
+
+    def record_segments(self, camera, paths, state):
+        """Track segments that are not part of a job yet"""
+        now = time.time()
+        with self.db:
+            for path in paths:
+                self.db.execute(
+                    "INSERT INTO segments (path, camera, state, job_id, updated) VALUES (?, ?, ?, NULL, ?) "
+                    "ON CONFLICT(path) DO UPDATE SET state = excluded.state, updated = excluded.updated "
+                    "WHERE segments.job_id IS NULL",
+                    (path, camera, state, now)
+                )
+
+    def create_job(self, camera, inputs, segments, temp_files, merged, compressed):
+        """
+        Start a job that merges inputs into merged and sends compressed; segments
+        are the originals deleted once the result has been sent
+        """
+        now = time.time()
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT INTO jobs (camera, stage, inputs, temp_files, merged, compressed, created, updated) "
+                "VALUES (?, 'merging', ?, ?, ?, ?, ?, ?)",
+                (camera, json.dumps(inputs), json.dumps(temp_files), merged, compressed, now, now)
+            )
+            job_id = cursor.lastrowid
+            for path in segments:
+                self.db.execute(
+                    "INSERT INTO segments (path, camera, state, job_id, updated) VALUES (?, ?, 'validated', ?, ?) "
+                    "ON CONFLICT(path) DO UPDATE SET state = 'validated', job_id = excluded.job_id, "
+                    "updated = excluded.updated",
+                    (path, camera, job_id, now)
+                )
+        return self.get_job(job_id)
+
+    def get_job(self, job_id):
+        row = self.db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def unfinished_jobs(self, camera):
+        """Jobs of a camera that were interrupted or failed, oldest first"""
+        rows = self.db.execute(
+            "SELECT * FROM jobs WHERE camera = ? AND stage NOT IN (?, ?, ?) ORDER BY id",
+            (camera,) + FINISHED
+        ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def owned_paths(self, camera=None):
+        """Every file that belongs to an unfinished or failed job of the camera (of any camera if None)"""
+        query = "SELECT * FROM jobs WHERE stage NOT IN ('done', 'abandoned')"
+        params = ()
+        if camera is not None:
+            query += " AND camera = ?"
+            params = (camera,)
+        paths = set()
+        for job in [self._job(row) for row in self.db.execute(query, params).fetchall()]:
+            paths.update(job["inputs"], job["temp_files"], job["segments"], job["parts"],
+                         (job["merged"], job["compressed"]))
+        return paths
+
+    def set_stage(self, job, stage, **fields):
+        """Record that a job completed a stage; fields update other job columns"""
+        now = time.time()
+        fields = dict(fields, stage=stage, updated=now)
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        values = tuple(json.dumps(value) if isinstance(value, list) else value for value in fields.values())
+        with self.db:
+            self.db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", values + (job["id"],))
+            if stage in SEGMENT_STATES:
+                self.db.execute("UPDATE segments SET state = ?, updated = ? WHERE job_id = ?",
+                                (SEGMENT_STATES[stage], now, job["id"]))
+        job.update(fields)
+
+    def record_failure(self, job):
+        """Count a failed attempt at the current stage and return the total"""
+        with self.db:
+            self.db.execute("UPDATE jobs SET attempts = attempts + 1, updated = ? WHERE id = ?",
+                            (time.time(), job["id"]))
+        job["attempts"] += 1
+        return job["attempts"]
+
+    def abandon(self, job):
+        """Give up on a job and release its segments for a later merge"""
+        now = time.time()
+        with self.db:
+            self.db.execute("UPDATE jobs SET stage = 'abandoned', updated = ? WHERE id = ?", (now, job["id"]))
+            self.db.execute("UPDATE segments SET state = 'validated', job_id = NULL, updated = ? WHERE job_id = ?",
+                            (now, job["id"]))
+        job["stage"] = "abandoned"
+
+    def prune(self, days=KEEP_FINISHED_DAYS):
+        """Forget finished jobs and segments not seen for the given number of days"""
+        cutoff = time.time() - days * 86400
+        with self.db:
+            self.db.execute("DELETE FROM segments WHERE (state = 'deleted' OR job_id IS NULL) AND updated < ?",
+                            (cutoff,))
+            self.db.execute("DELETE FROM jobs WHERE stage IN ('done', 'abandoned') AND updated < ?", (cutoff,))
@@ -100,6 +100,9 @@ MESSAGES = {
         "last_run": "Last run",
         "never": "never",
         "error": "error",
+        
+        # Continuous capture messages
+        "camera_disabled": "💥 Camera {} keeps failing and was disabled",
     },
     
     "ru": {
@@ -185,6 +188,9 @@ MESSAGES = {
         "last_run": "Последний запуск",
         "never": "никогда",
         "error": "ошибка",
+        
+        # Continuous capture messages
+        "camera_disabled": "💥 Камера {} постоянно сбоит и отключена",
     }
 }
 
@@ -1,34 +1,37 @@
 import logging
 from logging.handlers import RotatingFileHandler
-import requests
 import os
 
 def setup_logger(name, log_file, level=logging.INFO):
+    """
+    Attach file and console handlers to the named logger. Modules only call
+    logging.getLogger(name) at import; their entry points call this, so
+    importing a module never creates files.
+    """
     logger = logging.getLogger(name)
     logger.setLevel(level)
     logger.propagate = False
+    if logger.handlers:
+        return logger
 
     formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
 
+    os.makedirs(os.path.dirname(log_file), exist_ok=True)
     fh = RotatingFileHandler(log_file, maxBytes=5*1024*1024, backupCount=3)
     fh.setFormatter(formatter)
 
     ch = logging.StreamHandler()
     ch.setFormatter(formatter)
 
-    if not logger.handlers:
-        logger.addHandler(fh)
-        logger.addHandler(ch)
+    logger.addHandler(fh)
+    logger.addHandler(ch)
 
     return logger
 
 def notify_telegram(message):
-    token = os.getenv("TELEGRAM_BOT_TOKEN")
-    chat_id = os.getenv("TELEGRAM_CHAT_ID")
-    if not token or not chat_id:
-        return
+    # Queued for a background thread, so capture and merge never wait for the network
+    from .alerts import notify
     try:
-        url = f"https://api.telegram.org/bot{token}/sendMessage"
-        requests.post(url, data={"chat_id": chat_id, "text": f"🚨 {message}"})
+        notify(f"🚨 {message}")
     except Exception:
         pass  # Не мешаем работе, даже если уведомление не удалось
\ No newline at end of file
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Persistent media metadata cache
+Кэш метаданных видеофайлов: ffprobe запускается один раз на файл (ключ — путь,
+размер и время изменения), недостающие файлы проверяются параллельно
+"""
+
+import json
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .config import STATE_DIR, MEDIA_PROBE_WORKERS
+
+CACHE_FILE = os.path.join(STATE_DIR, "media_cache.json")
+
+_lock = threading.Lock()
+_cache = None
+
+
+def _load():
+    global _cache
+    if _cache is None:
+        try:
+            with open(CACHE_FILE) as f:
+                _cache = json.load(f)
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+
+def _save():
+    """Write the cache atomically, dropping entries of files that are gone"""
+    with _lock:
+        cache = {path: entry for path, entry in _load().items() if os.path.exists(path)}
+        os.makedirs(STATE_DIR, exist_ok=True)
+        tmp_path = f"{CACHE_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, CACHE_FILE)
+
+
+def _key(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def probe(path):
+    """
+    Run ffprobe once and return validity, duration, video stream parameters and
+    keyframe times. Packets are only demuxed, not decoded.
+    """
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries",
+        "format=duration:stream=codec_name,profile,width,height,pix_fmt,r_frame_rate:packet=pts_time,flags",
+        "-of", "json", path
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    info = {"valid": False}
+    try:
+        data = json.loads(result.stdout or "{}")
+    except ValueError:
+        return info
+    streams = data.get("streams") or []
+    if result.returncode != 0 or not streams:
+        return info
+
+    stream = streams[0]
+    try:
+        duration = float(data.get("format", {}).get("duration", 0))
+    except ValueError:
+        duration = 0.0
+    keyframes = []
+    for packet in data.get("packets", []):
+        if "K" in packet.get("flags", "") and packet.get("pts_time") not in (None, "N/A"):
+            keyframes.append(round(float(packet["pts_time"]), 3))
+    info.update({
+        "valid": True,
+        "duration": duration,
+        "codec": stream.get("codec_name"),
+        "profile": stream.get("profile"),
+        "width": stream.get("width"),
+        "height": stream.get("height"),
+        "pix_fmt": stream.get("pix_fmt"),
+        "fps": stream.get("r_frame_rate"),
+        "keyframes": sorted(keyframes),
+    })
+    return info
+
+
+def get_many(paths, workers=MEDIA_PROBE_WORKERS):
+    """Return {path: info} for the given files, probing cache misses in parallel"""
+    results = {}
+    misses = []
+    with _lock:
+        cache = _load()
+        for path in paths:
+            try:
+                key = _key(path)
+            except OSError:
+                results[path] = {"valid": False}
+                continue
+            entry = cache.get(path)
+            if entry and (entry["size"], entry["mtime"]) == key:
+                results[path] = entry["info"]
+            else:
+                misses.append((path, key))
+
+    if not misses:
+        return results
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for (path, key), info in zip(misses, pool.map(lambda item: probe(item[0]), misses)):
+            results[path] = info
+            with _lock:
+                _load()[path] = {"size": key[0], "mtime": key[1], "info": info}
+    _save()
+    return results
+
+
+def get(path):
+    """Cached metadata of a single file"""
+    return get_many([path])[path]
+
+
+def forget(path):
+    """Drop a file from the cache, e.g. after it was rewritten in place"""
+    with _lock:
+        _load().pop(path, None)
@@ -2,25 +2,42 @@
 
 import os
 import datetime
+import logging
 import subprocess
-import requests
-from .config import VIDEO_DIR, MERGED_DIR, LOG_DIR, TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID
+from .config import (
+    VIDEO_DIR, MERGED_DIR, LOG_DIR,
+    camera_names, camera_video_dir, camera_merged_dir, MOTION_ANALYSIS,
+    SHOW_TIMESTAMP, TIMESTAMP_MODE, TIMESTAMP_BURN_ON_SEND, CAPTURE_PROFILE, PIPELINE_COMPRESS,
+    UPLOAD_MAX_MB, DELIVERY_MODE,
+)
 from .logger import setup_logger, notify_telegram
 from .locale import _
 from .notifications import check_storage_space, notify_file_sent
+from .encoder import encoder_args
+from .segments import read_sidecar, remove_sidecars, segment_start
+from . import budget, catalog, digest, journal, mediainfo, metrics, outbox, pipeline, sinks, timestamps
+from . import retention
 
-logger = setup_logger("merge_send", os.path.join(LOG_DIR, "merge_send.log"))
+# Handlers are attached by init()
+logger = logging.getLogger("merge_send")
 
-# Подготовка директорий
-os.makedirs(LOG_DIR, exist_ok=True)
-os.makedirs(MERGED_DIR, exist_ok=True)
+# Failed merges or compressions of a job before its segments are released
+MAX_JOB_ATTEMPTS = 3
+
+# Outputs of a merge run; without an unfinished job they are leftovers of a crash
+ORPHAN_PREFIXES = ("merged_", "compressed_", "static_", digest.PREFIX)
+ORPHAN_SUFFIXES = (".mp4", ".jpg", ".txt", ".srt")
+
+def init():
+    """Set up logging and directories; called by the entry points rather than at import"""
+    setup_logger("merge_send", os.path.join(LOG_DIR, "merge_send.log"))
+    # Подготовка директорий
+    os.makedirs(MERGED_DIR, exist_ok=True)
 
 def check_video_integrity(filepath):
-    """Check if video file is valid and playable"""
+    """Check if video file is valid and playable (cached per path, size and mtime)"""
     try:
-        cmd = ["ffprobe", "-v", "quiet", "-show_format", "-show_streams", filepath]
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        return result.returncode == 0
+        return mediainfo.get(filepath)["valid"]
     except Exception as e:
         logger.warning(f"⚠️ Error checking video integrity for {filepath}: {e}")
         return False
@@ -49,18 +66,26 @@ def try_repair_video(input_path, output_path):
         logger.warning(f"⚠️ Error during video repair: {e}")
         return False
 
-def get_video_files():
-    all_files = sorted([os.path.join(VIDEO_DIR, f) for f in os.listdir(VIDEO_DIR) if f.endswith(".mp4")])
+def get_video_files(video_dir=VIDEO_DIR, camera=""):
+    if not os.path.isdir(video_dir):
+        return [], []
+    # Segments still being recorded are hidden .recording files, every .mp4 here is closed
+    all_files = sorted([os.path.join(video_dir, f) for f in os.listdir(video_dir) if f.endswith(".mp4")])
     valid_files = []
     repaired_files = []
     
     logger.info(f"🔍 Checking {len(all_files)} video files for integrity...")
+    # Probe everything not seen before in one parallel pass
+    mediainfo.get_many(all_files)
     
     for filepath in all_files:
+        # Also catalogs segments written while no recorder updated the catalog
         if check_video_integrity(filepath):
             valid_files.append(filepath)
+            catalog.record_segment(filepath, camera, True, mediainfo.get(filepath).get("duration"))
             logger.debug(f"✅ Valid: {os.path.basename(filepath)}")
         else:
+            catalog.record_segment(filepath, camera, False)
             logger.warning(f"❌ Corrupted: {os.path.basename(filepath)}")
             # Try to repair the file
             repaired_path = filepath.replace(".mp4", "_repaired.mp4")
@@ -74,19 +99,32 @@ def get_video_files():
     logger.info(f"📊 Processing {len(valid_files)} valid videos ({len(repaired_files)} repaired)")
     return valid_files, repaired_files
 
+def timestamp_metadata_enabled():
+    """True when timestamps are carried as metadata instead of drawn at capture time"""
+    return SHOW_TIMESTAMP and TIMESTAMP_MODE == "metadata"
+
 def compress_video(input_path, output_path):
     logger.info(f"⚙️ Compressing file: {input_path}")
     cmd = [
         "ffmpeg",
         "-i", input_path,
-        "-vcodec", "libx264",
-        "-crf", "30",
-        "-preset", "veryfast",
+    ] + encoder_args("compress") + [
         "-acodec", "aac",
         "-b:a", "128k",
-        "-y",
-        output_path
     ]
+    # Cap the bitrate so the window fits the upload budget in as few parts as possible
+    parts, max_kbps = budget.plan(mediainfo.get(input_path).get("duration"))
+    if max_kbps:
+        cmd.extend(["-maxrate", f"{max_kbps}k", "-bufsize", f"{2 * max_kbps}k"])
+        logger.info(f"📏 Video bitrate capped at {max_kbps} kbps for {parts} part(s) of up to {UPLOAD_MAX_MB} MB")
+    if timestamp_metadata_enabled():
+        # Keep the timestamp track and, if requested, draw it on the clip being sent
+        cmd.extend(["-map", "0", "-c:s", "mov_text", "-map_metadata", "0"])
+        burn = timestamps.burn_filter(input_path) if TIMESTAMP_BURN_ON_SEND else None
+        if burn:
+            cmd.extend(["-vf", burn])
+            logger.info("📅 Burning timestamps into the sent clip")
+    cmd.extend(["-y", output_path])
     logger.debug(f"🛠️ Compression command: {' '.join(cmd)}")
     try:
         subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, check=True)
@@ -96,9 +134,50 @@ def compress_video(input_path, output_path):
         logger.error(_("merge_failed", e.output))
         return False
 
+def probe_video_stream(filepath):
+    """Parameters of the first video stream that must match for a stream-copy concat"""
+    info = mediainfo.get(filepath)
+    if not info["valid"]:
+        return None
+    return {key: info[key] for key in ("codec", "profile", "width", "height", "pix_fmt", "fps")}
+
+def is_delivery_ready(input_files):
+    """
+    True if the segments already have the final quality (recorded with
+    CAPTURE_PROFILE=delivery or compressed by the pipeline) and share the same
+    stream parameters, so the merged file can be sent without re-encoding
+    """
+    if timestamp_metadata_enabled() and TIMESTAMP_BURN_ON_SEND:
+        # Drawing the timestamps needs a re-encode anyway
+        return False
+    reference = None
+    for filepath in input_files:
+        if os.path.basename(filepath).startswith("static_"):
+            # Static segments were just re-encoded with the current settings
+            if CAPTURE_PROFILE != "delivery" and not PIPELINE_COMPRESS:
+                return False
+        else:
+            stats = read_sidecar(filepath, "capture")
+            recorded_final = stats and stats.get("profile") == "delivery"
+            if not recorded_final and not pipeline.is_compressed(filepath):
+                logger.debug(f"🐢 Not at delivery quality: {os.path.basename(filepath)}")
+                return False
+        stream = probe_video_stream(filepath)
+        if stream is None or stream["codec"] != "h264" or stream["pix_fmt"] != "yuv420p":
+            return False
+        if reference is None:
+            reference = stream
+        elif stream != reference:
+            logger.debug(f"🔀 Stream parameters differ: {os.path.basename(filepath)}")
+            return False
+    return reference is not None
+
 def merge_videos(input_files, output_path):
     logger.info(f"⚙️ " + _("merging_videos", len(input_files)))
-    list_file = os.path.join(VIDEO_DIR, "to_merge.txt")
+    # Named after the output, so concurrent merges of different jobs never share a list
+    list_file = os.path.splitext(output_path)[0] + ".txt"
+    srt_path = None
+    merged = False
     try:
         with open(list_file, "w") as f:
             for filepath in input_files:
@@ -110,89 +189,288 @@ def merge_videos(input_files, output_path):
             "-f", "concat",
             "-safe", "0",
             "-i", list_file,
-            "-c", "copy",
-            "-y",
-            output_path
         ]
+        if timestamp_metadata_enabled():
+            # Wall-clock time as a subtitle track plus creation_time of the first segment
+            srt_path = timestamps.subtitles_path(output_path)
+            started = timestamps.write_subtitles(input_files, srt_path)
+            cmd.extend(["-i", srt_path, "-map", "0", "-map", "1", "-c", "copy", "-c:s", "mov_text"])
+            if started:
+                cmd.extend(["-metadata", f"creation_time={timestamps.creation_time(started)}"])
+        else:
+            cmd.extend(["-c", "copy"])
+        cmd.extend(["-movflags", "+faststart", "-y", output_path])
         logger.debug(f"🛠️ Merge command: {' '.join(cmd)}")
         subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, check=True)
         logger.info(_("merge_completed", output_path))
-        os.remove(list_file)
+        merged = True
         return True
     except Exception as e:
         logger.exception(_("merge_failed", str(e)))
         notify_telegram(_("merge_failed", str(e)))
         return False
-
-def send_to_telegram(filepath):
-    logger.info(f"📤 Sending to Telegram: {filepath}")
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendVideo"
-    try:
-        with open(filepath, 'rb') as f:
-            response = requests.post(
-                url,
-                data={'chat_id': TELEGRAM_CHAT_ID},
-                files={'video': f}
-            )
-        logger.debug(f"📨 Telegram response: {response.status_code} — {response.text}")
-        if response.ok:
-            logger.info(_("telegram_sent", filepath))
-            return True
-        else:
-            logger.error(_("telegram_failed", response.text))
-            notify_telegram(_("telegram_failed", response.text))
-            return False
-    except Exception as e:
-        logger.exception(_("telegram_failed", str(e)))
-        return False
+    finally:
+        # The subtitles travel with a merged file; a failed merge leaves nothing behind
+        for leftover in [list_file] + ([] if merged or srt_path is None else [srt_path]):
+            if os.path.exists(leftover):
+                os.remove(leftover)
 
 def clean_files(file_list):
     logger.info(f"🧹 Cleaning {len(file_list)} temporary files...")
+    removed = []
     for f in file_list:
         try:
             os.remove(f)
+            remove_sidecars(f)
+            removed.append(f)
             logger.debug(f"🗑️ Deleted: {f}")
         except Exception as e:
             logger.warning(f"⚠️ Could not delete {f}: {e}")
+    catalog.update("removed", removed)
 
-def main():
-    logger.info(_("script_start"))
-    
-    # Check storage space before processing
-    if not check_storage_space():
-        logger.warning("Storage space low, but continuing with processing")
+def _orphan_owner(path):
+    """The video a merge list (merged_X.txt) or subtitle file (merged_X.mp4.timestamps.srt) belongs to"""
+    if path.endswith(".txt"):
+        return os.path.splitext(path)[0] + ".mp4"
+    if path.endswith(".srt"):
+        return path[:-len(".timestamps.srt")] if path.endswith(".timestamps.srt") else path
+    return path
+
+def remove_orphans(merged_dir, owned):
+    """Delete outputs of runs that died before their job was recorded"""
+    for filename in os.listdir(merged_dir):
+        path = os.path.join(merged_dir, filename)
+        if not os.path.exists(path):
+            # Already removed with the video it belonged to
+            continue
+        if (filename.startswith(ORPHAN_PREFIXES) and filename.endswith(ORPHAN_SUFFIXES)
+                and path not in owned and _orphan_owner(path) not in owned):
+            logger.info(f"🧹 Removing leftover from an interrupted run: {filename}")
+            clean_files([path])
+
+def fail_job(jobs, job, message):
+    """Count a failed stage and give up on the job after MAX_JOB_ATTEMPTS"""
+    logger.warning(message)
+    if jobs.record_failure(job) < MAX_JOB_ATTEMPTS:
+        return
+    logger.error(f"💥 Job {job['id']} failed {job['attempts']} times, releasing its segments")
+    jobs.abandon(job)
+    catalog.update("set_status", job["segments"], "recorded")
+    leftovers = [f for f in job["temp_files"] + [job["merged"], job["compressed"]] if os.path.exists(f)]
+    clean_files(list(dict.fromkeys(leftovers)))
+
+def part_captions(name, parts):
+    """Captions of an ordered series: "front (1/3)", "front (2/3)", ..."""
+    if len(parts) == 1:
+        return [name or None]
+    return [f"{name} ({index}/{len(parts)})".strip() for index in range(1, len(parts) + 1)]
+
+def run_job(jobs, box, job, name="", targets=("telegram",)):
+    """
+    Take a job from its recorded stage to the outbox and, once its uploads
+    are done, to the end. Each completed stage is journaled, so an interrupted
+    run resumes without redoing finished work.
+    """
+    merged_file, compressed_file = job["merged"], job["compressed"]
+
+    # Outputs can vanish between runs (retention, manual cleanup); redo only what is missing
+    queued = box.items(job["id"])
+    unsent = [item["path"] for item in queued if item["state"] != "sent"] if queued else job["parts"] or [compressed_file]
+    if job["stage"] == "compressed" and not all(os.path.exists(part) for part in unsent):
+        box.reset(job["id"])
+        job["stage"] = "merged"
+    if job["stage"] == "merged" and not os.path.exists(merged_file):
+        job["stage"] = "merging"
+
+    if job["stage"] == "merging":
+        if not merge_videos(job["inputs"], merged_file):
+            fail_job(jobs, job, _("merge_failed", os.path.basename(merged_file)))
+            return False
+        jobs.set_stage(job, "merged")
+
+    if job["stage"] == "merged" and DELIVERY_MODE == "digest":
+        # Keyframes only, no re-encode of the window; the merge is kept for retrieval
+        try:
+            parts = digest.build(merged_file, logger)
+        except subprocess.CalledProcessError as e:
+            fail_job(jobs, job, f"❌ Could not build the digest of {os.path.basename(merged_file)}: {e.output}")
+            return False
+        jobs.set_stage(job, "compressed", compressed=merged_file, parts=parts)
+
+    if job["stage"] == "merged":
+        if is_delivery_ready(job["inputs"]):
+            # Segments already have the final quality: send the stream-copied merge as is
+            logger.info("⏩ Segments already at delivery quality, skipping compression")
+            compressed_file = merged_file
+        elif not compress_video(merged_file, compressed_file):
+            fail_job(jobs, job, _("compression_failed_no_send"))
+            return False
+        try:
+            parts = budget.split_for_upload(compressed_file, logger)
+        except subprocess.CalledProcessError as e:
+            fail_job(jobs, job, f"❌ Could not split {os.path.basename(compressed_file)}: {e.output}")
+            return False
+        jobs.set_stage(job, "compressed", compressed=compressed_file, parts=parts)
+
+    if job["stage"] == "compressed":
+        # Parts are uploaded by the outbox; queuing twice is a no-op
+        parts = job["parts"] or [compressed_file]
+        for part in parts:
+            kind = "digest" if digest.is_digest(part) else "merged" if part == merged_file else "compressed"
+            catalog.update("record", part, name, kind, size=os.path.getsize(part), status="queued", job_id=job["id"])
+        captions = part_captions(name, parts)
+        if digest.is_digest(parts[0]):
+            # Sheets make one album in Telegram: a single caption, no "(1/3)" numbering
+            captions = [digest.caption(name, merged_file)] + [None] * (len(parts) - 1)
+        box.enqueue(job["id"], name, list(zip(parts, captions)), targets)
+
+    return finish_job(jobs, box, job)
+
+def finish_job(jobs, box, job):
+    """Clean up after a job whose parts have all been sent; True when the job is done"""
+    if job["stage"] == "compressed":
+        status = box.job_status(job["id"])
+        if status == "failed":
+            errors = [item["last_error"] for item in box.items(job["id"]) if item["state"] == "failed"]
+            jobs.set_stage(job, "failed")
+            catalog.update("set_status", job["parts"] or [job["compressed"]], "failed")
+            notify_telegram(_("telegram_failed", errors[0] if errors else job["compressed"]))
+            return False
+        if status != "sent":
+            return False
+        jobs.set_stage(job, "sent")
+        catalog.update("set_status", job["segments"] + (job["parts"] or [job["compressed"]]), "sent")
+
+    if job["stage"] == "sent":
+        if job["parts"] and digest.is_digest(job["parts"][0]):
+            # Only the digest went out; the window stays available on request
+            full = digest.keep_full(job["merged"], logger)
+            if os.path.exists(full):
+                started = segment_start(job["inputs"][0]) if job["inputs"] else None
+                catalog.update("record", full, job["camera"], "full", start=started.timestamp() if started else None,
+                               duration=mediainfo.get(full).get("duration"), size=os.path.getsize(full),
+                               job_id=job["id"])
+        # Clean up: original, repaired and static files plus the merged/compressed results
+        files_to_clean = job["segments"] + job["temp_files"] + job["parts"] + [job["merged"], job["compressed"]]
+        clean_files([f for f in dict.fromkeys(files_to_clean) if os.path.exists(f)])
+        jobs.set_stage(job, "done")
+    return job["stage"] == "done"
+
+def process_camera(jobs, box, name="", targets=("telegram",)):
+    """Merge and compress the pending segments of one camera and queue the result for sending"""
+    video_dir = camera_video_dir(name)
+    merged_dir = camera_merged_dir(name)
+    os.makedirs(merged_dir, exist_ok=True)
+    if name:
+        logger.info(f"📹 Processing camera: {name}")
+
+    # Finish what an interrupted or failed run left behind before starting anything new
+    for job in jobs.unfinished_jobs(name):
+        logger.info(f"♻️ Resuming job {job['id']} at stage: {job['stage']}")
+        run_job(jobs, box, job, name, targets)
+    owned = jobs.owned_paths(name)
+    remove_orphans(merged_dir, owned)
+
+    valid_files, repaired_files = get_video_files(video_dir, name)
+    valid_files = [f for f in valid_files if f not in owned]
+    repaired_files = [f for f in repaired_files if f not in owned]
+    if PIPELINE_COMPRESS:
+        # Leave segments that are still being compressed for the next run
+        valid_files, deferred = pipeline.split_ready(valid_files)
+        if deferred:
+            logger.info(f"⏳ {len(deferred)} segment(s) still compressing, deferred to the next run")
+    jobs.record_segments(name, valid_files, "validated")
     
-    valid_files, repaired_files = get_video_files()
+    merge_list, dropped_files, static_files = valid_files, [], []
+    if MOTION_ANALYSIS and valid_files:
+        from .motion import apply_static_policy
+        merge_list, dropped_files, static_files = apply_static_policy(valid_files, merged_dir)
+        if not merge_list and dropped_files:
+            # Nothing but an empty scene: nothing to send, the footage can go
+            clean_files([f for f in dropped_files if not f.endswith("_repaired.mp4")] + repaired_files)
+            return
     
-    if len(valid_files) < 2:
+    if len(merge_list) < 2:
         logger.warning(_("insufficient_files"))
+        if static_files:
+            clean_files(static_files)
         return
 
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    merged_file = os.path.join(MERGED_DIR, f"merged_{timestamp}.mp4")
-    compressed_file = os.path.join(MERGED_DIR, f"compressed_{timestamp}.mp4")
-
-    if merge_videos(valid_files, merged_file):
-        if compress_video(merged_file, compressed_file):
-            if send_to_telegram(compressed_file):
-                # Use enhanced notification
-                notify_file_sent(compressed_file)
-                # Clean up: remove original files and repaired files, keep merged/compressed
-                files_to_clean = [f for f in valid_files if not f.endswith("_repaired.mp4")] + repaired_files + [merged_file, compressed_file]
-                clean_files(files_to_clean)
-            else:
-                logger.warning(_("send_failed_keep_files"))
-        else:
-            logger.warning(_("compression_failed_no_send"))
-            # Clean up repaired files even if compression failed
-            if repaired_files:
-                clean_files(repaired_files)
-    else:
-        logger.warning(_("merge_failed"))
-        # Clean up repaired files even if merge failed
-        if repaired_files:
-            clean_files(repaired_files)
+    job = jobs.create_job(
+        name,
+        inputs=merge_list,
+        segments=[f for f in valid_files if not f.endswith("_repaired.mp4")],
+        temp_files=repaired_files + static_files,
+        merged=os.path.join(merged_dir, f"merged_{timestamp}.mp4"),
+        compressed=os.path.join(merged_dir, f"compressed_{timestamp}.mp4"),
+    )
+    catalog.update("set_status", job["segments"], "merged", job_id=job["id"])
+    run_job(jobs, box, job, name, targets)
 
+def deliver(jobs, box, targets):
+    """Drain the outbox to every sink in parallel and finish the jobs whose uploads are complete"""
+    def send(item):
+        sink = targets.get(item["sink"])
+        if sink is None:
+            raise outbox.SendError(f"delivery sink {item['sink']} is no longer configured", permanent=True)
+        sink.send(item["path"], item["caption"], item["camera"], logger)
+
+    def sent(item):
+        if item["sink"] == "telegram":
+            notify_file_sent(item["path"])
+
+    box.drain(send, logger, on_sent=sent)
+    for name in camera_names():
+        for job in jobs.unfinished_jobs(name):
+            if job["stage"] in ("compressed", "sent") and not finish_job(jobs, box, job):
+                if job["stage"] == "compressed":
+                    # Kept as is; the outbox retries the same files without re-encoding
+                    logger.warning(_("send_failed_keep_files"))
+
+def run(merge=True, enforce_retention=True):
+    """
+    One merge run: merge and compress the pending segments of every camera,
+    then drain the outbox. With merge=False only the outbox is drained.
+    """
+    if merge:
+        # Check storage space before processing
+        if not check_storage_space():
+            logger.warning("Storage space low, but continuing with processing")
+    
+    # Apply storage quotas before the backlog grows any further
+    if enforce_retention:
+        try:
+            retention.enforce(logger)
+        except Exception as e:
+            logger.warning(f"⚠️ Retention check failed: {e}")
+    
+    with journal.run_lock() as locked:
+        if not locked:
+            logger.warning("⏳ Another merge run is still in progress, skipping")
+            return
+        jobs = journal.Journal()
+        box = outbox.Outbox()
+        targets = sinks.get_sinks(logger)
+        try:
+            # Cameras are processed one after another; a failure of one does not stop the others
+            for name in camera_names() if merge else []:
+                try:
+                    process_camera(jobs, box, name, list(targets))
+                except Exception as e:
+                    logger.exception(f"❌ Processing failed for camera {name or 'default'}: {e}")
+            deliver(jobs, box, targets)
+            jobs.prune()
+            catalog.update("prune")
+        finally:
+            box.close()
+            jobs.close()
+            metrics.flush()
+
+def main():
+    init()
+    logger.info(_("script_start"))
+    run()
     logger.info(_("script_complete") + "\n")
 
 if __name__ == "__main__":
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Process metrics persisted across runs
+Метрики работы (state/metrics.json): счётчики накапливаются между запусками,
+для измерений хранятся количество, сумма, минимум, максимум и последнее значение
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+from .config import STATE_DIR
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+METRICS_FILE = os.path.join(STATE_DIR, "metrics.json")
+LOCK_FILE = os.path.join(STATE_DIR, "metrics.lock")
+
+_lock = threading.Lock()
+_counters = {}
+_observations = {}
+
+
+def increment(name, value=1):
+    """Add to a counter"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name, value):
+    """Record one measurement, e.g. a duration or a throughput"""
+    with _lock:
+        summary = _observations.setdefault(name, {"count": 0, "sum": 0.0, "min": value, "max": value})
+        summary["count"] += 1
+        summary["sum"] += value
+        summary["min"] = min(summary["min"], value)
+        summary["max"] = max(summary["max"], value)
+        summary["last"] = value
+
+
+def load():
+    """Metrics stored by previous flushes"""
+    try:
+        with open(METRICS_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"counters": {}, "observations": {}}
+
+
+@contextlib.contextmanager
+def _file_lock():
+    """
+    Exclusive lock on state/metrics.json across processes: capture and merge
+    flush concurrently and would otherwise overwrite each other's counters
+    """
+    os.makedirs(STATE_DIR, exist_ok=True)
+    with open(LOCK_FILE, "w") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def flush():
+    """Merge the metrics of this process into state/metrics.json and start over"""
+    with _lock:
+        if not _counters and not _observations:
+            return
+        counters, observations = dict(_counters), {k: dict(v) for k, v in _observations.items()}
+        _counters.clear()
+        _observations.clear()
+
+    with _file_lock():
+        stored = load()
+        for name, value in counters.items():
+            stored["counters"][name] = stored["counters"].get(name, 0) + value
+        for name, summary in observations.items():
+            previous = stored["observations"].get(name)
+            if previous:
+                summary = {
+                    "count": previous["count"] + summary["count"],
+                    "sum": previous["sum"] + summary["sum"],
+                    "min": min(previous["min"], summary["min"]),
+                    "max": max(previous["max"], summary["max"]),
+                    "last": summary["last"],
+                }
+            stored["observations"][name] = summary
+        stored["updated"] = time.time()
+
+        tmp_path = f"{METRICS_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(stored, f, indent=2)
+        os.replace(tmp_path, METRICS_FILE)
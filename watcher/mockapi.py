@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Local mock of the Telegram Bot API for testing uploads
+Локальная имитация Telegram Bot API для проверки отправки: ограничение частоты
+(429 с retry_after), случайные ошибки, предел размера и задержки ответа
+
+Usage: watcher-mockapi --port 8081 --rate-limit 5 --fail-rate 0.2
+       TELEGRAM_API_URL=http://127.0.0.1:8081 watcher-merge
+"""
+
+import argparse
+import email.parser
+import email.policy
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+
+class MockState:
+    """Settings and counters shared by all request handlers"""
+
+    def __init__(self, args):
+        self.args = args
+        self.lock = threading.Lock()
+        self.message_id = 0
+        self.window_start = time.monotonic()
+        self.window_count = 0
+        self.received = []
+
+    def next_message_id(self):
+        with self.lock:
+            self.message_id += 1
+            return self.message_id
+
+    def rate_limited(self):
+        """Seconds to wait if the per-minute request limit is exceeded, else None"""
+        if not self.args.rate_limit:
+            return None
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 60:
+                self.window_start, self.window_count = now, 0
+            self.window_count += 1
+            if self.window_count > self.args.rate_limit:
+                return self.args.retry_after or max(1, int(60 - (now - self.window_start)))
+        return None
+
+
+def read_body(handler):
+    """Request body with either Content-Length or chunked transfer encoding"""
+    if handler.headers.get("Transfer-Encoding", "").lower() == "chunked":
+        chunks = []
+        while True:
+            size = int(handler.rfile.readline().split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                # Trailer section ends with an empty line
+                while handler.rfile.readline() not in (b"\r\n", b"\n", b""):
+                    pass
+                break
+            chunks.append(handler.rfile.read(size))
+            handler.rfile.readline()
+        return b"".join(chunks)
+    return handler.rfile.read(int(handler.headers.get("Content-Length", 0)))
+
+
+def parse_form(content_type, body):
+    """Return (fields, files) of a multipart or urlencoded form; files map name -> (filename, bytes)"""
+    fields, files = {}, {}
+    if content_type.startswith("multipart/form-data"):
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body
+        )
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            filename = part.get_filename()
+            payload = part.get_payload(decode=True) or b""
+            if filename:
+                files[name] = (filename, payload)
+            else:
+                fields[name] = payload.decode(errors="replace")
+    elif body:
+        fields = dict(parse_qsl(body.decode(errors="replace")))
+    return fields, files
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        args = self.state.args
+        parts = self.path.strip("/").split("/")
+        method = parts[-1] if len(parts) == 2 and parts[0].startswith("bot") else None
+        body = read_body(self)
+        if method is None:
+            return self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+
+        if args.delay:
+            time.sleep(args.delay)
+        retry_after = self.state.rate_limited()
+        if retry_after:
+            return self._reply(429, {
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {retry_after}",
+                "parameters": {"retry_after": retry_after},
+            })
+        if len(body) > args.max_mb * 1024 * 1024:
+            return self._reply(413, {"ok": False, "error_code": 413, "description": "Request Entity Too Large"})
+        if random.random() < args.fail_rate:
+            return self._reply(500, {"ok": False, "error_code": 500, "description": "Internal Server Error"})
+
+        fields, files = parse_form(self.headers.get("Content-Type", ""), body)
+        if args.save_dir:
+            os.makedirs(args.save_dir, exist_ok=True)
+            for filename, payload in files.values():
+                with open(os.path.join(args.save_dir, f"{time.time():.3f}_{os.path.basename(filename)}"), "wb") as f:
+                    f.write(payload)
+        self.state.received.append({"method": method, "fields": fields,
+                                    "files": {k: (v[0], len(v[1])) for k, v in files.items()}})
+        self._reply(200, {"ok": True, "result": {
+            "message_id": self.state.next_message_id(),
+            "date": int(time.time()),
+            "chat": {"id": fields.get("chat_id")},
+            "caption": fields.get("caption"),
+        }})
+
+    def log_message(self, fmt, *args):
+        print(f"🧪 {self.address_string()} {fmt % args}")
+
+
+def serve(args):
+    """Start the mock server in the current thread"""
+    MockHandler.state = MockState(args)
+    server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+    print(f"🧪 Mock Bot API on http://{args.host}:{server.server_port} "
+          f"(rate limit {args.rate_limit or 'off'}/min, fail rate {args.fail_rate:.0%}, max {args.max_mb} MB)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    """watcher-mockapi: local Bot API stand-in"""
+    parser = argparse.ArgumentParser(description="Mock Telegram Bot API server for testing uploads")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--rate-limit", type=int, default=0, help="requests per minute before answering 429")
+    parser.add_argument("--retry-after", type=int, default=0, help="retry_after in 429 answers (default: rest of the minute)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--max-mb", type=float, default=50, help="largest accepted request body")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before answering")
+    parser.add_argument("--save-dir", default=None, help="store uploaded files here")
+    serve(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Motion scoring for captured segments
+Оценка движения в сегментах: кадры низкого разрешения из ffmpeg и разность кадров в NumPy
+"""
+
+import logging
+import os
+import subprocess
+import sys
+import numpy as np
+from .config import (
+    LOG_DIR, MOTION_FPS, MOTION_THRESHOLD, MOTION_PIXEL_THRESHOLD,
+    MOTION_STATIC_ACTION, MOTION_STATIC_CRF, MOTION_TIMELAPSE_FACTOR, FPS, PIPELINE_COMPRESS, CAPTURE_PROFILE,
+    camera_names, camera_video_dir,
+)
+from .encoder import encoder_args
+from .logger import setup_logger
+from .segments import read_sidecar, write_sidecar
+
+# Shares the merge log; handlers are attached by the entry point
+logger = logging.getLogger("merge_send")
+
+# Analysis frame size; the aspect ratio does not matter for frame differences
+WIDTH = 160
+HEIGHT = 90
+
+SIDECAR = "motion"
+
+
+def decode_frames(path):
+    """
+    Decode the segment to small grayscale frames through an ffmpeg rawvideo
+    pipe, yielding them one at a time as they are read
+    """
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-i", path,
+        "-an",
+        "-vf", f"fps={MOTION_FPS},scale={WIDTH}:{HEIGHT},format=gray",
+        "-f", "rawvideo",
+        "-pix_fmt", "gray",
+        "-"
+    ]
+    frame_size = WIDTH * HEIGHT
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while True:
+            data = process.stdout.read(frame_size)
+            if len(data) < frame_size:
+                # End of stream; a trailing partial frame is dropped
+                break
+            yield np.frombuffer(data, dtype=np.uint8).reshape(HEIGHT, WIDTH)
+        # -loglevel error keeps stderr small, it cannot fill the pipe meanwhile
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            raise subprocess.CalledProcessError(process.returncode, cmd, stderr=stderr)
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+
+def score_frames(frames):
+    """
+    Fraction of pixels that changed noticeably between consecutive frames,
+    scored as the frames arrive so only the previous one is kept in memory.
+    Returns one value per frame pair; small sensor noise is ignored.
+    """
+    scores = []
+    previous = None
+    for frame in frames:
+        frame = frame.astype(np.int16)
+        if previous is not None:
+            scores.append((np.abs(frame - previous) > MOTION_PIXEL_THRESHOLD).mean())
+        previous = frame
+    return np.array(scores)
+
+
+def analyse_segment(path):
+    """Return the motion score of a segment, computing and storing it if needed"""
+    stored = read_sidecar(path, SIDECAR)
+    if stored and stored.get("mtime") == os.path.getmtime(path):
+        return stored
+
+    timeline = score_frames(decode_frames(path))
+    result = {
+        "score": round(float(timeline.max()), 5) if timeline.size else 0.0,
+        "mean": round(float(timeline.mean()), 5) if timeline.size else 0.0,
+        "fps": MOTION_FPS,
+        "timeline": [round(float(value), 5) for value in timeline],
+        "mtime": os.path.getmtime(path),
+    }
+    write_sidecar(path, SIDECAR, result)
+    logger.debug(f"🏃 Motion score {result['score']:.4f}: {os.path.basename(path)}")
+    return result
+
+
+def is_static(path):
+    """True if the segment has no motion above MOTION_THRESHOLD (unreadable counts as motion)"""
+    try:
+        return analyse_segment(path)["score"] < MOTION_THRESHOLD
+    except Exception as e:
+        logger.warning(f"⚠️ Motion analysis failed for {os.path.basename(path)}: {e}")
+        return False
+
+
+def reduce_segment(input_path, output_path):
+    """
+    Shrink a static segment by re-encoding it at a high CRF or as a time-lapse.
+    The encoder settings of the segments are reused (compress settings when the
+    pipeline compresses them) so the result still concatenates with the other
+    segments by stream copy.
+    """
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", input_path, "-an"]
+    if MOTION_STATIC_ACTION == "timelapse":
+        cmd.extend(["-vf", f"setpts=PTS/{MOTION_TIMELAPSE_FACTOR}", "-r", str(FPS)])
+    if PIPELINE_COMPRESS and CAPTURE_PROFILE != "delivery":
+        cmd.extend(encoder_args("compress") + ["-pix_fmt", "yuv420p"])
+    else:
+        cmd.extend(encoder_args("capture"))
+    cmd.extend(["-crf", str(MOTION_STATIC_CRF), "-y", output_path])
+    try:
+        subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+        return True
+    except subprocess.CalledProcessError as e:
+        logger.warning(f"⚠️ Could not reduce static segment {os.path.basename(input_path)}: {e.stderr.strip()[-200:]}")
+        return False
+
+
+def apply_static_policy(files, work_dir):
+    """
+    Apply MOTION_STATIC_ACTION to the segments about to be merged.
+    Returns (files to merge, static segments left out, temporary files created).
+    """
+    merge_list = []
+    dropped = []
+    temp_files = []
+    for path in files:
+        if MOTION_STATIC_ACTION == "keep" or not is_static(path):
+            merge_list.append(path)
+        elif MOTION_STATIC_ACTION == "drop":
+            dropped.append(path)
+        else:
+            reduced_path = os.path.join(work_dir, "static_" + os.path.basename(path))
+            if reduce_segment(path, reduced_path):
+                merge_list.append(reduced_path)
+                temp_files.append(reduced_path)
+            else:
+                merge_list.append(path)
+
+    static_count = len(dropped) + len(temp_files)
+    logger.info(f"🏃 Motion analysis: {static_count} of {len(files)} segments static ({MOTION_STATIC_ACTION})")
+    return merge_list, dropped, temp_files
+
+
+def analyse_directory(video_dir):
+    """Score every segment in the directory that has no score yet"""
+    if not os.path.isdir(video_dir):
+        return
+    for name in sorted(os.listdir(video_dir)):
+        if name.endswith(".mp4"):
+            path = os.path.join(video_dir, name)
+            try:
+                analyse_segment(path)
+            except Exception as e:
+                logger.warning(f"⚠️ Motion analysis failed for {name}: {e}")
+
+
+def main():
+    """Print motion scores of the given files, or score all pending segments"""
+    setup_logger("merge_send", os.path.join(LOG_DIR, "merge_send.log"))
+    if len(sys.argv) > 1:
+        for path in sys.argv[1:]:
+            result = analyse_segment(path)
+            label = "static" if result["score"] < MOTION_THRESHOLD else "motion"
+            print(f"{os.path.basename(path)}: score={result['score']:.4f} mean={result['mean']:.4f} ({label})")
+    else:
+        for name in camera_names():
+            analyse_directory(camera_video_dir(name))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Streaming multipart/form-data bodies
+Потоковое формирование multipart-запроса: файл читается блоками, поэтому память
+не зависит от размера файла; ход отправки и скорость пишутся в лог и метрики
+"""
+
+import os
+import time
+import uuid
+from . import metrics
+
+CHUNK_SIZE = 64 * 1024
+
+# How often an upload in progress is logged, in seconds
+PROGRESS_INTERVAL = 5
+
+
+class UploadProgress:
+    """
+    Counts bytes handed to the socket and reports progress and throughput.
+    Metrics are named <prefix>_bytes_total, <prefix>_seconds and so on.
+    """
+
+    def __init__(self, label, logger, total, interval=PROGRESS_INTERVAL, prefix="upload"):
+        self.label = label
+        self.prefix = prefix
+        self.logger = logger
+        self.total = total
+        self.interval = interval
+        self.sent = 0
+        self.started = time.monotonic()
+        self._last_report = self.started
+
+    def update(self, count):
+        self.sent += count
+        now = time.monotonic()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            self.logger.info(
+                f"📶 {self.label}: {self.sent / 1048576:.1f}/{self.total / 1048576:.1f} MB "
+                f"({self.sent * 100 // max(1, self.total)}%), {self.throughput() / 1048576:.2f} MB/s"
+            )
+
+    def throughput(self):
+        """Bytes per second so far"""
+        return self.sent / max(time.monotonic() - self.started, 1e-6)
+
+    def finish(self, ok):
+        """Record the attempt in the metrics; bytes of failed attempts are counted too"""
+        elapsed = time.monotonic() - self.started
+        metrics.increment(f"{self.prefix}_bytes_total", self.sent)
+        metrics.increment(f"{self.prefix}s_total" if ok else f"{self.prefix}_failures_total")
+        if ok:
+            metrics.observe(f"{self.prefix}_seconds", round(elapsed, 3))
+            metrics.observe(f"{self.prefix}_throughput_bps", round(self.throughput()))
+            self.logger.info(
+                f"📶 {self.label}: {self.sent / 1048576:.1f} MB in {elapsed:.1f}s "
+                f"({self.throughput() / 1048576:.2f} MB/s)"
+            )
+
+
+class MultipartStream:
+    """
+    Iterable multipart/form-data body with a known length. requests sends it
+    with a Content-Length header and pulls CHUNK_SIZE pieces as the socket
+    accepts them, so only one chunk of a file is in memory at a time.
+
+    files is a list of (field name, path, content type).
+    """
+
+    def __init__(self, fields, files, progress=None):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self.progress = progress
+        self._parts = []
+        for name, value in fields.items():
+            header = (
+                f"--{self.boundary}\r\n"
+                f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+            ).encode()
+            self._parts.append((header + str(value).encode() + b"\r\n", None))
+        for name, path, content_type in files:
+            header = (
+                f"--{self.boundary}\r\n"
+                f'Content-Disposition: form-data; name="{name}"; filename="{os.path.basename(path)}"\r\n'
+                f"Content-Type: {content_type}\r\n\r\n"
+            ).encode()
+            self._parts.append((header, path))
+            self._parts.append((b"\r\n", None))
+        self._parts.append((f"--{self.boundary}--\r\n".encode(), None))
+        self.length = sum(len(data) if path is None else len(data) + os.path.getsize(path)
+                          for data, path in self._parts)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for data, path in self._parts:
+            yield self._count(data)
+            if path is not None:
+                with open(path, "rb") as f:
+                    while True:
+                        chunk = f.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        yield self._count(chunk)
+
+    def _count(self, chunk):
+        if self.progress:
+            self.progress.update(len(chunk))
+        return chunk
+
+
+class FileStream:
+    """
+    Iterable body with a known length for length bytes of a file starting at
+    offset (the whole file by default), read CHUNK_SIZE at a time
+    """
+
+    def __init__(self, path, offset=0, length=None, progress=None):
+        self.path = path
+        self.offset = offset
+        self.length = os.path.getsize(path) - offset if length is None else length
+        self.progress = progress
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        remaining = self.length
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                if self.progress:
+                    self.progress.update(len(chunk))
+                yield chunk
@@ -11,9 +11,10 @@ from .locale import _
 from .logger import notify_telegram
 
 def check_storage_space(threshold=10):
-    """Check available storage space and warn if low"""
+    """Check available space on the volume that holds the videos and warn if low"""
+    from .config import VIDEO_DIR, BASE_DIR
     try:
-        total, used, free = shutil.disk_usage("/")
+        total, used, free = shutil.disk_usage(VIDEO_DIR if os.path.isdir(VIDEO_DIR) else BASE_DIR)
         free_percent = (free / total) * 100
         
         if free_percent < threshold:
@@ -32,10 +33,11 @@ def get_file_size_mb(filepath):
 
 def notify_file_sent(filepath):
     """Notify about successful file send with size info"""
+    from .config import UPLOAD_MAX_MB
     file_size = get_file_size_mb(filepath)
     filename = os.path.basename(filepath)
     
-    if file_size > 50:  # Large file warning
+    if file_size > UPLOAD_MAX_MB:  # Large file warning
         notify_telegram(_("large_file_warning", file_size))
     
     notify_telegram(_("telegram_sent", filename))
@@ -55,20 +57,13 @@ def notify_camera_reconnected():
 def daily_summary():
     """Send daily summary of activity"""
     try:
-        from .config import VIDEO_DIR, MERGED_DIR
+        from .catalog import get_catalog
         
-        # Count files created today
-        today = datetime.now().strftime("%Y%m%d")
-        
-        video_count = 0
-        if os.path.exists(VIDEO_DIR):
-            video_count = len([f for f in os.listdir(VIDEO_DIR) 
-                             if f.startswith(f"video_{today}") and f.endswith(".mp4")])
-        
-        sent_count = 0
-        if os.path.exists(MERGED_DIR):
-            sent_count = len([f for f in os.listdir(MERGED_DIR) 
-                            if f.startswith(f"compressed_{today}") and f.endswith(".mp4")])
+        # Segments recorded and files sent since midnight, including those already deleted
+        midnight = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        totals = get_catalog().totals(midnight.timestamp()).values()
+        video_count = sum(entry["segments"] for entry in totals)
+        sent_count = sum(entry["sent"] for entry in totals)
         
         if video_count > 0 or sent_count > 0:
             notify_telegram(_("daily_summary", video_count, sent_count))
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Durable upload outbox
+Очередь отправки (SQLite): подготовленные файлы хранятся с числом попыток и
+временем следующей попытки отдельно для каждого приёмника; отправка повторяется
+с экспоненциальной задержкой и учётом retry_after из ответов 429
+"""
+
+import random
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from .config import OUTBOX_CONCURRENCY, OUTBOX_ORDER, OUTBOX_BACKOFF_MIN, OUTBOX_BACKOFF_MAX
+from .journal import JOURNAL_FILE
+from . import metrics
+
+# A run waits this long for an item whose retry time is close instead of
+# leaving it to the next run
+MAX_WAIT = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id INTEGER NOT NULL,
+    camera TEXT NOT NULL,
+    path TEXT NOT NULL,
+    caption TEXT,
+    sink TEXT NOT NULL DEFAULT 'telegram',
+    part_index INTEGER NOT NULL,
+    part_count INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created REAL NOT NULL,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_job ON outbox(job_id);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox(state, next_attempt);
+"""
+
+# Columns added after the first release: name -> definition
+MIGRATIONS = {
+    "sink": "TEXT NOT NULL DEFAULT 'telegram'",
+}
+
+
+class SendError(Exception):
+    """Upload failure; retry_after comes from a 429 response, permanent means do not retry"""
+
+    def __init__(self, message, retry_after=None, permanent=False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.permanent = permanent
+
+
+def backoff(attempts):
+    """Delay before the next attempt after the given number of failures"""
+    delay = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_MIN * 2 ** max(0, attempts - 1))
+    # Jitter keeps several cameras from retrying in lockstep
+    return delay * random.uniform(0.8, 1.2)
+
+
+class Outbox:
+    """Files waiting to be uploaded, one row per part and sink, stored next to the merge journal"""
+
+    def __init__(self, path=JOURNAL_FILE):
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+        columns = {row["name"] for row in self.db.execute("PRAGMA table_info(outbox)")}
+        with self.db:
+            for name, definition in MIGRATIONS.items():
+                if name not in columns:
+                    self.db.execute(f"ALTER TABLE outbox ADD COLUMN {name} {definition}")
+
+    def close(self):
+        self.db.close()
+
+    def enqueue(self, job_id, camera, files, sinks=("telegram",)):
+        """
+        Queue the (path, caption) parts of a job in order for every sink; does
+        nothing if already queued
+        """
+        if self.items(job_id):
+            return
+        now = time.time()
+        with self.db:
+            for sink in sinks:
+                for index, (path, caption) in enumerate(files):
+                    self.db.execute(
+                        "INSERT INTO outbox (job_id, camera, path, caption, sink, part_index, part_count, created) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (job_id, camera, path, caption, sink, index, len(files), now)
+                    )
+
+    def items(self, job_id):
+        rows = self.db.execute("SELECT * FROM outbox WHERE job_id = ? ORDER BY sink, part_index", (job_id,))
+        return [dict(row) for row in rows]
+
+    def reset(self, job_id):
+        """Forget the queued parts of a job, e.g. when they have to be produced again"""
+        with self.db:
+            self.db.execute("DELETE FROM outbox WHERE job_id = ?", (job_id,))
+
+    def job_status(self, job_id):
+        """"sent" when every part reached every sink, "failed" if one was rejected, else "pending" """
+        states = {item["state"] for item in self.items(job_id)}
+        if not states:
+            return "pending"
+        if "failed" in states:
+            return "failed"
+        return "sent" if states == {"sent"} else "pending"
+
+    def backlog(self):
+        """Number of parts still waiting to be sent"""
+        return self.db.execute("SELECT COUNT(*) FROM outbox WHERE state = 'pending'").fetchone()[0]
+
+    def pending_paths(self):
+        """Files that still have to go out to some sink"""
+        return {row[0] for row in self.db.execute("SELECT DISTINCT path FROM outbox WHERE state = 'pending'")}
+
+    def pending_sinks(self):
+        return [row[0] for row in self.db.execute("SELECT DISTINCT sink FROM outbox WHERE state = 'pending'")]
+
+    def due(self, limit, sink, now=None):
+        """
+        Parts that may be sent to the sink now. Parts of a series go out to each
+        sink strictly in order; across jobs OUTBOX_ORDER decides whether the
+        oldest or newest go first.
+        """
+        direction = "DESC" if OUTBOX_ORDER == "newest" else "ASC"
+        rows = self.db.execute(
+            "SELECT * FROM outbox o WHERE o.state = 'pending' AND o.sink = ? AND o.next_attempt <= ? "
+            "AND NOT EXISTS (SELECT 1 FROM outbox p WHERE p.job_id = o.job_id AND p.sink = o.sink "
+            "AND p.part_index < o.part_index AND p.state != 'sent') "
+            f"ORDER BY o.created {direction}, o.job_id {direction}, o.part_index LIMIT ?",
+            (sink, now or time.time(), limit)
+        )
+        return [dict(row) for row in rows]
+
+    def next_retry(self):
+        """Seconds until the earliest pending retry, or None if nothing can be sent any more"""
+        # Only the head of each series counts, as in due(): the parts behind it wait
+        # for it whatever their own retry time, and never go out if it was rejected
+        row = self.db.execute(
+            "SELECT MIN(o.next_attempt) FROM outbox o WHERE o.state = 'pending' "
+            "AND NOT EXISTS (SELECT 1 FROM outbox p WHERE p.job_id = o.job_id AND p.sink = o.sink "
+            "AND p.part_index < o.part_index AND p.state != 'sent')"
+        ).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def _update(self, item_id, **fields):
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self.db:
+            self.db.execute(f"UPDATE outbox SET {assignments} WHERE id = ?", tuple(fields.values()) + (item_id,))
+
+    def drain(self, send, logger, on_sent=None, concurrency=OUTBOX_CONCURRENCY, max_wait=MAX_WAIT):
+        """
+        Upload due parts with send(item), which raises SendError on failure,
+        until nothing is due within max_wait seconds. Every sink gets up to
+        concurrency uploads at once and a slow sink does not hold back the
+        others. Returns the number of parts sent.
+        """
+        def attempt(item):
+            try:
+                send(item)
+                return None
+            except SendError as e:
+                return e
+            except Exception as e:
+                return SendError(str(e))
+
+        concurrency = max(1, concurrency)
+        sent = 0
+        in_flight = {}  # future -> item
+        with ThreadPoolExecutor(max_workers=concurrency * max(1, len(self.pending_sinks()))) as pool:
+            while True:
+                # Top every sink up to its share of the workers
+                busy = [item["id"] for item in in_flight.values()]
+                for sink in self.pending_sinks():
+                    running = sum(1 for item in in_flight.values() if item["sink"] == sink)
+                    batch = [item for item in self.due(concurrency, sink) if item["id"] not in busy]
+                    for item in batch[:concurrency - running]:
+                        in_flight[pool.submit(attempt, item)] = item
+
+                if not in_flight:
+                    delay = self.next_retry()
+                    if delay is None or delay > max_wait:
+                        break
+                    time.sleep(delay)
+                    continue
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = in_flight.pop(future)
+                    sent += self._record(item, future.result(), logger, on_sent)
+
+        backlog = self.backlog()
+        if backlog:
+            logger.info(f"📮 {backlog} upload(s) waiting in the outbox")
+        return sent
+
+    def _record(self, item, error, logger, on_sent):
+        """Store the outcome of one attempt; returns 1 if the part was sent"""
+        attempts = item["attempts"] + 1
+        sink = item["sink"]
+        if error is None:
+            self._update(item["id"], state="sent", attempts=attempts, sent_at=time.time(), last_error=None)
+            metrics.increment(f"outbox_{sink}_sent_total")
+            if on_sent:
+                on_sent(item)
+            return 1
+        if error.permanent:
+            self._update(item["id"], state="failed", attempts=attempts, last_error=str(error))
+            metrics.increment(f"outbox_{sink}_failed_total")
+            logger.error(f"💥 Upload to {sink} rejected, giving up on {item['path']}: {error}")
+        else:
+            delay = error.retry_after if error.retry_after is not None else backoff(attempts)
+            self._update(item["id"], attempts=attempts, next_attempt=time.time() + delay, last_error=str(error))
+            metrics.increment(f"outbox_{sink}_retries_total")
+            logger.warning(f"🔁 Upload to {sink} failed ({error}), retry {attempts} in {delay:.0f}s: {item['path']}")
+        return 0
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Background per-segment compression for continuous capture
+Сжатие каждого сегмента в фоне сразу после его закрытия (с низким приоритетом),
+чтобы периодическое объединение сводилось к копированию потоков
+"""
+
+import os
+import queue
+import subprocess
+import threading
+import time
+from .config import PIPELINE_NICE, SEGMENT_DURATION
+from .encoder import encoder_args
+from .progress import limited_command
+from .segments import read_sidecar, segment_start, write_sidecar, SEGMENT_NAME
+from . import catalog
+
+# A closed segment is normally compressed within this time; younger segments
+# that are not compressed yet are left for the next merge
+GRACE_SECONDS = 120
+
+
+def is_compressed(path):
+    """
+    True if the segment was already re-encoded by the pipeline. The sidecar is
+    written before the compressed file replaces the segment, so it only counts
+    once the file on disk has the size it records.
+    """
+    info = read_sidecar(path, "pipeline")
+    if not (info and info.get("compressed")):
+        return False
+    try:
+        return info.get("bytes") is None or os.path.getsize(path) == info["bytes"]
+    except OSError:
+        return False
+
+
+def split_ready(paths, now=None):
+    """
+    Split segments into (ready to merge, deferred). Segments that closed less
+    than GRACE_SECONDS ago and are still being compressed are deferred.
+    """
+    now = now or time.time()
+    ready, deferred = [], []
+    for path in paths:
+        started = segment_start(path)
+        recent = started is not None and now < started.timestamp() + SEGMENT_DURATION + GRACE_SECONDS
+        if recent and not path.endswith("_repaired.mp4") and not is_compressed(path):
+            deferred.append(path)
+        else:
+            ready.append(path)
+    return ready, deferred
+
+
+class SegmentCompressor:
+    """
+    Re-encodes closed segments in place with the compress settings, one at a
+    time on a worker thread, with ffmpeg running at PIPELINE_NICE niceness.
+    """
+
+    def __init__(self, name, logger, video_dir):
+        self.name = name
+        self.label = name or "camera"
+        self.logger = logger
+        self.video_dir = video_dir
+        self._queue = queue.Queue()
+        self._stopping = threading.Event()
+        self._process = None
+        self._worker = threading.Thread(target=self._run, name=f"compress-{self.label}", daemon=True)
+        self._load()
+        self._worker.start()
+
+    def _load(self):
+        """Queue segments a previous run did not get to and drop its partial outputs"""
+        if not os.path.isdir(self.video_dir):
+            return
+        for name in sorted(os.listdir(self.video_dir)):
+            path = os.path.join(self.video_dir, name)
+            if name.startswith(".") and name.endswith(".part"):
+                os.remove(path)
+            elif (name.endswith(".mp4") and SEGMENT_NAME.match(name) and not name.endswith("_repaired.mp4")
+                  and not is_compressed(path)):
+                self._queue.put(path)
+
+    def add(self, path):
+        """Hand over a segment that was closed in (or promoted to) the video directory"""
+        self._queue.put(path)
+
+    def close(self, timeout=5):
+        """Stop after the current segment; the rest is picked up on the next start"""
+        self._stopping.set()
+        process = self._process
+        if process and process.poll() is None:
+            process.terminate()
+        self._queue.put(None)
+        self._worker.join(timeout=timeout)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            path = self._queue.get()
+            if path is None:
+                break
+            try:
+                self._compress(path)
+            except Exception as e:
+                self.logger.warning(f"⚠️ [{self.label}] Could not compress {os.path.basename(path)}: {e}")
+
+    def _compress(self, path):
+        if not os.path.exists(path) or is_compressed(path):
+            return
+        name = os.path.basename(path)
+        tmp_path = os.path.join(os.path.dirname(path), f".{name}.part")
+        cmd = limited_command([
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-i", path,
+        ] + encoder_args("compress") + [
+            "-pix_fmt", "yuv420p",
+            "-acodec", "aac",
+            "-b:a", "128k",
+            "-movflags", "+faststart",
+            "-f", "mp4",
+            "-y", tmp_path,
+        ], PIPELINE_NICE)
+        source_bytes = os.path.getsize(path)
+        started = time.monotonic()
+        self._process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+        _, stderr = self._process.communicate()
+        returncode = self._process.returncode
+        self._process = None
+
+        if returncode != 0 or self._stopping.is_set():
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            if not self._stopping.is_set():
+                self.logger.warning(f"⚠️ [{self.label}] Compression failed for {name}: {stderr.strip()[-200:]}")
+            return
+        if not os.path.exists(path):
+            # Deleted meanwhile (sent, evicted or removed by retention)
+            os.remove(tmp_path)
+            return
+
+        compressed_bytes = os.path.getsize(tmp_path)
+        elapsed = time.monotonic() - started
+        # Sidecar first: a merge never sees the compressed file without it, and
+        # is_compressed() ignores it until the file below is in place
+        write_sidecar(path, "pipeline", {
+            "compressed": True,
+            "source_bytes": source_bytes,
+            "bytes": compressed_bytes,
+            "encode_seconds": round(elapsed, 2),
+        })
+        os.replace(tmp_path, path)
+        catalog.update("record", path, self.name, "segment", size=compressed_bytes)
+        self.logger.info(
+            f"🗜️ [{self.label}] Compressed {name}: {source_bytes / 1048576:.1f} → "
+            f"{compressed_bytes / 1048576:.1f} MB in {elapsed:.1f}s"
+        )
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Live ffmpeg progress tracking
+Разбор потока -progress ffmpeg в реальном времени: кадры, fps, пропуски, битрейт, скорость
+"""
+
+import collections
+import os
+import threading
+import time
+from .config import FPS, CAPTURE_STALL_TIMEOUT, CAPTURE_MIN_SPEED
+
+# Progress blocks are emitted every -stats_period (0.5 s by default); ignore
+# the speed of the first seconds while the device and encoder warm up
+WARMUP_SECONDS = 5
+
+
+def _number(value, default=0.0):
+    try:
+        return float(str(value).rstrip("x").replace("kbits/s", ""))
+    except ValueError:
+        return default
+
+
+class ProgressMonitor:
+    """Accumulates key=value lines from `ffmpeg -progress` into live statistics"""
+
+    def __init__(self, label, logger, expected_fps=FPS):
+        self.label = label
+        self.logger = logger
+        self.expected_fps = expected_fps
+        self.started = time.monotonic()
+        self.last_frame_change = self.started
+        self.stats = {
+            "frame": 0,
+            "fps": 0.0,
+            "drop_frames": 0,
+            "dup_frames": 0,
+            "bitrate_kbps": 0.0,
+            "speed": 0.0,
+            "out_time": 0.0,
+            "progress": None,
+        }
+        self.blocks = 0
+        self.slow = False
+        self.stalled = False
+        self._block = {}
+
+    def feed(self, line):
+        """Consume one line; returns True when a complete progress block was applied"""
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return False
+        self._block[key] = value
+        if key != "progress":
+            return False
+        self._apply(self._block)
+        self._block = {}
+        return True
+
+    def _apply(self, block):
+        frame = int(_number(block.get("frame"), self.stats["frame"]))
+        now = time.monotonic()
+        if frame > self.stats["frame"]:
+            self.last_frame_change = now
+            if self.stalled:
+                self.stalled = False
+                self.logger.info(f"✅ [{self.label}] Camera delivers frames again")
+        self.stats.update({
+            "frame": frame,
+            "fps": _number(block.get("fps"), self.stats["fps"]),
+            "drop_frames": int(_number(block.get("drop_frames"), self.stats["drop_frames"])),
+            "dup_frames": int(_number(block.get("dup_frames"), self.stats["dup_frames"])),
+            "bitrate_kbps": _number(block.get("bitrate"), self.stats["bitrate_kbps"]),
+            "speed": _number(block.get("speed"), self.stats["speed"]),
+            "out_time": _number(block.get("out_time_us"), 0) / 1000000 or self.stats["out_time"],
+            "progress": block.get("progress"),
+        })
+        self.blocks += 1
+        self._check_speed(now)
+
+    def _check_speed(self, now):
+        if now - self.started < WARMUP_SECONDS or not self.expected_fps:
+            return
+        slow = self.stats["fps"] < self.expected_fps * CAPTURE_MIN_SPEED
+        if slow and not self.slow:
+            self.logger.warning(
+                f"🐢 [{self.label}] Camera is slow: {self.stats['fps']:.1f} fps of {self.expected_fps}, "
+                f"{self.stats['drop_frames']} dropped, {self.stats['dup_frames']} duplicated"
+            )
+        self.slow = slow
+
+    def seconds_without_frames(self):
+        return time.monotonic() - self.last_frame_change
+
+    def finished(self):
+        """True if ffmpeg reported the end of its output"""
+        return self.stats["progress"] == "end"
+
+
+def watch_process(process, monitor, on_block=None):
+    """
+    Read `-progress pipe:1` from process.stdout until ffmpeg exits, keeping the
+    last stderr lines and terminating ffmpeg if the camera stops delivering
+    frames for CAPTURE_STALL_TIMEOUT seconds. Returns the stderr tail.
+    """
+    stderr_tail = collections.deque(maxlen=20)
+    done = threading.Event()
+
+    def drain_stderr():
+        for line in process.stderr:
+            stderr_tail.append(line.rstrip())
+
+    def watchdog():
+        terminated_at = None
+        while not done.wait(1):
+            if not CAPTURE_STALL_TIMEOUT or monitor.seconds_without_frames() <= CAPTURE_STALL_TIMEOUT:
+                continue
+            if terminated_at is None:
+                monitor.stalled = True
+                monitor.logger.error(
+                    f"🧊 [{monitor.label}] No frames for {CAPTURE_STALL_TIMEOUT}s, stopping ffmpeg"
+                )
+                process.terminate()
+                terminated_at = time.monotonic()
+            elif time.monotonic() - terminated_at > 5 and process.poll() is None:
+                # A device read can block forever and ignore SIGTERM
+                process.kill()
+
+    threads = [
+        threading.Thread(target=drain_stderr, daemon=True),
+        threading.Thread(target=watchdog, daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        for line in process.stdout:
+            if monitor.feed(line) and on_block:
+                on_block(monitor)
+        process.wait()
+    finally:
+        done.set()
+        threads[0].join(timeout=1)
+    return stderr_tail
+
+
+def limited_command(cmd, nice=0, max_memory_mb=0):
+    """
+    Wrap an ffmpeg command so it runs at the given niceness and address space
+    cap. The limits are applied by nice and the shell before exec, not by
+    Python code in the forked child (preexec_fn is unsafe once threads run);
+    the command is returned unchanged when neither is set.
+    """
+    if os.name != "posix":
+        return cmd
+    if max_memory_mb:
+        # ulimit takes KB; a shell without -v runs the command unlimited, as before
+        cmd = ["sh", "-c", f'ulimit -v {max_memory_mb * 1024} 2>/dev/null; exec "$@"', "sh"] + cmd
+    if nice:
+        cmd = ["nice", "-n", str(nice)] + cmd
+    return cmd
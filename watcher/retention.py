@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Quota-based retention for VIDEO_DIR and MERGED_DIR
+Квоты хранения: удаление файлов по размеру, возрасту и свободному месту на томе
+"""
+
+import json
+import os
+import shutil
+import time
+from .config import (
+    STATE_DIR, VIDEO_DIR, MERGED_DIR, SEGMENT_DURATION,
+    VIDEO_DIR_MAX_MB, VIDEO_DIR_MAX_AGE_HOURS, MERGED_DIR_MAX_MB, MERGED_DIR_MAX_AGE_HOURS,
+    RETENTION_MIN_FREE_PERCENT,
+)
+from .segments import remove_sidecars
+from . import catalog, journal
+
+# Files younger than this may still be written by ffmpeg and are never evicted
+MIN_AGE = SEGMENT_DURATION + 60
+
+# Intermediates that can be recreated or were already merged go first
+INTERMEDIATE_PREFIXES = ("merged_", "static_")
+INTERMEDIATE_SUFFIXES = ("_repaired.mp4",)
+
+
+def priority(path):
+    """Lower values are evicted first"""
+    name = os.path.basename(path)
+    if name.startswith(INTERMEDIATE_PREFIXES) or name.endswith(INTERMEDIATE_SUFFIXES):
+        return 0
+    return 1
+
+
+class UsageIndex:
+    """
+    Persistent view of the .mp4 files under a directory tree. A directory is
+    listed again only when its mtime changed (a file was added, removed or
+    renamed), and only new or recently modified files are stat'ed again.
+    """
+
+    # Files modified within this window may still grow and are re-stat'ed
+    RECENT = 10 * 60
+
+    def __init__(self, root):
+        self.root = root
+        self.path = os.path.join(STATE_DIR, f"usage_{os.path.basename(root.rstrip(os.sep))}.json")
+        self.dirs = {}
+        try:
+            with open(self.path) as f:
+                self.dirs = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        os.makedirs(STATE_DIR, exist_ok=True)
+        # The capture and merge processes both enforce retention, one temp file each
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.dirs, f)
+        os.replace(tmp_path, self.path)
+
+    def refresh(self):
+        """Bring the index up to date and return {path: (size, mtime)}"""
+        seen = set()
+        pending = [self.root]
+        now = time.time()
+        while pending:
+            directory = pending.pop()
+            try:
+                dir_mtime = os.stat(directory).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            seen.add(directory)
+            entry = self.dirs.get(directory)
+            if entry and entry["mtime"] == dir_mtime:
+                pending.extend(entry["subdirs"])
+                for name, (size, mtime) in list(entry["files"].items()):
+                    if now - mtime < self.RECENT:
+                        self._restat(entry, directory, name)
+                continue
+
+            old_files = entry["files"] if entry else {}
+            entry = {"mtime": dir_mtime, "subdirs": [], "files": {}}
+            with os.scandir(directory) as it:
+                for item in it:
+                    if item.is_dir(follow_symlinks=False):
+                        entry["subdirs"].append(item.path)
+                    elif item.name.endswith(".mp4") and not item.name.startswith("."):
+                        cached = old_files.get(item.name)
+                        if cached and now - cached[1] >= self.RECENT:
+                            entry["files"][item.name] = cached
+                        else:
+                            entry["files"][item.name] = None
+                            self._restat(entry, directory, item.name)
+            self.dirs[directory] = entry
+            pending.extend(entry["subdirs"])
+
+        for directory in list(self.dirs):
+            if directory not in seen:
+                del self.dirs[directory]
+
+        files = {}
+        for directory, entry in self.dirs.items():
+            for name, info in entry["files"].items():
+                if info:
+                    files[os.path.join(directory, name)] = tuple(info)
+        return files
+
+    def _restat(self, entry, directory, name):
+        try:
+            st = os.stat(os.path.join(directory, name))
+            entry["files"][name] = [st.st_size, st.st_mtime]
+        except FileNotFoundError:
+            entry["files"].pop(name, None)
+
+    def forget(self, path):
+        entry = self.dirs.get(os.path.dirname(path))
+        if entry:
+            entry["files"].pop(os.path.basename(path), None)
+
+
+def _delete(path, index, logger, reason):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        if logger:
+            logger.warning(f"⚠️ Could not delete {path}: {e}")
+        return False
+    remove_sidecars(path)
+    index.forget(path)
+    catalog.update("removed", [path])
+    if logger:
+        logger.info(f"🗑️ Retention ({reason}): {os.path.basename(path)}")
+    return True
+
+
+def protected_paths():
+    """
+    Files that retention must leave alone: everything an unfinished or failed
+    merge job owns and every part still waiting in the outbox
+    """
+    if not os.path.exists(journal.JOURNAL_FILE):
+        return set()
+    from .outbox import Outbox
+    jobs = journal.Journal()
+    box = Outbox()
+    try:
+        return jobs.owned_paths() | box.pending_paths()
+    finally:
+        box.close()
+        jobs.close()
+
+
+def _free_percent(path):
+    try:
+        total, used, free = shutil.disk_usage(path)
+        return free / total * 100
+    except OSError:
+        return 100.0
+
+
+def enforce(logger=None):
+    """
+    Apply age and size quotas to VIDEO_DIR and MERGED_DIR and keep the video
+    volume above RETENTION_MIN_FREE_PERCENT. Files owned by the journal or the
+    outbox are never deleted, and nothing is while a merge run holds the lock
+    (its inputs are not in the journal yet). Returns (files deleted, bytes freed).
+    """
+    with journal.run_lock() as locked:
+        if not locked:
+            if logger:
+                logger.debug("⏳ A merge run is in progress, retention waits for the next check")
+            return 0, 0
+        return _enforce(protected_paths(), logger)
+
+
+def _enforce(protected, logger):
+    deleted = 0
+    freed = 0
+    now = time.time()
+    all_candidates = []
+    indexes = []
+
+    for root, max_mb, max_age_hours in (
+        (VIDEO_DIR, VIDEO_DIR_MAX_MB, VIDEO_DIR_MAX_AGE_HOURS),
+        (MERGED_DIR, MERGED_DIR_MAX_MB, MERGED_DIR_MAX_AGE_HOURS),
+    ):
+        index = UsageIndex(root)
+        indexes.append(index)
+        files = index.refresh()
+        candidates = sorted(
+            ((priority(path), mtime, path, size, index) for path, (size, mtime) in files.items()
+             if now - mtime > MIN_AGE and path not in protected),
+            key=lambda item: (item[0], item[1])
+        )
+        used = sum(size for size, _ in files.values())
+
+        if max_age_hours:
+            cutoff = now - max_age_hours * 3600
+            for item in list(candidates):
+                if item[1] < cutoff and _delete(item[2], index, logger, "age"):
+                    deleted += 1
+                    freed += item[3]
+                    used -= item[3]
+                    candidates.remove(item)
+
+        if max_mb:
+            limit = max_mb * 1024 * 1024
+            while candidates and used > limit:
+                item = candidates.pop(0)
+                if _delete(item[2], index, logger, "quota"):
+                    deleted += 1
+                    freed += item[3]
+                    used -= item[3]
+
+        all_candidates.extend(candidates)
+
+    # Last resort when the volume itself is running out of space
+    if RETENTION_MIN_FREE_PERCENT and os.path.isdir(VIDEO_DIR):
+        all_candidates.sort(key=lambda item: (item[0], item[1]))
+        while all_candidates and _free_percent(VIDEO_DIR) < RETENTION_MIN_FREE_PERCENT:
+            item = all_candidates.pop(0)
+            if _delete(item[2], item[4], logger, "disk full"):
+                deleted += 1
+                freed += item[3]
+
+    for index in indexes:
+        index.save()
+
+    if deleted and logger:
+        logger.warning(f"🧹 Retention removed {deleted} files, {freed / (1024 * 1024):.1f} MB freed")
+    return deleted, freed
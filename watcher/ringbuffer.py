@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Pre-event ring buffer on a RAM-backed directory
+Кольцевой буфер сегментов в RAM: хранит последние минуты записи и переносит
+на диск только то, что выбрано для отправки (движение или ручное срабатывание)
+"""
+
+import argparse
+import collections
+import json
+import os
+import queue
+import threading
+import time
+from .config import (
+    STATE_DIR, RING_BUFFER_DIR, RING_BUFFER_MAX_MB, RING_BUFFER_MINUTES,
+    RING_PROMOTE_ON_MOTION, RING_PREROLL_SEGMENTS, MOTION_THRESHOLD, SEGMENT_DURATION, camera_video_dir,
+)
+from .segments import move_segment, remove_sidecars, segment_start
+from . import catalog
+
+TRIGGER_FILE = os.path.join(STATE_DIR, "ring_trigger.json")
+
+
+def stats_file(name):
+    return os.path.join(STATE_DIR, f"ringbuffer_{name or 'default'}.json")
+
+
+def ring_dir(name):
+    """RAM directory that receives the segments of a camera"""
+    return os.path.join(RING_BUFFER_DIR, name) if name else RING_BUFFER_DIR
+
+
+class RingBuffer:
+    """
+    Bounded store of closed segments for one camera. Segments are handed over by
+    the recorder thread and processed by a worker thread, so motion analysis and
+    promotion never delay reading ffmpeg's output.
+    """
+
+    def __init__(self, name, logger, on_promote=None):
+        self.name = name
+        self.label = name or "camera"
+        self.logger = logger
+        self.on_promote = on_promote
+        self.dir = ring_dir(name)
+        self.target_dir = camera_video_dir(name)
+        self.max_bytes = RING_BUFFER_MAX_MB * 1024 * 1024
+        self.max_age = RING_BUFFER_MINUTES * 60
+        self.segments = collections.OrderedDict()  # path -> size, oldest first
+        self.counters = {
+            "bytes_used": 0,
+            "bytes_max": self.max_bytes,
+            "segments": 0,
+            "added_segments": 0,
+            "evicted_segments": 0,
+            "evicted_bytes": 0,
+            "promoted_segments": 0,
+            "promoted_bytes": 0,
+        }
+        self._trigger_mtime = self._read_trigger_mtime()
+        self._promote_until = 0
+        self._queue = queue.Queue()
+        os.makedirs(self.dir, exist_ok=True)
+        self._load()
+        self._worker = threading.Thread(target=self._run, name=f"ring-{self.label}", daemon=True)
+        self._worker.start()
+
+    def _load(self):
+        """Pick up segments left in the buffer by a previous run"""
+        for name in sorted(os.listdir(self.dir)):
+            if name.endswith(".mp4"):
+                path = os.path.join(self.dir, name)
+                self.segments[path] = os.path.getsize(path)
+        self._update_usage()
+
+    def add(self, path):
+        """Hand over a closed segment (called from the recorder thread)"""
+        self._queue.put(path)
+
+    def close(self, timeout=5):
+        """Process the segments still queued and stop the worker"""
+        self._queue.put(None)
+        self._worker.join(timeout=timeout)
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            if path is None:
+                break
+            try:
+                self._handle(path)
+            except Exception as e:
+                self.logger.warning(f"⚠️ [{self.label}] Ring buffer could not handle {os.path.basename(path)}: {e}")
+
+    def _handle(self, path):
+        size = os.path.getsize(path)
+        self.segments[path] = size
+        self.counters["added_segments"] += 1
+
+        self._check_trigger()
+        if time.time() < self._promote_until:
+            self.promote(path)
+        elif RING_PROMOTE_ON_MOTION and self._has_motion(path):
+            # Keep a little context from before the event as well
+            previous = list(self.segments)[:-1][-RING_PREROLL_SEGMENTS:] if RING_PREROLL_SEGMENTS else []
+            for earlier in previous:
+                self.promote(earlier)
+            self.promote(path)
+
+        # The segment being recorded grows to about the size of the last one
+        self._enforce(reserve=size)
+        self._save_stats()
+
+    def _has_motion(self, path):
+        try:
+            from .motion import analyse_segment
+            return analyse_segment(path)["score"] >= MOTION_THRESHOLD
+        except Exception as e:
+            self.logger.warning(f"⚠️ [{self.label}] Motion analysis failed, keeping segment: {e}")
+            return True
+
+    def promote(self, path):
+        """Move a segment to persistent storage so it gets merged and sent"""
+        size = self.segments.pop(path, None)
+        if size is None or not os.path.exists(path):
+            return
+        target_path = move_segment(path, self.target_dir)
+        catalog.record_segment(target_path, self.name)
+        self.counters["promoted_segments"] += 1
+        self.counters["promoted_bytes"] += size
+        self._update_usage()
+        self.logger.info(f"📌 [{self.label}] Promoted to storage: {os.path.basename(path)}")
+        if self.on_promote:
+            self.on_promote(target_path)
+
+    def _evict_oldest(self):
+        path, size = self.segments.popitem(last=False)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        remove_sidecars(path)
+        self.counters["evicted_segments"] += 1
+        self.counters["evicted_bytes"] += size
+        self.logger.debug(f"♻️ [{self.label}] Evicted from ring buffer: {os.path.basename(path)}")
+
+    def _enforce(self, reserve=0):
+        """Evict oldest segments until both the byte cap and the age limit hold"""
+        self._update_usage()
+        while self.segments and self.counters["bytes_used"] + reserve > self.max_bytes:
+            self._evict_oldest()
+            self._update_usage()
+
+        cutoff = time.time() - self.max_age
+        while self.segments:
+            oldest = next(iter(self.segments))
+            started = segment_start(oldest)
+            if started is None or started.timestamp() >= cutoff:
+                break
+            self._evict_oldest()
+        self._update_usage()
+
+    def _update_usage(self):
+        self.counters["bytes_used"] = sum(self.segments.values())
+        self.counters["segments"] = len(self.segments)
+
+    def _read_trigger_mtime(self):
+        try:
+            return os.path.getmtime(TRIGGER_FILE)
+        except OSError:
+            return None
+
+    def _check_trigger(self):
+        """Promote buffered and upcoming segments when watcher-trigger was run"""
+        mtime = self._read_trigger_mtime()
+        if mtime is None or mtime == self._trigger_mtime:
+            return
+        self._trigger_mtime = mtime
+        try:
+            with open(TRIGGER_FILE) as f:
+                trigger = json.load(f)
+        except (OSError, ValueError):
+            return
+        if trigger.get("camera") not in (None, self.name):
+            return
+
+        since = trigger["created"] - trigger["pre_minutes"] * 60
+        self._promote_until = trigger["created"] + trigger["post_minutes"] * 60
+        self.logger.info(f"🚨 [{self.label}] Manual trigger: saving footage since {time.ctime(since)}")
+        for path in list(self.segments):
+            started = segment_start(path)
+            # The segment that contains the start of the window counts as well
+            if started is None or started.timestamp() >= since - SEGMENT_DURATION:
+                self.promote(path)
+
+    def _save_stats(self):
+        os.makedirs(STATE_DIR, exist_ok=True)
+        path = stats_file(self.name)
+        with open(path + ".tmp", "w") as f:
+            json.dump(dict(self.counters, updated=time.time()), f, indent=2)
+        os.replace(path + ".tmp", path)
+
+
+def main():
+    """watcher-trigger: keep the buffered footage around an event"""
+    parser = argparse.ArgumentParser(description="Promote ring buffer footage to storage for sending")
+    parser.add_argument("--before", type=float, default=RING_BUFFER_MINUTES,
+                        help="minutes of buffered footage before now to keep")
+    parser.add_argument("--after", type=float, default=5, help="minutes of upcoming footage to keep")
+    parser.add_argument("--camera", default=None, help="camera name (all cameras by default)")
+    args = parser.parse_args()
+
+    os.makedirs(STATE_DIR, exist_ok=True)
+    trigger = {
+        "created": time.time(),
+        "pre_minutes": args.before,
+        "post_minutes": args.after,
+        "camera": args.camera,
+    }
+    with open(TRIGGER_FILE + ".tmp", "w") as f:
+        json.dump(trigger, f)
+    os.replace(TRIGGER_FILE + ".tmp", TRIGGER_FILE)
+    print(f"🚨 Trigger set: {args.before:g} min before, {args.after:g} min after")
+
+
+if __name__ == "__main__":
+    main()
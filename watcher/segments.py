@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Segment file helpers
+Работа с файлами сегментов: служебные файлы рядом с ними (video_X.mp4.<kind>.json), имена, перенос
+"""
+
+import datetime
+import glob
+import json
+import os
+import re
+import shutil
+import time
+
+SEGMENT_NAME = re.compile(r"video_(\d{8}_\d{6})")
+
+# Segments are recorded as .video_X.mp4.recording and renamed once closed, so
+# every .mp4 in a video directory is complete
+RECORDING_SUFFIX = ".recording"
+
+# A recording ffmpeg writes to is touched every few seconds; older ones were
+# left by a killed process and have no index to play them from
+STALE_RECORDING_AGE = 120
+
+
+def sidecar_path(video_path, kind):
+    """Path of the sidecar of the given kind, e.g. video_X.mp4.motion.json"""
+    return f"{video_path}.{kind}.json"
+
+
+def read_sidecar(video_path, kind):
+    """Return the sidecar contents or None if it is missing or unreadable"""
+    try:
+        with open(sidecar_path(video_path, kind)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_sidecar(video_path, kind, data):
+    """Write the sidecar atomically so readers never see a partial file"""
+    path = sidecar_path(video_path, kind)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def remove_sidecars(video_path):
+    """Delete every sidecar that belongs to the segment"""
+    for path in glob.glob(glob.escape(video_path) + ".*"):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def segment_start(path):
+    """Wall-clock start of a segment from its video_YYYYmmdd_HHMMSS.mp4 name, or None"""
+    match = SEGMENT_NAME.search(os.path.basename(path))
+    if not match:
+        return None
+    return datetime.datetime.strptime(match.group(1), "%Y%m%d_%H%M%S")
+
+
+def recording_path(video_path):
+    """Temporary name a segment is written under until it is closed"""
+    directory, name = os.path.split(video_path)
+    return os.path.join(directory, f".{name}{RECORDING_SUFFIX}")
+
+
+def is_recording(name):
+    return name.startswith(".") and name.endswith(RECORDING_SUFFIX)
+
+
+def published_path(path):
+    """Final name of a recording: .video_X.mp4.recording -> video_X.mp4"""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, name[1:-len(RECORDING_SUFFIX)])
+
+
+def publish(path):
+    """Atomically rename a closed recording to its final name; returns that path"""
+    target_path = published_path(path)
+    os.replace(path, target_path)
+    return target_path
+
+
+def remove_stale_recordings(directory, max_age=STALE_RECORDING_AGE):
+    """Delete recordings no ffmpeg has written to for max_age seconds; returns their names"""
+    removed = []
+    if not os.path.isdir(directory):
+        return removed
+    now = time.time()
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if is_recording(name) and now - os.path.getmtime(path) > max_age:
+                os.remove(path)
+                removed.append(name)
+        except OSError:
+            pass
+    return removed
+
+
+def move_segment(video_path, target_dir):
+    """
+    Move a segment and its sidecars to another directory, possibly on another
+    filesystem. The video is copied under a temporary name and renamed into
+    place last, so readers of target_dir never see a partial file.
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    name = os.path.basename(video_path)
+    for path in glob.glob(glob.escape(video_path) + ".*"):
+        shutil.move(path, os.path.join(target_dir, os.path.basename(path)))
+
+    target_path = os.path.join(target_dir, name)
+    tmp_path = os.path.join(target_dir, f".{name}.part")
+    shutil.copyfile(video_path, tmp_path)
+    shutil.copystat(video_path, tmp_path)
+    os.replace(tmp_path, target_path)
+    os.remove(video_path)
+    return target_path
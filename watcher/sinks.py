@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Delivery sinks for produced files
+Куда доставляются готовые файлы: Telegram, локальный архив (NAS), S3-совместимое
+хранилище (MinIO), HTTP. Каждый приёмник получает файл независимо от остальных
+"""
+
+import datetime
+import hashlib
+import hmac
+import mimetypes
+import os
+import shutil
+import xml.etree.ElementTree as ET
+from urllib.parse import quote
+from .config import (
+    DELIVERY_SINKS, ARCHIVE_DIR,
+    S3_ENDPOINT, S3_BUCKET, S3_ACCESS_KEY, S3_SECRET_KEY, S3_REGION, S3_PREFIX, S3_PART_MB,
+    HTTP_SINK_URL, HTTP_SINK_TOKEN,
+)
+from .locale import _
+from .outbox import SendError
+from . import multipart
+
+# Answers that will not change on retry (bad request, forbidden, too large)
+PERMANENT_STATUS = (400, 403, 413)
+
+# Connect and read timeouts of the network sinks, in seconds
+TIMEOUT = (10, 300)
+
+# S3 rejects parts below 5 MB (except the last one)
+S3_MIN_PART = 5 * 1024 * 1024
+
+
+def _content_type(path):
+    return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+def _status_error(response):
+    """SendError for a failed HTTP answer, honouring retry_after of a 429"""
+    retry_after = None
+    try:
+        retry_after = response.json().get("parameters", {}).get("retry_after")
+    except (ValueError, AttributeError):
+        pass
+    if retry_after is None and response.headers.get("Retry-After", "").isdigit():
+        retry_after = int(response.headers["Retry-After"])
+    return SendError(
+        f"HTTP {response.status_code}: {response.text[:200]}",
+        retry_after=retry_after,
+        permanent=response.status_code in PERMANENT_STATUS
+    )
+
+
+class Sink:
+    """Delivers one file; send() raises SendError on failure"""
+
+    name = ""
+
+    def configured(self):
+        return True
+
+    def send(self, path, caption, camera, logger):
+        raise NotImplementedError
+
+    def _progress(self, path, logger):
+        """Progress of one attempt, recorded as <name>_upload_* metrics"""
+        return multipart.UploadProgress(f"{self.name}: {os.path.basename(path)}", logger,
+                                        os.path.getsize(path), prefix=f"{self.name}_upload")
+
+
+class TelegramSink(Sink):
+    """
+    sendVideo (sendPhoto, sendAnimation for digests) through the shared Bot API
+    client; the sheets of a multi-sheet digest go out as one sendMediaGroup album
+    """
+
+    name = "telegram"
+
+    def send(self, path, caption, camera, logger):
+        import requests
+        from .digest import album, is_digest
+        from .telegram import get_client
+        client = get_client()
+        sheets = album(path)
+        if sheets and path != sheets[0]:
+            # Went out with the first sheet; the outbox sends parts in order
+            logger.debug(f"📎 Sent in the album of {os.path.basename(sheets[0])}: {os.path.basename(path)}")
+            return
+        logger.info(f"📤 Sending to Telegram: {path}")
+        if sheets:
+            send = lambda path, caption, logger: client.send_media_group(sheets, caption, logger)
+        elif path.endswith(".jpg"):
+            send = client.send_photo
+        elif is_digest(path):
+            send = client.send_animation
+        else:
+            send = client.send_video
+        try:
+            # The body is streamed from the file in chunks, memory use does not grow with its size
+            response = send(path, caption, logger)
+        except requests.RequestException as e:
+            logger.error(_("telegram_failed", str(e)))
+            raise SendError(str(e))
+        logger.debug(f"📨 Telegram response: {response.status_code} — {response.text}")
+        if not response.ok:
+            logger.error(_("telegram_failed", response.text))
+            raise _status_error(response)
+        logger.info(_("telegram_sent", path))
+
+
+class ArchiveSink(Sink):
+    """Copy into ARCHIVE_DIR/<camera>/, e.g. a mounted NAS share"""
+
+    name = "archive"
+
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = root
+
+    def configured(self):
+        return bool(self.root)
+
+    def send(self, path, caption, camera, logger):
+        target_dir = os.path.join(self.root, camera) if camera else self.root
+        name = os.path.basename(path)
+        target_path = os.path.join(target_dir, name)
+        tmp_path = os.path.join(target_dir, f".{name}.part")
+        progress = self._progress(path, logger)
+        try:
+            os.makedirs(target_dir, exist_ok=True)
+            with open(tmp_path, "wb") as dst:
+                for chunk in multipart.FileStream(path, progress=progress):
+                    dst.write(chunk)
+                dst.flush()
+                os.fsync(dst.fileno())
+            shutil.copystat(path, tmp_path)
+            # Readers of the archive never see a partial file
+            os.replace(tmp_path, target_path)
+        except OSError as e:
+            progress.finish(False)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise SendError(f"archive: {e}")
+        progress.finish(True)
+        logger.info(f"🗄️ Archived: {target_path}")
+
+
+class S3Sink(Sink):
+    """
+    PUT into an S3-compatible bucket with Signature V4; files larger than
+    S3_PART_MB are sent as a multipart upload, one part in memory at a time
+    """
+
+    name = "s3"
+
+    def __init__(self, endpoint=S3_ENDPOINT, bucket=S3_BUCKET, access_key=S3_ACCESS_KEY,
+                 secret_key=S3_SECRET_KEY, region=S3_REGION, prefix=S3_PREFIX, part_mb=S3_PART_MB):
+        self.endpoint = endpoint.rstrip("/")
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.prefix = prefix
+        self.part_size = max(S3_MIN_PART, part_mb * 1024 * 1024)
+        self.session = None
+
+    def configured(self):
+        return bool(self.endpoint and self.bucket and self.access_key and self.secret_key)
+
+    def key(self, path, camera):
+        return "/".join(p for p in (self.prefix, camera, os.path.basename(path)) if p)
+
+    def _signed_headers(self, method, uri, query, now):
+        """Signature V4 headers; the payload is not hashed so bodies can be streamed"""
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        day = amz_date[:8]
+        host = self.endpoint.split("://", 1)[-1]
+        headers = {"host": host, "x-amz-content-sha256": "UNSIGNED-PAYLOAD", "x-amz-date": amz_date}
+        canonical_query = "&".join(
+            f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}" for k, v in sorted(query.items())
+        )
+        signed = ";".join(sorted(headers))
+        canonical = "\n".join([
+            method, uri, canonical_query,
+            "".join(f"{k}:{headers[k]}\n" for k in sorted(headers)),
+            signed, "UNSIGNED-PAYLOAD",
+        ])
+        scope = f"{day}/{self.region}/s3/aws4_request"
+        to_sign = "\n".join([
+            "AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical.encode()).hexdigest(),
+        ])
+        key = ("AWS4" + self.secret_key).encode()
+        for part in (day, self.region, "s3", "aws4_request"):
+            key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(key, to_sign.encode(), hashlib.sha256).hexdigest()
+        headers["Authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+            f"SignedHeaders={signed}, Signature={signature}"
+        )
+        del headers["host"]
+        return headers
+
+    def _request(self, method, key, query=None, data=None, headers=None):
+        # requests is only loaded when a network sink actually sends
+        import requests
+        if self.session is None:
+            self.session = requests.Session()
+        query = query or {}
+        uri = "/" + quote(f"{self.bucket}/{key}", safe="/-_.~")
+        request_headers = self._signed_headers(method, uri, query, datetime.datetime.now(datetime.timezone.utc))
+        request_headers.update(headers or {})
+        try:
+            response = self.session.request(method, self.endpoint + uri, params=query, data=data,
+                                            headers=request_headers, timeout=TIMEOUT)
+        except requests.RequestException as e:
+            raise SendError(f"s3: {e}")
+        if not response.ok:
+            raise _status_error(response)
+        return response
+
+    def send(self, path, caption, camera, logger):
+        key = self.key(path, camera)
+        size = os.path.getsize(path)
+        progress = self._progress(path, logger)
+        try:
+            if size <= self.part_size:
+                self._request("PUT", key, data=multipart.FileStream(path, progress=progress),
+                              headers={"Content-Type": _content_type(path)})
+            else:
+                self._multipart(path, key, size, progress)
+        except SendError:
+            progress.finish(False)
+            raise
+        progress.finish(True)
+        logger.info(f"🪣 Uploaded to s3://{self.bucket}/{key}")
+
+    def _multipart(self, path, key, size, progress):
+        answer = self._request("POST", key, {"uploads": ""}, headers={"Content-Type": _content_type(path)})
+        upload_id = _xml_text(answer.content, "UploadId")
+        if not upload_id:
+            raise SendError("s3: no UploadId in CreateMultipartUpload answer")
+        etags = []
+        try:
+            for number, offset in enumerate(range(0, size, self.part_size), start=1):
+                body = multipart.FileStream(path, offset, min(self.part_size, size - offset), progress)
+                response = self._request("PUT", key, {"partNumber": str(number), "uploadId": upload_id}, data=body)
+                etags.append((number, response.headers.get("ETag", "")))
+            parts = "".join(f"<Part><PartNumber>{n}</PartNumber><ETag>{etag}</ETag></Part>" for n, etag in etags)
+            answer = self._request("POST", key, {"uploadId": upload_id},
+                                   data=f"<CompleteMultipartUpload>{parts}</CompleteMultipartUpload>".encode())
+            # Completion can fail with a 200 answer whose body is an error
+            if _xml_text(answer.content, "Code"):
+                raise SendError(f"s3: {answer.text[:200]}")
+        except SendError:
+            # Do not leave orphaned parts in the bucket; the next attempt starts over
+            try:
+                self._request("DELETE", key, {"uploadId": upload_id})
+            except SendError:
+                pass
+            raise
+
+
+def _xml_text(content, tag):
+    """Text of the first element with the given local name, or None"""
+    try:
+        root = ET.fromstring(content)
+    except ET.ParseError:
+        return None
+    for element in root.iter():
+        if element.tag.rsplit("}", 1)[-1] == tag:
+            return element.text
+    return None
+
+
+class HttpSink(Sink):
+    """multipart/form-data POST of the file with camera and caption fields"""
+
+    name = "http"
+
+    def __init__(self, url=HTTP_SINK_URL, token=HTTP_SINK_TOKEN):
+        self.url = url
+        self.token = token
+        self.session = None
+
+    def configured(self):
+        return bool(self.url)
+
+    def send(self, path, caption, camera, logger):
+        import requests
+        if self.session is None:
+            self.session = requests.Session()
+        progress = self._progress(path, logger)
+        body = multipart.MultipartStream({"camera": camera, "caption": caption or ""},
+                                         [("file", path, _content_type(path))], progress)
+        headers = {"Content-Type": body.content_type}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        try:
+            response = self.session.post(self.url, data=body, headers=headers, timeout=TIMEOUT)
+        except requests.RequestException as e:
+            progress.finish(False)
+            raise SendError(f"http: {e}")
+        progress.finish(response.ok)
+        if not response.ok:
+            raise _status_error(response)
+        logger.info(f"🌐 Posted {os.path.basename(path)} to {self.url}")
+
+
+SINKS = {
+    "telegram": TelegramSink,
+    "archive": ArchiveSink,
+    "s3": S3Sink,
+    "http": HttpSink,
+}
+
+
+def get_sinks(logger, names=DELIVERY_SINKS):
+    """Configured sinks by name, in the order of DELIVERY_SINKS"""
+    sinks = {}
+    for name in names:
+        if name not in SINKS:
+            logger.warning(f"⚠️ Unknown delivery sink: {name}")
+            continue
+        sink = SINKS[name]()
+        if not sink.configured():
+            logger.warning(f"⚠️ Delivery sink {name} is not configured, skipping it")
+            continue
+        sinks[name] = sink
+    return sinks
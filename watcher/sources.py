@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Capture source backends for Watcher
+Источники видео для Watcher (avfoundation, v4l2, синтетическая камера lavfi)
+"""
+
+import glob
+import hashlib
+import os
+import re
+import subprocess
+import sys
+from .config import CAPTURE_SOURCE, FPS, RESOLUTION
+
+# Name patterns of cameras built into the host, used to prefer external ones
+BUILTIN_PATTERNS = [
+    'MacBook Pro', 'MacBook Air', 'iMac', 'Mac mini',
+    'built-in', 'Built-in', 'Internal', 'internal', 'Integrated',
+    'Desk View', 'FaceTime', 'Capture screen'
+]
+
+# Entry of the USB plane in `ioreg -p IOUSB`: "+-o USB Camera@01100000  <class ..., busy 0 (1 ms), ...>";
+# only the name and location are kept, the rest changes between calls
+IOREG_ENTRY = re.compile(r"\+-o (.+?)\s+<class")
+
+
+class CaptureSource:
+    """Base class: how to enumerate devices and how to open one as ffmpeg input"""
+
+    name = None
+
+    def list_devices(self):
+        """
+        Enumerate devices as a list of (device_id, device_name) tuples; raises
+        PermissionError if the system refuses access to the cameras
+        """
+        raise NotImplementedError
+
+    def input_args(self, device, realtime=True):
+        """ffmpeg arguments (up to and including -i) that open the given device"""
+        raise NotImplementedError
+
+    def fingerprint(self):
+        """
+        Cheap identity of the attached devices, or None if it cannot be obtained
+        without enumerating. Used to notice device changes without a subprocess.
+        """
+        return None
+
+
+class AVFoundationSource(CaptureSource):
+    """macOS cameras through AVFoundation"""
+
+    name = "avfoundation"
+
+    def list_devices(self):
+        cmd = ["ffmpeg", "-hide_banner", "-f", "avfoundation", "-list_devices", "true", "-i", ""]
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
+
+        # Without camera access AVFoundation does not list the video section at all
+        if 'AVFoundation video devices:' not in result.stderr:
+            raise PermissionError("AVFoundation did not list video devices (camera access denied?)")
+
+        devices = []
+        in_video_section = False
+
+        for line in result.stderr.split('\n'):
+            # Check for video devices section
+            if 'AVFoundation video devices:' in line:
+                in_video_section = True
+                continue
+            elif 'AVFoundation audio devices:' in line:
+                in_video_section = False
+                continue
+
+            # Only process video devices
+            if in_video_section and '] [' in line:
+                # Format: [AVFoundation indev @ 0x...] [0] Device Name
+                parts = line.split('] [')
+                if len(parts) >= 2:
+                    device_index = parts[1].split(']')[0]  # Get the device number
+                    device_name = parts[1].split('] ')[1] if '] ' in parts[1] else parts[1].split(']')[1]
+                    devices.append((device_index, device_name))
+
+        return devices
+
+    def fingerprint(self):
+        """
+        Hash of the USB device tree from ioreg (a few ms, against about a second
+        for an ffmpeg enumeration), so plugging in or removing a camera is noticed
+        """
+        try:
+            result = subprocess.run(["ioreg", "-p", "IOUSB"], capture_output=True, text=True, timeout=5)
+        except (OSError, subprocess.SubprocessError):
+            return None
+        if result.returncode != 0:
+            return None
+        entries = IOREG_ENTRY.findall(result.stdout)
+        return hashlib.sha1("\n".join(entries).encode()).hexdigest()[:16]
+
+    def input_args(self, device, realtime=True):
+        return [
+            "-f", "avfoundation",
+            "-framerate", str(FPS),
+            "-video_size", RESOLUTION,
+            "-i", str(device),
+        ]
+
+
+class V4L2Source(CaptureSource):
+    """Linux cameras through Video4Linux2, enumerated from sysfs without spawning ffmpeg"""
+
+    name = "v4l2"
+
+    def _nodes(self):
+        return sorted(glob.glob("/dev/video*"), key=lambda p: int(p[len("/dev/video"):] or 0))
+
+    def list_devices(self):
+        devices = []
+        for node in self._nodes():
+            index = node[len("/dev/video"):]
+            name_file = f"/sys/class/video4linux/video{index}/name"
+            try:
+                with open(name_file) as f:
+                    device_name = f.read().strip()
+            except OSError:
+                device_name = node
+            # Skip metadata nodes that UVC drivers expose next to every camera
+            index_file = f"/sys/class/video4linux/video{index}/index"
+            try:
+                with open(index_file) as f:
+                    if f.read().strip() != "0":
+                        continue
+            except OSError:
+                pass
+            devices.append((index, device_name))
+        if devices and not any(os.access(f"/dev/video{index}", os.R_OK | os.W_OK) for index, _ in devices):
+            raise PermissionError("No read/write access to /dev/video* (is the user in the video group?)")
+        return devices
+
+    def input_args(self, device, realtime=True):
+        device = str(device)
+        path = device if device.startswith("/dev/") else f"/dev/video{device}"
+        return [
+            "-f", "v4l2",
+            "-framerate", str(FPS),
+            "-video_size", RESOLUTION,
+            "-i", path,
+        ]
+
+    def fingerprint(self):
+        return ",".join(self._nodes())
+
+
+class LavfiSource(CaptureSource):
+    """Synthetic camera from the lavfi test pattern, for CI and benchmarks"""
+
+    name = "lavfi"
+
+    def list_devices(self):
+        return [("testsrc", "Synthetic test pattern"), ("testsrc2", "Synthetic test pattern (moving)")]
+
+    def input_args(self, device, realtime=True):
+        pattern = device if device in ("testsrc", "testsrc2") else "testsrc2"
+        args = ["-re"] if realtime else []
+        return args + ["-f", "lavfi", "-i", f"{pattern}=size={RESOLUTION}:rate={FPS}"]
+
+    def fingerprint(self):
+        return "lavfi"
+
+
+SOURCES = {
+    source.name: source
+    for source in (AVFoundationSource, V4L2Source, LavfiSource)
+}
+
+
+def default_source_name():
+    """Native camera framework of the current platform"""
+    return "avfoundation" if sys.platform == "darwin" else "v4l2"
+
+
+def get_source(name=None):
+    """Return the capture source backend by name (CAPTURE_SOURCE by default)"""
+    name = (name or CAPTURE_SOURCE).lower()
+    if name == "auto":
+        name = default_source_name()
+    try:
+        return SOURCES[name]()
+    except KeyError:
+        raise ValueError(f"Unknown capture source: {name} (expected one of: auto, {', '.join(SOURCES)})")
+
+
+def select_preferred(devices):
+    """
+    Pick a device, preferring external cameras over built-in ones
+    Выбирает устройство, предпочитая внешние камеры встроенным
+    """
+    external_cameras = []
+    builtin_cameras = []
+
+    for device_idx, device_name in devices:
+        is_builtin = any(pattern in device_name for pattern in BUILTIN_PATTERNS)
+        if is_builtin:
+            builtin_cameras.append((device_idx, device_name))
+        else:
+            external_cameras.append((device_idx, device_name))
+
+    if external_cameras:
+        return external_cameras[0], "external"
+    if builtin_cameras:
+        return builtin_cameras[0], "built-in"
+    return None, None
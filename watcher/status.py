@@ -1,4 +1,6 @@
 #!/usr/bin/env python3
+import datetime
+import json
 import subprocess
 from .locale import _
 
@@ -12,11 +14,53 @@ def check(label):
     except Exception as e:
         print(f"{_('error')}: {e}")
 
+def daemon_stages():
+    """Print the last run of every watcherd stage"""
+    from .watcherd import STATE_FILE
+    try:
+        with open(STATE_FILE) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return
+    stages = state.get("stages") if isinstance(state, dict) else None
+    if not isinstance(stages, dict):
+        return
+    for name, stage in sorted(stages.items()):
+        if not isinstance(stage, dict):
+            continue
+        mark = "✅" if stage.get("ok") else f"❌ {stage.get('error', '')}"
+        try:
+            started = datetime.datetime.fromtimestamp(stage.get("started", 0)).strftime("%Y-%m-%d %H:%M:%S")
+            print(f"   {name}: {started}, {stage.get('seconds', 0):.1f}s, {stage.get('runs', 0)} runs {mark}")
+        except (TypeError, ValueError, OverflowError, OSError):
+            # A stage written by another version; show what can be shown
+            print(f"   {name}: {mark}")
+
+def catalog_summary():
+    """Print today's recordings and uploads from the catalog"""
+    import os
+    from .catalog import CATALOG_FILE, Catalog
+    if not os.path.exists(CATALOG_FILE):
+        return
+    catalog = Catalog()
+    try:
+        midnight = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        for name, entry in sorted(catalog.totals(midnight.timestamp()).items()):
+            print(f"🗂 {name or 'camera'} today: {entry['segments']} segments ({entry['seconds'] / 3600:.1f} h, "
+                  f"{entry['bytes'] / 1048576:.0f} MB, {entry['invalid'] or 0} invalid), {entry['sent']} files sent")
+        segments, size = catalog.backlog()
+        print(f"🗂 Waiting to be merged: {segments} segments, {size / 1048576:.0f} MB")
+    finally:
+        catalog.close()
+
 def main():
     print(_('agents_status'))
     print("=" * 40)
     check("com.watcher.capture")
     check("com.watcher.merge_send")
+    check("com.watcher.daemon")
+    daemon_stages()
+    catalog_summary()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
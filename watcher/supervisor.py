@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Per-camera ffmpeg process supervisor for continuous capture
+Супервизор процессов ffmpeg: по одному на камеру, сбои камер изолированы друг от друга
+"""
+
+import os
+import subprocess
+import threading
+import time
+from .config import (
+    CAMERA_DEVICE, RESTART_BACKOFF_MIN, RESTART_BACKOFF_MAX, SEGMENT_DURATION, RING_BUFFER, RETENTION_INTERVAL,
+    CAPTURE_PROFILE, PIPELINE_COMPRESS,
+    camera_video_dir,
+)
+from .capture_video import logger, build_segment_command, resolve_camera_device, SEGMENT_LIST
+from .logger import notify_telegram
+from .locale import _
+from .progress import ProgressMonitor, limited_command, watch_process
+from .segments import write_sidecar, publish, published_path, remove_stale_recordings
+from . import catalog, devices, metrics, retention
+
+
+def single_camera():
+    """Camera spec for the classic single-camera setup driven by CAMERA_DEVICE"""
+    return {
+        "name": "",
+        "device": CAMERA_DEVICE,
+        "max_restarts": 0,
+        "nice": 0,
+        "max_memory_mb": 0,
+        "threads": 0,
+    }
+
+
+class SegmentList:
+    """Follows the CSV segment list of the segment muxer to learn which segments are closed"""
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+
+    def reset(self):
+        """Forget the previous run; ffmpeg starts a new list"""
+        self.offset = 0
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def poll(self):
+        """Return (filename, start, end) for segments closed since the last call"""
+        try:
+            if os.path.getsize(self.path) <= self.offset:
+                return []
+            with open(self.path, "rb") as f:
+                f.seek(self.offset)
+                data = f.read()
+        except OSError:
+            return []
+
+        # Only consume whole lines, the muxer may be halfway through writing one
+        complete = data[:data.rfind(b"\n") + 1]
+        self.offset += len(complete)
+        entries = []
+        for line in complete.decode().splitlines():
+            try:
+                name, start, end = line.rsplit(",", 2)
+                entries.append((name.strip('"'), float(start), float(end)))
+            except ValueError:
+                continue
+        return entries
+
+
+class CameraRecorder(threading.Thread):
+    """Keeps one ffmpeg segment recorder alive for a single camera"""
+
+    def __init__(self, camera):
+        super().__init__(name=f"camera-{camera['name'] or 'default'}", daemon=True)
+        self.camera = camera
+        self.label = camera["name"] or "camera"
+        self.ring = None
+        self.compressor = None
+        if PIPELINE_COMPRESS and CAPTURE_PROFILE != "delivery":
+            from .pipeline import SegmentCompressor
+            # Spread the compression over the window instead of one burst at merge time
+            self.compressor = SegmentCompressor(camera["name"], logger, camera_video_dir(camera["name"]))
+        if RING_BUFFER:
+            from .ringbuffer import RingBuffer
+            # Record into RAM; only promoted segments reach VIDEO_DIR
+            self.ring = RingBuffer(camera["name"], logger,
+                                   on_promote=self.compressor.add if self.compressor else None)
+            self.output_dir = self.ring.dir
+        else:
+            self.output_dir = camera_video_dir(camera["name"])
+        self.process = None
+        self.restarts = 0
+        self.failed = False
+        self.segment_list = SegmentList(os.path.join(self.output_dir, SEGMENT_LIST))
+        self._counted = {}
+        self._stopping = threading.Event()
+
+    def _resolve_device(self):
+        if self.camera["device"].lower() == "auto":
+            return resolve_camera_device()
+        return self.camera["device"]
+
+    def _segment_closed(self, filename, start, end, monitor):
+        """Record validity and capture stats of a segment the muxer has just closed, then publish it"""
+        partial_path = os.path.join(self.output_dir, filename)
+        stats = monitor.stats
+        counts = {key: stats[key] for key in ("frame", "drop_frames", "dup_frames")}
+        delta = {key: counts[key] - self._counted.get(key, 0) for key in counts}
+        self._counted = counts
+
+        if not os.path.exists(partial_path):
+            logger.error(f"❌ [{self.label}] Video file not created: {filename}")
+            return
+        size = os.path.getsize(partial_path)
+        duration = end - start
+        valid = delta["frame"] > 0 and size > 0
+        # The sidecar is in place before the video appears under its final name
+        path = published_path(partial_path)
+        write_sidecar(path, "capture", {
+            "valid": valid,
+            "frame": delta["frame"],
+            "drop_frames": delta["drop_frames"],
+            "dup_frames": delta["dup_frames"],
+            "fps": stats["fps"],
+            "speed": stats["speed"],
+            # The segment muxer reports no bitrate, derive it from the closed file
+            "bitrate_kbps": round(size * 8 / duration / 1000, 1) if duration > 0 else 0.0,
+            "duration": round(duration, 3),
+            "profile": CAPTURE_PROFILE,
+        })
+        publish(partial_path)
+        if not self.ring:
+            catalog.record_segment(path, self.camera["name"], valid, duration)
+        name = os.path.basename(path)
+        if valid:
+            logger.info(
+                f"✅ [{self.label}] Segment closed: {name} ({delta['frame']} frames, "
+                f"{delta['drop_frames']} dropped, {delta['dup_frames']} duplicated)"
+            )
+        else:
+            logger.warning(f"⚠️ [{self.label}] Video file may be corrupted: {name}")
+
+        if self.ring:
+            # Catalogued if it is promoted; the ring buffer is not kept
+            self.ring.add(path)
+        elif self.compressor and valid:
+            self.compressor.add(path)
+
+    def _check_segments(self, monitor):
+        for filename, start, end in self.segment_list.poll():
+            try:
+                self._segment_closed(filename, start, end, monitor)
+            except Exception as e:
+                logger.warning(f"⚠️ [{self.label}] Could not record segment {filename}: {e}")
+
+    def _record_once(self):
+        """Run ffmpeg until it exits; return (returncode, last stderr lines)"""
+        cmd = limited_command(
+            build_segment_command(self._resolve_device(), self.output_dir, self.camera["threads"]),
+            self.camera["nice"], self.camera["max_memory_mb"]
+        )
+        logger.debug(f"🛠️ [{self.label}] ffmpeg command: {' '.join(cmd)}")
+
+        self.segment_list.reset()
+        self._counted = {}
+        self.process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+        if self._stopping.is_set():
+            self.process.terminate()
+        monitor = ProgressMonitor(self.label, logger)
+        stderr_tail = watch_process(self.process, monitor, on_block=self._check_segments)
+        # The last segment is closed when ffmpeg exits
+        self._check_segments(monitor)
+        return self.process.returncode, stderr_tail
+
+    def run(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        # Nothing else records here, any recording left over belongs to a dead ffmpeg
+        for name in remove_stale_recordings(self.output_dir, max_age=0):
+            logger.warning(f"🧹 [{self.label}] Removed unfinished recording of a killed ffmpeg: {name}")
+        backoff = RESTART_BACKOFF_MIN
+        failures = 0
+        logger.info(f"🎥 [{self.label}] Recording into {self.output_dir}")
+
+        while not self._stopping.is_set():
+            started = time.monotonic()
+            try:
+                returncode, stderr_tail = self._record_once()
+            except Exception as e:
+                logger.exception(f"❌ [{self.label}] Could not run ffmpeg: {e}")
+                returncode, stderr_tail = None, []
+            finally:
+                self.process = None
+
+            if self._stopping.is_set():
+                break
+
+            uptime = time.monotonic() - started
+            logger.error(f"❌ [{self.label}] ffmpeg exited with return code {returncode} after {uptime:.0f}s")
+            if stderr_tail:
+                logger.error(f"[{self.label}] ffmpeg output: " + "\n".join(stderr_tail))
+
+            # A process that recorded several segments was healthy, start the policy over
+            if uptime > 5 * SEGMENT_DURATION:
+                backoff = RESTART_BACKOFF_MIN
+                failures = 0
+
+            failures += 1
+            max_restarts = self.camera["max_restarts"]
+            if max_restarts and failures > max_restarts:
+                self.failed = True
+                logger.error(f"💥 [{self.label}] Giving up after {max_restarts} restarts")
+                notify_telegram(_("camera_disabled", self.label))
+                break
+
+            if self.camera["device"].lower() == "auto":
+                devices.invalidate()
+
+            self.restarts += 1
+            logger.info(f"🔁 [{self.label}] Restarting ffmpeg in {backoff:.0f}s")
+            self._stopping.wait(backoff)
+            backoff = min(backoff * 2, RESTART_BACKOFF_MAX)
+
+        if self.ring:
+            self.ring.close()
+        if self.compressor:
+            self.compressor.close()
+
+    def request_stop(self):
+        """Ask ffmpeg to finish the current segment and exit"""
+        self._stopping.set()
+        process = self.process
+        if process and process.poll() is None:
+            process.terminate()
+
+    def wait_stopped(self, timeout=5):
+        """Wait for ffmpeg to exit after request_stop(), killing it if it does not"""
+        process = self.process
+        if process and process.poll() is None:
+            try:
+                process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                logger.warning(f"⚠️ [{self.label}] ffmpeg didn't respond to SIGTERM, using SIGKILL")
+                process.kill()
+                process.wait()
+        self.join(timeout=timeout)
+
+
+class CaptureSupervisor:
+    """Starts a recorder per camera and shuts all of them down together"""
+
+    def __init__(self, cameras):
+        self.recorders = [CameraRecorder(camera) for camera in cameras]
+
+    def start(self):
+        for recorder in self.recorders:
+            recorder.start()
+
+    def wait(self):
+        """
+        Block until every recorder has stopped, staying responsive to signals
+        and applying storage quotas every RETENTION_INTERVAL seconds
+        """
+        next_retention = time.monotonic()
+        while any(recorder.is_alive() for recorder in self.recorders):
+            if time.monotonic() >= next_retention:
+                try:
+                    retention.enforce(logger)
+                except Exception as e:
+                    logger.warning(f"⚠️ Retention check failed: {e}")
+                # Alerts sent meanwhile leave their Bot API latency behind
+                metrics.flush()
+                next_retention = time.monotonic() + RETENTION_INTERVAL
+            for recorder in self.recorders:
+                recorder.join(timeout=1)
+
+    def stop(self):
+        logger.info("🛑 Stopping all ffmpeg processes gracefully...")
+        # Signal every camera first so all of them close their segments in parallel
+        for recorder in self.recorders:
+            recorder.request_stop()
+        for recorder in self.recorders:
+            recorder.wait_stopped()
+        logger.info("✅ All ffmpeg processes stopped")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Shared Telegram Bot API client
+Общий клиент Telegram Bot API: пул keep-alive соединений, таймауты, настраиваемый
+адрес сервера и замер задержки каждого вызова
+"""
+
+import json
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from .config import (
+    TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, TELEGRAM_API_URL, TELEGRAM_CONNECT_TIMEOUT, TELEGRAM_READ_TIMEOUT,
+    OUTBOX_CONCURRENCY,
+)
+from . import metrics, multipart
+
+
+class TelegramClient:
+    """Bot API calls over one pooled requests.Session"""
+
+    def __init__(self, token=TELEGRAM_BOT_TOKEN, chat_id=TELEGRAM_CHAT_ID, base_url=TELEGRAM_API_URL,
+                 timeout=(TELEGRAM_CONNECT_TIMEOUT, TELEGRAM_READ_TIMEOUT)):
+        self.token = token
+        self.chat_id = chat_id
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        # Enough connections for parallel uploads plus notifications sent meanwhile
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(4, OUTBOX_CONCURRENCY + 2))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def configured(self):
+        return bool(self.token and self.chat_id)
+
+    def call(self, method, data=None, body=None, headers=None, timeout=None):
+        """
+        POST a Bot API method and return the response; requests exceptions
+        propagate. The latency of every call is recorded in the metrics.
+        """
+        url = f"{self.base_url}/bot{self.token}/{method}"
+        started = time.monotonic()
+        try:
+            response = self.session.post(url, data=body if body is not None else data, headers=headers,
+                                         timeout=timeout or self.timeout)
+        except requests.RequestException:
+            metrics.increment(f"telegram_{method}_errors_total")
+            raise
+        metrics.observe(f"telegram_{method}_seconds", round(time.monotonic() - started, 3))
+        metrics.increment(f"telegram_{method}_total" if response.ok else f"telegram_{method}_errors_total")
+        return response
+
+    def send_message(self, text):
+        return self.call("sendMessage", data={"chat_id": self.chat_id, "text": text})
+
+    def send_video(self, path, caption=None, logger=None):
+        """Upload a video with a streamed multipart body; progress goes to logger"""
+        return self.send_file("sendVideo", "video", path, "video/mp4", caption, logger)
+
+    def send_photo(self, path, caption=None, logger=None):
+        return self.send_file("sendPhoto", "photo", path, "image/jpeg", caption, logger)
+
+    def send_animation(self, path, caption=None, logger=None):
+        """Silent clip shown looped like a GIF"""
+        return self.send_file("sendAnimation", "animation", path, "video/mp4", caption, logger)
+
+    def send_media_group(self, paths, caption=None, logger=None):
+        """Photos sent as one album (2 to 10 of them); the caption goes on the first"""
+        media = [{"type": "photo", "media": f"attach://photo{index}"} for index in range(len(paths))]
+        if caption:
+            media[0]["caption"] = caption
+        data = {"chat_id": self.chat_id, "media": json.dumps(media)}
+        files = [(f"photo{index}", path, "image/jpeg") for index, path in enumerate(paths)]
+        total = sum(os.path.getsize(path) for path in paths)
+        label = f"{os.path.basename(paths[0])} +{len(paths) - 1}"
+        progress = multipart.UploadProgress(label, logger, total) if logger else None
+        body = multipart.MultipartStream(data, files, progress)
+        try:
+            response = self.call("sendMediaGroup", body=body, headers={"Content-Type": body.content_type})
+        except requests.RequestException:
+            if progress:
+                progress.finish(False)
+            raise
+        if progress:
+            progress.finish(response.ok)
+        return response
+
+    def send_file(self, method, field, path, content_type, caption=None, logger=None):
+        data = {"chat_id": self.chat_id}
+        if caption:
+            data["caption"] = caption
+        progress = multipart.UploadProgress(os.path.basename(path), logger, os.path.getsize(path)) if logger else None
+        body = multipart.MultipartStream(data, [(field, path, content_type)], progress)
+        try:
+            response = self.call(method, body=body, headers={"Content-Type": body.content_type})
+        except requests.RequestException:
+            if progress:
+                progress.finish(False)
+            raise
+        if progress:
+            progress.finish(response.ok)
+        return response
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide client, created on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = TelegramClient()
+        return _client
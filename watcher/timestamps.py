@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Wall-clock timestamps as metadata instead of burned-in text
+Время записи как метаданные: creation_time и дорожка субтитров mov_text;
+наложение на кадр выполняется только при подготовке отправляемого файла
+"""
+
+import datetime
+import os
+from .config import (
+    RESOLUTION, TIMESTAMP_POSITION, TIMESTAMP_FONT_SIZE, MOTION_STATIC_ACTION, MOTION_TIMELAPSE_FACTOR,
+)
+from .segments import read_sidecar, segment_start
+from . import mediainfo
+
+# ASS alignment (numpad layout) for each TIMESTAMP_POSITION
+ALIGNMENT = {
+    'top-left': 7,
+    'top-right': 9,
+    'bottom-left': 1,
+    'bottom-right': 3,
+}
+
+
+def creation_time(moment=None):
+    """MP4 creation_time value (UTC, ISO 8601) for a local datetime"""
+    moment = moment or datetime.datetime.now()
+    return moment.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000000Z")
+
+
+def probe_duration(path):
+    """Media duration in seconds, preferring the live capture stats over the metadata cache"""
+    stats = read_sidecar(path, "capture")
+    if stats:
+        duration = stats.get("duration") or stats.get("out_time")
+        if duration:
+            return float(duration)
+    return mediainfo.get(path).get("duration", 0.0)
+
+
+def _srt_time(seconds):
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+
+def write_subtitles(input_files, output_path):
+    """
+    Write an SRT track with one cue per second of wall-clock time for the
+    concatenation of input_files. Returns the start of the first segment.
+    """
+    cues = []
+    offset = 0.0
+    first_start = None
+    for path in input_files:
+        start = segment_start(path)
+        duration = probe_duration(path)
+        if start is None or duration <= 0:
+            offset += duration
+            continue
+        first_start = first_start or start
+        # Time-lapsed static segments cover more wall-clock time than they last
+        speed = 1
+        if os.path.basename(path).startswith("static_") and MOTION_STATIC_ACTION == "timelapse":
+            speed = MOTION_TIMELAPSE_FACTOR
+
+        second = 0.0
+        while second < duration:
+            end = min(second + 1, duration)
+            moment = start + datetime.timedelta(seconds=second * speed)
+            cues.append((offset + second, offset + end, moment.strftime("%Y-%m-%d %H:%M:%S")))
+            second += 1
+        offset += duration
+
+    with open(output_path, "w") as f:
+        for number, (begin, end, text) in enumerate(cues, 1):
+            f.write(f"{number}\n{_srt_time(begin)} --> {_srt_time(end)}\n{text}\n\n")
+    return first_start
+
+
+def subtitles_path(video_path):
+    """Subtitle file kept next to a merged video until it has been sent"""
+    return f"{video_path}.timestamps.srt"
+
+
+def burn_filter(video_path):
+    """
+    ffmpeg -vf value that renders the timestamp subtitles of a merged file onto
+    the frames, or None when the file has no timestamp track
+    """
+    srt_path = subtitles_path(video_path)
+    if not os.path.exists(srt_path):
+        return None
+    try:
+        height = int(RESOLUTION.split('x')[1])
+    except (IndexError, ValueError):
+        height = 720
+    # SRT is rendered on a 288 pixel high canvas and scaled to the video
+    font_size = max(1, round(TIMESTAMP_FONT_SIZE * 288 / height))
+    style = (
+        f"Alignment={ALIGNMENT.get(TIMESTAMP_POSITION, 9)},FontSize={font_size},"
+        "PrimaryColour=&H00FFFFFF,BorderStyle=3,BackColour=&H80000000,Outline=1,Shadow=0"
+    )
+    escaped = srt_path.replace("\\", "\\\\").replace(":", "\\:").replace("'", "\\'")
+    return f"subtitles='{escaped}':force_style='{style}'"
@@ -40,14 +40,15 @@ class VideoTrayApp(rumps.App):
     def refresh_status(self, _=None):
         # Автоуведомление при сбое
         result = subprocess.run(["launchctl", "list"], capture_output=True, text=True)
-        if "com.watcher.capture" not in result.stdout:
+        # Capture runs as its own agent or inside watcherd
+        if "com.watcher.capture" not in result.stdout and "com.watcher.daemon" not in result.stdout:
             notify_telegram(_("capture_not_running"))
 
     @rumps.clicked("📊 Status")
     @rumps.clicked("📊 Статус")
     def status(self, _):
         running = []
-        for label in ["com.watcher.capture", "com.watcher.merge_send"]:
+        for label in ["com.watcher.capture", "com.watcher.merge_send", "com.watcher.daemon"]:
             result = subprocess.run(["launchctl", "list"], capture_output=True, text=True)
             running.append(f"{label}: {'✅' if label in result.stdout else '❌'}")
         rumps.alert("\n".join(running))
@@ -61,6 +62,8 @@ class VideoTrayApp(rumps.App):
     @rumps.clicked("▶️ Запустить")
     def start_agents(self, _):
         for plist in os.listdir(os.path.join(PROJECT_DIR, "launchd")):
+            if not plist.endswith(".plist"):
+                continue  # launchd/daemon holds the watcherd agent, installed separately
             path = os.path.join(PROJECT_DIR, "launchd", plist)
             os.system(f"launchctl load -w {path}")
         rumps.notification(_("started"), "", _("agents_activated"))
@@ -69,6 +72,8 @@ class VideoTrayApp(rumps.App):
     @rumps.clicked("⏹ Остановить")
     def stop_agents(self, _):
         for plist in os.listdir(os.path.join(PROJECT_DIR, "launchd")):
+            if not plist.endswith(".plist"):
+                continue
             path = os.path.join(PROJECT_DIR, "launchd", plist)
             os.system(f"launchctl unload {path}")
         rumps.notification(_("stopped"), "", _("agents_stopped"))
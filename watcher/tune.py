@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Encoder auto-tuning benchmark for Watcher
+Подбор пресета, CRF и числа потоков x264, чтобы запись и сжатие успевали в реальном времени
+"""
+
+import argparse
+import itertools
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from .config import FPS, RESOLUTION, CAMERA_DEVICE
+from .encoder import PROFILE_FILE, save_profile
+from .sources import get_source
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium"]
+CRF_VALUES = [23, 28, 30, 33]
+# 0 is the ffmpeg default (one thread per core); fixed counts above the core count say nothing new
+THREAD_COUNTS = [0] + [n for n in (1, 2, 4) if n <= (os.cpu_count() or 1)]
+
+
+def children_cpu_time():
+    """CPU seconds (user + system) consumed by finished child processes"""
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def record_sample(source_name, duration, output_path):
+    """Record a lossless sample so every trial encodes exactly the same frames"""
+    if source_name == "camera":
+        source = get_source()
+        if CAMERA_DEVICE.lower() == "auto":
+            from .devices import get_preferred_device
+            device = get_preferred_device(source)
+        else:
+            device = CAMERA_DEVICE
+        input_args = source.input_args(device)
+    else:
+        input_args = get_source("lavfi").input_args("testsrc2", realtime=False)
+
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error"] + input_args + [
+        "-t", str(duration),
+        "-vcodec", "libx264", "-preset", "ultrafast", "-qp", "0",
+        "-an", "-y", output_path
+    ]
+    subprocess.run(cmd, check=True, capture_output=True, text=True)
+
+
+def run_trial(sample_path, duration, preset, crf, threads, output_path):
+    """Encode the sample once and measure speed, CPU time and output size"""
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", sample_path,
+           "-vcodec", "libx264", "-preset", preset, "-crf", str(crf)]
+    if threads:
+        cmd.extend(["-threads", str(threads)])
+    cmd.extend(["-an", "-y", output_path])
+
+    cpu_before = children_cpu_time()
+    started = time.monotonic()
+    subprocess.run(cmd, check=True, capture_output=True, text=True)
+    wall = time.monotonic() - started
+    cpu = children_cpu_time() - cpu_before
+
+    frames = duration * FPS
+    size = os.path.getsize(output_path)
+    return {
+        "preset": preset,
+        "crf": crf,
+        "threads": threads,
+        "encode_fps": round(frames / wall, 1),
+        "speed": round(duration / wall, 2),  # multiples of real time
+        "cpu_per_second": round(cpu / duration, 3),  # CPU cores busy per second of video
+        "kbps": round(size * 8 / duration / 1000, 1),
+    }
+
+
+def pick_capture(results, cpu_budget):
+    """
+    Capture runs continuously next to everything else: take the smallest output
+    at the highest quality tried whose CPU use fits the budget
+    """
+    best_crf = min(r["crf"] for r in results)
+    candidates = [r for r in results if r["crf"] == best_crf and r["speed"] >= 1]
+    within_budget = [r for r in candidates if r["cpu_per_second"] <= cpu_budget]
+    if within_budget:
+        return min(within_budget, key=lambda r: (r["kbps"], r["cpu_per_second"]))
+    return min(candidates or results, key=lambda r: r["cpu_per_second"])
+
+
+def pick_compress(results, min_speed, target_kbps):
+    """
+    Compression must finish well ahead of the next window: among fast enough
+    settings take the best quality that fits the bitrate target, smallest first
+    """
+    feasible = [r for r in results if r["speed"] >= min_speed]
+    if not feasible:
+        return max(results, key=lambda r: r["speed"])
+    fitting = [r for r in feasible if r["kbps"] <= target_kbps]
+    if fitting:
+        best_crf = min(r["crf"] for r in fitting)
+        return min((r for r in fitting if r["crf"] == best_crf), key=lambda r: (r["kbps"], r["cpu_per_second"]))
+    return min(feasible, key=lambda r: (r["kbps"], r["cpu_per_second"]))
+
+
+def parse_list(value, cast=str):
+    return [cast(item) for item in value.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark x264 settings and write a tuned encoder profile")
+    parser.add_argument("--source", choices=["lavfi", "camera"], default="lavfi",
+                        help="record the sample from the configured camera or a synthetic lavfi pattern")
+    parser.add_argument("--duration", type=int, default=10, help="sample length in seconds")
+    parser.add_argument("--presets", default=",".join(PRESETS))
+    parser.add_argument("--crf", default=",".join(map(str, CRF_VALUES)))
+    parser.add_argument("--threads", default=",".join(map(str, THREAD_COUNTS)),
+                        help="thread counts to try (0 = ffmpeg default)")
+    parser.add_argument("--capture-cpu", type=float, default=0.5,
+                        help="CPU cores the live capture encoder may use")
+    parser.add_argument("--compress-speed", type=float, default=2.0,
+                        help="required compression speed in multiples of real time")
+    parser.add_argument("--target-kbps", type=float, default=600,
+                        help="bitrate target for compressed files")
+    parser.add_argument("--dry-run", action="store_true", help="print results without writing the profile")
+    args = parser.parse_args()
+
+    if not shutil.which("ffmpeg"):
+        print("❌ ffmpeg not found")
+        return 1
+
+    grid = list(itertools.product(
+        parse_list(args.presets), parse_list(args.crf, int), parse_list(args.threads, int)
+    ))
+    work_dir = tempfile.mkdtemp(prefix="watcher-tune-")
+    sample_path = os.path.join(work_dir, "sample.mp4")
+    output_path = os.path.join(work_dir, "trial.mp4")
+
+    try:
+        print(f"🎬 Recording {args.duration}s {RESOLUTION}@{FPS} sample from {args.source}...")
+        record_sample(args.source, args.duration, sample_path)
+
+        print(f"⏱ Running {len(grid)} trials")
+        print(f"{'preset':<10} {'crf':>4} {'thr':>4} {'fps':>8} {'speed':>7} {'cpu/s':>7} {'kbps':>8}")
+        results = []
+        for preset, crf, threads in grid:
+            try:
+                result = run_trial(sample_path, args.duration, preset, crf, threads, output_path)
+            except subprocess.CalledProcessError as e:
+                print(f"⚠️ {preset} crf={crf} threads={threads} failed: {e.stderr.strip()[-200:]}")
+                continue
+            results.append(result)
+            print(f"{preset:<10} {crf:>4} {threads:>4} {result['encode_fps']:>8} "
+                  f"{result['speed']:>7} {result['cpu_per_second']:>7} {result['kbps']:>8}")
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Could not record sample: {e.stderr.strip()[-400:]}")
+        return 1
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if not results:
+        print("❌ No trial succeeded")
+        return 1
+
+    capture = pick_capture(results, args.capture_cpu)
+    compress = pick_compress(results, args.compress_speed, args.target_kbps)
+    profile = {
+        # The CRF the capture settings were benchmarked at, so the profile reproduces them
+        "capture": {"preset": capture["preset"], "crf": capture["crf"], "threads": capture["threads"]},
+        "compress": {"preset": compress["preset"], "crf": compress["crf"], "threads": compress["threads"]},
+        "host": platform.node(),
+        "resolution": RESOLUTION,
+        "fps": FPS,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "results": results,
+    }
+
+    print(f"\n🎥 Capture:  preset={capture['preset']} crf={capture['crf']} threads={capture['threads']} "
+          f"({capture['cpu_per_second']} cores)")
+    print(f"📦 Compress: preset={compress['preset']} crf={compress['crf']} threads={compress['threads']} "
+          f"({compress['speed']}x real time, {compress['kbps']} kbps)")
+
+    if args.dry_run:
+        return 0
+    save_profile(profile)
+    print(f"✅ Profile saved: {PROFILE_FILE}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
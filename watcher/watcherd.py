@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Single long-running supervisor
+Единый демон: запись, оценка движения, объединение, отправка и квоты хранения
+выполняются в одном процессе по внутреннему расписанию, этапы, работающие с
+одними файлами, не пересекаются; SIGHUP перечитывает настройки
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .config import (
+    LOG_DIR, STATE_DIR, CAMERAS, MOTION_ANALYSIS, RETENTION_INTERVAL,
+    WATCHERD_MERGE_INTERVAL, WATCHERD_UPLOAD_INTERVAL, WATCHERD_ANALYSIS_INTERVAL,
+    camera_names, camera_video_dir,
+)
+from .logger import setup_logger
+from . import metrics
+
+# Handlers are attached by main()
+logger = logging.getLogger("watcherd")
+
+# Last run of every stage, read by watcher-status
+STATE_FILE = os.path.join(STATE_DIR, "watcherd.json")
+
+
+class Watcherd:
+    """
+    Recorders run on their own threads as in `watcher-capture --daemon`; every
+    other stage is a periodic task whose blocking work goes to a worker pool.
+    Stages that create or delete files under VIDEO_DIR and MERGED_DIR hold the
+    storage lock, stages that decode video hold the cpu lock, so merge never
+    overlaps with retention or motion analysis.
+    """
+
+    def __init__(self, capture=True):
+        self.capture = capture
+        self.pool = ThreadPoolExecutor(max_workers=3, thread_name_prefix="watcherd")
+        self.supervisor = None
+        self.reload = False
+        self.started = time.time()
+        self.stages = {}  # name -> last run
+        self.capture_down = False
+
+    def _save_state(self):
+        state = {"pid": os.getpid(), "started": self.started, "stages": self.stages}
+        try:
+            os.makedirs(STATE_DIR, exist_ok=True)
+            with open(STATE_FILE + ".tmp", "w") as f:
+                json.dump(state, f)
+            os.replace(STATE_FILE + ".tmp", STATE_FILE)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not save daemon state: {e}")
+
+    async def _sleep(self, seconds):
+        """Wait unless a stop is requested; True if it was"""
+        try:
+            await asyncio.wait_for(self.stopping.wait(), seconds)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def _stage(self, name, func, locks):
+        """Run func in the worker pool while holding locks (always taken in the same order)"""
+        state = self.stages.setdefault(name, {"runs": 0, "failures": 0})
+        for lock in locks:
+            await lock.acquire()
+        try:
+            started = time.monotonic()
+            state["started"] = time.time()
+            try:
+                await asyncio.get_running_loop().run_in_executor(self.pool, func)
+                state.update(ok=True, error=None)
+            except Exception as e:
+                logger.exception(f"❌ Stage {name} failed: {e}")
+                state.update(ok=False, error=str(e))
+                state["failures"] += 1
+            state["runs"] += 1
+            state["seconds"] = round(time.monotonic() - started, 3)
+            metrics.observe(f"watcherd_{name}_seconds", state["seconds"])
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+        self._save_state()
+
+    async def _every(self, name, interval, func, locks, delay=0):
+        if await self._sleep(delay):
+            return
+        while not self.stopping.is_set():
+            await self._stage(name, func, locks)
+            if await self._sleep(interval):
+                return
+
+    def _merge(self):
+        from . import merge_and_send
+        merge_and_send.init()
+        # Retention has its own stage
+        merge_and_send.run(enforce_retention=False)
+
+    def _upload(self):
+        from . import merge_and_send
+        merge_and_send.init()
+        merge_and_send.run(merge=False, enforce_retention=False)
+
+    def _analysis(self):
+        from .motion import analyse_directory
+        for name in camera_names():
+            analyse_directory(camera_video_dir(name))
+
+    def _retention(self):
+        from . import retention
+        retention.enforce(logger)
+        metrics.flush()
+        if self.supervisor and not self.capture_down and not any(r.is_alive() for r in self.supervisor.recorders):
+            self.capture_down = True
+            logger.error("💥 Every camera recorder has stopped, only merge and upload keep running")
+
+    def _start_capture(self):
+        from .capture_video import init
+        from .supervisor import CaptureSupervisor, single_camera
+        init()
+        cameras = CAMERAS or [single_camera()]
+        logger.info(f"🎥 Starting capture: {len(cameras)} camera(s)")
+        self.supervisor = CaptureSupervisor(cameras)
+        self.supervisor.start()
+
+    def request_stop(self, reload=False):
+        if reload:
+            logger.info("🔄 SIGHUP received, restarting with the new configuration")
+            self.reload = True
+        else:
+            logger.info("📡 Termination signal received, stopping")
+        self.stopping.set()
+
+    async def run(self):
+        self.stopping = asyncio.Event()
+        storage, cpu = asyncio.Lock(), asyncio.Lock()
+        loop = asyncio.get_running_loop()
+
+        if self.capture:
+            # Started first: capture init() installs signal handlers that are replaced below
+            self._start_capture()
+        loop.add_signal_handler(signal.SIGTERM, self.request_stop)
+        loop.add_signal_handler(signal.SIGINT, self.request_stop)
+        loop.add_signal_handler(signal.SIGHUP, self.request_stop, True)
+        logger.info(f"🚀 watcherd started (pid {os.getpid()})")
+
+        tasks = [
+            self._every("retention", RETENTION_INTERVAL, self._retention, [storage]),
+            self._every("merge", WATCHERD_MERGE_INTERVAL, self._merge, [storage, cpu], delay=WATCHERD_MERGE_INTERVAL),
+            self._every("upload", WATCHERD_UPLOAD_INTERVAL, self._upload, [storage], delay=WATCHERD_UPLOAD_INTERVAL),
+        ]
+        if MOTION_ANALYSIS:
+            tasks.append(self._every("analysis", WATCHERD_ANALYSIS_INTERVAL, self._analysis, [cpu],
+                                     delay=WATCHERD_ANALYSIS_INTERVAL))
+        # Every task returns after its current stage once a stop is requested
+        await asyncio.gather(*tasks)
+
+        if self.supervisor:
+            await loop.run_in_executor(self.pool, self.supervisor.stop)
+        self.pool.shutdown()
+        metrics.flush()
+        logger.info("🏁 watcherd stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watcher supervisor: capture, merge, upload and retention in one process")
+    parser.add_argument(
+        "--no-capture",
+        action="store_true",
+        help="leave capture to another process and run the other stages only"
+    )
+    args = parser.parse_args()
+    setup_logger("watcherd", os.path.join(LOG_DIR, "watcherd.log"))
+
+    daemon = Watcherd(capture=not args.no_capture)
+    asyncio.run(daemon.run())
+    if daemon.reload:
+        # exec skips atexit, deliver queued alerts first
+        from .alerts import flush
+        flush()
+        os.execv(sys.executable, [sys.executable, "-m", "watcher.watcherd"] + sys.argv[1:])
+
+
+if __name__ == "__main__":
+    main()